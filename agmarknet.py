@@ -0,0 +1,12 @@
+from difflib import get_close_matches
+
+# --- Agmarknet page constants shared by the scraping engines ---
+GRID_ID            = 'cphBody_GridPriceData'
+DATE_FORMAT        = '%d-%b-%Y'
+MODAL_PRICE_COLUMN = 10   # 11th column: Modal Price (Rs./Quintal)
+
+
+def closest_commodity(input_commodity, commodity_options):
+    """Best match for a farmer's crop name among the ddlCommodity option texts."""
+    match = get_close_matches(input_commodity, commodity_options, n=1, cutoff=0.6)
+    return match[0] if match else None
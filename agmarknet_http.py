@@ -0,0 +1,169 @@
+import queue
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from agmarknet import DATE_FORMAT, closest_commodity
+from grid_parser import iter_price_rows
+from scrape_pipeline import Deadline, PhaseTimer, ScrapeCancelled
+
+
+def parse_page(html):
+    """BeautifulSoup tree of a page; bs4 is imported on the first scrape, not when the app starts."""
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, 'html.parser')
+
+
+def form_fields(soup):
+    """Current values of every field the ASP.NET form posts back (hidden state included)."""
+    form = soup.find('form') or soup
+    fields = {}
+    for inp in form.find_all('input'):
+        name = inp.get('name')
+        kind = (inp.get('type') or 'text').lower()
+        if not name or kind in ('submit', 'button', 'image', 'reset', 'file'):
+            continue
+        if kind in ('checkbox', 'radio') and not inp.has_attr('checked'):
+            continue
+        fields[name] = inp.get('value', '')
+    for select in form.find_all('select'):
+        name = select.get('name')
+        if not name:
+            continue
+        chosen = select.find('option', selected=True) or select.find('option')
+        fields[name] = chosen.get('value', chosen.get_text(strip=True)) if chosen else ''
+    return fields
+
+
+def select_options(soup, select_id):
+    """(text, value) pairs of a dropdown, without the --Select-- placeholder."""
+    select = soup.find('select', id=select_id)
+    if select is None:
+        return []
+    options = []
+    for option in select.find_all('option'):
+        text = option.get_text(strip=True)
+        if text and text != "--Select--":
+            options.append((text, option.get('value', text)))
+    return options
+
+
+class AgmarknetHttpClient:
+    """
+    Browserless Agmarknet engine: replays the SearchCmmMkt.aspx postbacks
+    (__VIEWSTATE / __EVENTVALIDATION) over pooled keep-alive `requests` sessions
+    and returns the same grid rows the Selenium engine produces. With a
+    `resolver` (commodity_resolver.CommodityResolver), crop names are matched
+    through its index and every dropdown seen refreshes its option list.
+    """
+
+    def __init__(self, base_url, pool_size=4, timeout=(5, 30), resolver=None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.resolver = resolver
+        self._sessions = queue.LifoQueue(maxsize=pool_size)
+        for _ in range(pool_size):
+            self._sessions.put(None)   # created on first use
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['User-Agent'] = 'Mozilla/5.0 (AgriKart price bot)'
+        return session
+
+    def _timeout(self, deadline):
+        connect, read = self.timeout
+        remaining = deadline.remaining()
+        deadline.check()
+        return (min(connect, remaining), min(read, remaining))
+
+    def _postback(self, session, soup, overrides, deadline, event_target='', stream=False):
+        fields = form_fields(soup)
+        fields['__EVENTTARGET'] = event_target
+        fields['__EVENTARGUMENT'] = ''
+        fields.update(overrides)
+        action = (soup.find('form') or {}).get('action') or self.base_url
+        url = requests.compat.urljoin(self.base_url, action)
+        resp = session.post(url, data=fields, timeout=self._timeout(deadline), stream=stream)
+        resp.raise_for_status()
+        return resp if stream else resp.text
+
+    def fetch_price_rows(self, state, commodity, window_days=2, deadline=None, timer=None):
+        """
+        Grid rows (PriceRow) for the commodity in the state over the last window_days, or None.
+        Every request's timeout is capped by the deadline; cancelling it closes the session.
+        """
+        deadline = deadline or Deadline(sum(self.timeout))
+        timer = timer or PhaseTimer()
+        # Every pooled session may be busy; wait for one only as long as the deadline allows
+        try:
+            session = self._sessions.get(timeout=deadline.remaining())
+        except queue.Empty:
+            raise ScrapeCancelled(f"No Agmarknet session free within the {deadline.seconds}s deadline") from None
+        session = session or self._new_session()
+        deadline.on_cancel(session.close)
+        try:
+            with timer.phase('page_load'):
+                resp = session.get(self.base_url, timeout=self._timeout(deadline))
+                resp.raise_for_status()
+                soup = parse_page(resp.text)
+
+            commodities = dict(select_options(soup, 'ddlCommodity'))
+            if self.resolver is not None:
+                self.resolver.update_options(list(commodities))
+                sanitized_commodity = self.resolver.resolve(commodity)
+            else:
+                sanitized_commodity = closest_commodity(commodity, list(commodities))
+            if not sanitized_commodity:
+                print(f"⚠️ No close match found for commodity: '{commodity}'")
+                return None
+            commodity_value = commodities.get(sanitized_commodity)
+            if commodity_value is None:
+                # The resolver's options can lag behind the page's dropdown
+                print(f"⚠️ Commodity '{sanitized_commodity}' is not in Agmarknet's dropdown")
+                return None
+            print(f"✅ Using commodity: {sanitized_commodity}")
+
+            states = dict(select_options(soup, 'ddlState'))
+            if state not in states:
+                print(f"⚠️ State not offered by Agmarknet: '{state}'")
+                return None
+
+            # Each dropdown is an AutoPostBack field, so replay the postbacks the browser would make
+            with timer.phase('dropdown_populate'):
+                html = self._postback(session, soup, {'ddlCommodity': commodity_value},
+                                      deadline, event_target='ddlCommodity')
+                soup = parse_page(html)
+                html = self._postback(session, soup, {'ddlState': states[state]}, deadline,
+                                      event_target='ddlState')
+                soup = parse_page(html)
+
+            with timer.phase('submit'):
+                from_date = (datetime.now() - timedelta(days=window_days)).strftime(DATE_FORMAT)
+                to_date = datetime.now().strftime(DATE_FORMAT)
+                resp = self._postback(session, soup, {
+                    'txtDate': from_date,
+                    'txtToDate': to_date,
+                    'btnGo': 'Go',
+                }, deadline, stream=True)
+
+            # Rows are parsed while the body streams in; reading stops at the end of the grid
+            with timer.phase('parse'):
+                try:
+                    return list(iter_price_rows(resp.iter_content(chunk_size=16 * 1024, decode_unicode=True)))
+                finally:
+                    resp.close()
+        except requests.exceptions.RequestException as e:
+            deadline.check()   # a request cut short by cancellation is a timeout, not an HTTP error
+            print(f"❌ Agmarknet HTTP error: {e}")
+            deadline.off_cancel(session.close)
+            session.close()
+            session = None
+            return None
+        finally:
+            if session is not None and not deadline.off_cancel(session.close):
+                session = None   # closed by the deadline; the next caller creates a fresh one
+            self._sessions.put(session)
@@ -0,0 +1,144 @@
+"""
+Headless-Chrome engine for Agmarknet (AGMARKNET_ENGINE=selenium). app.py imports
+this module the first time a browser is needed, so workers on the http engine
+never load Selenium.
+"""
+from datetime import datetime, timedelta
+
+from selenium import webdriver
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import Select
+
+from agmarknet import DATE_FORMAT, GRID_ID
+from grid_parser import parse_price_rows
+from scrape_pipeline import ScrapeCancelled, wait_until
+
+# --- Readiness conditions (polled by wait_until instead of fixed sleeps) ---
+SELENIUM_TRANSIENT = (NoSuchElementException, StaleElementReferenceException)
+
+
+def create_chrome_driver():
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    return webdriver.Chrome(options=options)
+
+
+def load_search_page(driver, url):
+    driver.get(url)
+
+    # Close popup if any
+    try:
+        popup = driver.find_element(By.CLASS_NAME, 'popup-onload')
+        close_btn = popup.find_element(By.CLASS_NAME, 'close')
+        close_btn.click()
+    except NoSuchElementException:
+        pass
+
+
+def commodity_option_texts(driver):
+    """The live ddlCommodity texts, read in one round trip instead of one per option."""
+    return driver.execute_script(
+        "return Array.from(document.getElementById('ddlCommodity').options, o => o.text.trim());") or []
+
+
+def selected_option_is(driver, select_id, text):
+    return Select(driver.find_element(By.ID, select_id)).first_selected_option.text.strip() == text
+
+
+def grid_readiness(driver):
+    """Returns a condition that is 'no_data' or 'ready' once the grid row count stops changing."""
+    last_rows = {'count': -1}
+
+    def condition():
+        if driver.find_elements(By.XPATH, "//*[contains(text(), 'No Data Found')]"):
+            return 'no_data'
+        grids = driver.find_elements(By.ID, GRID_ID)
+        if not grids:
+            return None
+        rows = len(grids[0].find_elements(By.TAG_NAME, 'tr'))
+        stable = rows > 1 and rows == last_rows['count']
+        last_rows['count'] = rows
+        return 'ready' if stable else None
+
+    return condition
+
+
+def fetch_price_rows(driver_pool, resolver, state, commodity, window_days, deadline, timer):
+    """Grid rows (PriceRow) for the commodity in the state, or None; `resolver` is the CommodityResolver."""
+    # Pooled drivers are already sitting on SearchCmmMkt.aspx with the popup closed
+    with timer.phase('page_load'):
+        try:
+            driver = driver_pool.acquire(timeout=deadline.remaining())
+        except Exception as e:
+            print(f"❌ Could not get a browser for Agmarknet: {e}")
+            return None
+        # A hung browser call can only be interrupted by killing the browser
+        deadline.on_cancel(driver.quit)
+
+    broken = False
+    try:
+        with timer.phase('page_load'):
+            wait_until(lambda: driver.find_elements(By.ID, 'ddlCommodity'), deadline, 'page_load')
+
+        with timer.phase('dropdown_populate'):
+            # Sanitize commodity
+            sanitized_commodity = resolver.resolve(commodity)
+            try:
+                Select(driver.find_element(By.ID, 'ddlCommodity')).select_by_visible_text(sanitized_commodity or '')
+            except NoSuchElementException:
+                # The persisted option list is out of date; re-read the dropdown and resolve again
+                resolver.update_options(commodity_option_texts(driver))
+                sanitized_commodity = resolver.resolve(commodity)
+                if not sanitized_commodity:
+                    print(f"⚠️ No close match found for commodity: '{commodity}'")
+                    return None
+                Select(driver.find_element(By.ID, 'ddlCommodity')).select_by_visible_text(sanitized_commodity)
+
+            print(f"✅ Using commodity: {sanitized_commodity}")
+
+            # Each dropdown posts back and reloads the page; wait for the reload to settle
+            wait_until(lambda: selected_option_is(driver, 'ddlCommodity', sanitized_commodity),
+                       deadline, 'commodity postback', ignored=SELENIUM_TRANSIENT)
+            Select(driver.find_element(By.ID, 'ddlState')).select_by_visible_text(state)
+            wait_until(lambda: selected_option_is(driver, 'ddlState', state),
+                       deadline, 'state postback', ignored=SELENIUM_TRANSIENT)
+
+        with timer.phase('submit'):
+            # Set Date From and To
+            from_date = (datetime.now() - timedelta(days=window_days)).strftime(DATE_FORMAT)
+            to_date = datetime.now().strftime(DATE_FORMAT)
+
+            driver.find_element(By.ID, "txtDate").clear()
+            driver.find_element(By.ID, "txtDate").send_keys(from_date)
+            driver.find_element(By.ID, "txtToDate").clear()
+            driver.find_element(By.ID, "txtToDate").send_keys(to_date)
+
+            # Submit the form and wait for the grid to finish filling (or report no data)
+            driver.find_element(By.ID, 'btnGo').click()
+            outcome = wait_until(grid_readiness(driver), deadline, 'results grid', ignored=SELENIUM_TRANSIENT)
+
+        if outcome == 'no_data':
+            return []
+
+        with timer.phase('parse'):
+            # Scrape the data
+            return parse_price_rows(driver.page_source)
+
+    except ScrapeCancelled:
+        broken = True
+        raise
+    except WebDriverException as e:
+        print(f"❌ Browser error, recycling driver: {e}")
+        broken = True
+        return None
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return None
+    finally:
+        # Once back in the pool the driver may serve another scrape, so this deadline must not quit it
+        if not deadline.off_cancel(driver.quit):
+            broken = True   # the deadline already quit it
+        driver_pool.release(driver, broken=broken)
@@ -0,0 +1,184 @@
+import re
+import json
+import time
+import threading
+from collections import OrderedDict, defaultdict
+
+from local_state import SqliteConnection
+
+# Words that carry no meaning for matching agronomy questions
+STOPWORDS = {
+    "a", "an", "the", "i", "my", "me", "we", "our", "is", "are", "was", "be", "to", "of", "in", "on",
+    "for", "and", "or", "it", "this", "that", "should", "can", "could", "do", "does", "how", "what",
+    "please", "tell", "sir", "madam", "ji", "about", "with", "at", "from", "which", "will", "would",
+    "क्या", "है", "हैं", "में", "की", "का", "के", "को", "से", "और", "मैं", "मेरे", "मेरी", "मेरा", "कैसे",
+    "कब", "कृपया", "बताइए", "बताओ", "जी", "पर", "तो", "ये", "यह", "हम", "हमें", "करें", "करे", "करना",
+}
+
+
+def normalize_question(text):
+    """Lower-case, strip punctuation (keeping Devanagari), collapse whitespace."""
+    text = re.sub(r"[^\wऀ-ॿ]+", " ", (text or "").lower())
+    return " ".join(text.split())
+
+
+def _stem(word):
+    # "plants"/"plant", "leaves"/"leave": enough to line up ASR variants of one question
+    return word[:-1] if len(word) > 3 and word.endswith("s") and word.isascii() else word
+
+
+def shingles(normalized):
+    """Content words plus adjacent word pairs; the pairs keep "tomato leaf" apart from "potato leaf"."""
+    words = [_stem(w) for w in normalized.split() if w not in STOPWORDS]
+    return frozenset(words) | frozenset(f"{a} {b}" for a, b in zip(words, words[1:]))
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class AnswerCache:
+    """
+    QA answers keyed by (lang, normalized transcription), so a question that has
+    been answered before is answered again without the remote model.
+
+    Lookups try the exact normalized text first. Then the best near-duplicate is
+    taken, found through an inverted index of shingles and scored by Jaccard
+    similarity, as long as it scores at least `threshold`. Entries live in an
+    in-memory LRU backed by SQLite and expire `ttl` seconds after they were stored.
+    Other workers' answers are picked up for exact matches straight from disk, and
+    for near-duplicates after a restart.
+    """
+
+    def __init__(self, path, ttl=30 * 24 * 3600, max_entries=20000, threshold=0.6, candidates=20):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.candidates = candidates
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()      # (lang, key) -> (answer, shingles, stored_at)
+        self._index = defaultdict(set)     # (lang, shingle) -> keys
+        self._conn = SqliteConnection(path, [
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " lang TEXT NOT NULL, key TEXT NOT NULL, answer TEXT NOT NULL, stored_at REAL NOT NULL,"
+            " PRIMARY KEY (lang, key))"])
+        self._counters = {"hits": 0, "near_hits": 0, "misses": 0, "stores": 0, "evicted": 0, "disk_loads": 0}
+        self._warm()
+
+    # --- SQLite layer ---
+    def _warm(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            rows = self._conn().execute(
+                "SELECT lang, key, answer, stored_at FROM answers WHERE stored_at >= ?"
+                " ORDER BY stored_at DESC LIMIT ?", (cutoff, self.max_entries)).fetchall()
+            for lang, key, answer, stored_at in reversed(rows):
+                self._remember((lang, key), json.loads(answer), stored_at)
+
+    # --- in-memory index ---
+    def _remember(self, entry_key, answer, stored_at):
+        if entry_key in self._entries:
+            self._forget(entry_key)
+        grams = shingles(entry_key[1])
+        self._entries[entry_key] = (answer, grams, stored_at)
+        for gram in grams:
+            self._index[(entry_key[0], gram)].add(entry_key[1])
+        if len(self._entries) > self.max_entries:
+            db = self._conn()
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._forget(oldest)
+                db.execute("DELETE FROM answers WHERE lang = ? AND key = ?", oldest)
+                self._counters["evicted"] += 1
+            db.commit()
+
+    def _forget(self, entry_key):
+        _, grams, _ = self._entries.pop(entry_key)
+        for gram in grams:
+            keys = self._index.get((entry_key[0], gram))
+            if keys is not None:
+                keys.discard(entry_key[1])
+                if not keys:
+                    del self._index[(entry_key[0], gram)]
+
+    def _live(self, entry_key, now):
+        entry = self._entries.get(entry_key)
+        if entry is None:
+            return None
+        if now - entry[2] > self.ttl:
+            self._forget(entry_key)
+            self._counters["evicted"] += 1
+            return None
+        return entry
+
+    def _nearest(self, lang, grams, now):
+        votes = defaultdict(int)
+        for gram in grams:
+            for key in self._index.get((lang, gram), ()):
+                votes[key] += 1
+        best, best_score = None, self.threshold
+        for key in sorted(votes, key=votes.get, reverse=True)[:self.candidates]:
+            entry = self._live((lang, key), now)
+            if entry is None:
+                continue
+            score = jaccard(grams, entry[1])
+            if score >= best_score:
+                best, best_score = (lang, key), score
+        return best, best_score
+
+    # --- public API ---
+    def get(self, lang, transcription):
+        """Cached answer for the question (or a near-duplicate of it), or None."""
+        key = normalize_question(transcription)
+        if not key:
+            return None
+        entry_key = (lang, key)
+        now = time.time()
+        with self._lock:
+            entry = self._live(entry_key, now)
+            if entry is None:
+                row = self._conn().execute(
+                    "SELECT answer, stored_at FROM answers WHERE lang = ? AND key = ? AND stored_at >= ?",
+                    (lang, key, now - self.ttl)).fetchone()
+                if row is not None:
+                    self._counters["disk_loads"] += 1
+                    self._remember(entry_key, json.loads(row[0]), row[1])
+                    entry = self._entries[entry_key]
+            if entry is not None:
+                self._entries.move_to_end(entry_key)
+                self._counters["hits"] += 1
+                return entry[0]
+
+            match, _ = self._nearest(lang, shingles(key), now)
+            if match is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(match)
+            self._counters["near_hits"] += 1
+            return self._entries[match][0]
+
+    def put(self, lang, transcription, answer):
+        """Store the service's answer dict (response, audio_url, ...) for the question."""
+        key = normalize_question(transcription)
+        if not key or not shingles(key):
+            return
+        now = time.time()
+        with self._lock:
+            self._remember((lang, key), answer, now)
+            db = self._conn()
+            db.execute("INSERT OR REPLACE INTO answers (lang, key, answer, stored_at) VALUES (?, ?, ?, ?)",
+                       (lang, key, json.dumps(answer, ensure_ascii=False), now))
+            db.commit()
+            self._counters["stores"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["near_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["near_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
@@ -1,37 +1,77 @@
 import os
+import time
+IMPORT_STARTED = time.perf_counter()   # reported as import_seconds in /stats
 import json
 import requests
-import time
-import pandas as pd
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, g, request, jsonify
 from dotenv import load_dotenv
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import Select, WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
-from datetime import datetime, timedelta
-import numpy as np
-import time
-from bs4 import BeautifulSoup
-from selenium.common.exceptions import NoSuchElementException
-from difflib import get_close_matches
 import threading
-import tempfile
-import shutil
+from job_queue import KeyedJobQueue
+from commodity_resolver import CommodityResolver, catalog_aliases, normalize
+from price_stats import batch_statistics, price_statistics
+from agmarknet_http import AgmarknetHttpClient
+from scrape_pipeline import Deadline, PhaseStats, PhaseTimer, ScrapeCancelled
+from driver_pool import DriverPool
+from price_cache import PriceCache
+from prefetch import PrefetchScheduler, catalog_pairs, prefetch_prices
+from http_client import HttpClient
+from session_store import SessionLockTimeout, create_session_store
+from state_machine import Reply, StateMachine, Turn
+from webhook_events import MessageDedup, has_messages, iter_messages
+from media_manager import MediaManager
+from audio_relay import AudioRelay, AudioTooLarge, BadUpload, StreamingUpload
+from qa_pipeline import ACCEPTED as QA_ACCEPTED, USER_BUSY as QA_USER_BUSY, QAPipeline
+from answer_cache import AnswerCache
+from broadcast import Broadcaster, merge_orders, parse_alerts, parse_order_items, parse_orders
+from auth_manager import AuthManager, TokenRejected
+from listing_parser import parse_listing
+from gazetteer import Gazetteer, Match, Place
+from weather import ForecastCache, create_provider, format_forecast, place_title
+from metrics import (REGISTRY, SamplingProfiler, install_json_logs, process_memory, profiling_requested,
+                     request_profiling, stats_samples, timed, trace)
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
 
 # --- Load Environment Variables ---
 load_dotenv()
 app = Flask(__name__)
 
+# --- Instrumentation (see metrics.py; /metrics is per worker process) ---
+LOG_FORMAT           = os.getenv('LOG_FORMAT', 'text')   # "json": one JSON object per line, with trace_id
+PROFILE_TOKEN        = os.getenv('PROFILE_TOKEN')        # set to allow "X-Profile: <token>" on a request
+PROFILE_DIR          = os.getenv('PROFILE_DIR', 'cache/profiles')
+if LOG_FORMAT == 'json':
+    install_json_logs()
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    "agrikart_conversation_handler_seconds", "Time spent in each conversation state handler.", ("handler",))
+TRANSITIONS = REGISTRY.counter(
+    "agrikart_conversation_transitions_total", "Conversation state transitions.", ("from_state", "to_state"))
+SCRAPE_PHASE_SECONDS = REGISTRY.histogram(
+    "agrikart_scrape_phase_seconds", "Agmarknet scrape time per phase.", ("phase", "outcome"))
+
 # --- Load Credentials ---
 ACCESS_TOKEN         = os.getenv('ACCESS_TOKEN')
 VERIFY_TOKEN         = os.getenv('VERIFY_TOKEN')
 PHONE_NUMBER_ID      = os.getenv('WHATSAPP_PHONE_NUMBER_ID')
 API_BASE_URL         = os.getenv('BACKEND_API_BASE_URL')
 
-# --- In‑memory user state store ---
-user_states = {}
+# --- Per-user conversation state (shared by all workers, see session_store.py) ---
+SESSION_STORE        = os.getenv('SESSION_STORE', 'sqlite')
+SESSION_DB_PATH      = os.getenv('SESSION_DB_PATH', 'cache/sessions.sqlite3')
+SESSION_TTL          = int(os.getenv('SESSION_TTL', str(3 * 24 * 3600)))
+REDIS_URL            = os.getenv('REDIS_URL')
+session_store = create_session_store(SESSION_STORE, path=SESSION_DB_PATH, redis_url=REDIS_URL, ttl=SESSION_TTL)
+
+# --- Background webhook processing ---
+WEBHOOK_WORKERS      = int(os.getenv('WEBHOOK_WORKERS', '8'))
+WEBHOOK_QUEUE_MAX    = int(os.getenv('WEBHOOK_QUEUE_MAX', '1000'))
+webhook_queue = KeyedJobQueue(workers=WEBHOOK_WORKERS, max_pending=WEBHOOK_QUEUE_MAX, name="webhook")
+
+# Message ids already accepted, shared by all workers on the host (Meta retries for up to a day)
+WEBHOOK_DEDUP_PATH   = os.getenv('WEBHOOK_DEDUP_PATH', 'cache/webhook_dedup.sqlite3')
+WEBHOOK_DEDUP_TTL    = int(os.getenv('WEBHOOK_DEDUP_TTL', str(24 * 3600)))
+message_dedup = MessageDedup(ttl=WEBHOOK_DEDUP_TTL, path=WEBHOOK_DEDUP_PATH or None)
 
 # --- Audio snippets (URLs) and crop/category data ---
 AUDIO_CLIPS = {
@@ -136,6 +176,21 @@ AGMARKNET_STATES = {
     'Puducherry': 'PY'
 }
 
+def frozen(table):
+    """Read-only copy of a nested dict/list table."""
+    if isinstance(table, dict):
+        return MappingProxyType({key: frozen(value) for key, value in table.items()})
+    if isinstance(table, list):
+        return tuple(frozen(value) for value in table)
+    return table
+
+# These are built once, in the gunicorn master under --preload, and shared by every
+# worker; read-only so that no worker can quietly diverge from the others.
+AUDIO_CLIPS = frozen(AUDIO_CLIPS)
+CROP_CATEGORIES = frozen(CROP_CATEGORIES)
+PRODUCTS_BY_CATEGORY = frozen(PRODUCTS_BY_CATEGORY)
+AGMARKNET_STATES = frozen(AGMARKNET_STATES)
+
 # --- Main Menu Message ---
 MAIN_MENU_MSG = (
     "What would you like to do?\n"
@@ -145,128 +200,224 @@ MAIN_MENU_MSG = (
     "Reply with 1, 2, or 3."
 )
 
-# Helper to run a function in a thread with timeout
-def run_with_timeout(func, args=(), kwargs={}, timeout=35):
-    result = {}
-
-    def target():
-        result['value'] = func(*args, **kwargs)
-
-    thread = threading.Thread(target=target)
-    thread.start()
-    thread.join(timeout)
-
-    if thread.is_alive():
-        print("⏰ Timeout reached while waiting for price prediction.")
+# Helper to run a scrape under a deadline. func must accept a `deadline` keyword; when the
+# timeout fires the deadline is cancelled, which stops func's waits and runs its registered
+# cleanups (e.g. quitting a hung browser), so nothing is left running in the background.
+def run_with_timeout(func, args=(), kwargs=None, timeout=35):
+    deadline = Deadline(timeout)
+    timer = threading.Timer(timeout, deadline.cancel)
+    timer.daemon = True
+    timer.start()
+    try:
+        return func(*args, deadline=deadline, **(kwargs or {}))
+    except ScrapeCancelled as e:
+        print(f"⏰ Timeout reached while waiting for price prediction: {e}")
         return None
-    return result.get('value', None)
+    finally:
+        timer.cancel()
+
+# --- Commodity names ---
+# Farmers' crop names are resolved offline against the persisted ddlCommodity option list;
+# the live dropdown is only read again when the resolved name is missing from it.
+COMMODITY_OPTIONS_PATH = os.getenv('COMMODITY_OPTIONS_PATH', 'cache/commodity_options.json')
+
+commodity_resolver = CommodityResolver(COMMODITY_OPTIONS_PATH, aliases=catalog_aliases(PRODUCTS_BY_CATEGORY))
+
+def sanitize_commodity_name(input_commodity):
+    return commodity_resolver.resolve(input_commodity)
+
+# Catalog products by normalized name; listed even when Agmarknet has no price for them (Paneer, Milk)
+CATALOG_PRODUCTS = {normalize(name): name for products in PRODUCTS_BY_CATEGORY.values() for name in products}
+
+# --- Agmarknet browser pool ---
+AGMARKNET_URL                = os.getenv('AGMARKNET_URL', "https://agmarknet.gov.in/SearchCmmMkt.aspx")
+AGMARKNET_DRIVER_POOL_SIZE   = int(os.getenv('AGMARKNET_DRIVER_POOL_SIZE', '2'))
+AGMARKNET_DRIVER_MAX_USES    = int(os.getenv('AGMARKNET_DRIVER_MAX_USES', '25'))
+AGMARKNET_DRIVER_WAIT        = int(os.getenv('AGMARKNET_DRIVER_WAIT', '60'))
+AGMARKNET_DRIVER_PREWARM     = os.getenv('AGMARKNET_DRIVER_PREWARM', '0') == '1'
+
+def selenium_engine():
+    """agmarknet_selenium, imported on first use: only the selenium engine needs Selenium loaded."""
+    import agmarknet_selenium
+    return agmarknet_selenium
+
+def create_chrome_driver():
+    return selenium_engine().create_chrome_driver()
+
+def load_agmarknet_search_page(driver):
+    selenium_engine().load_search_page(driver, AGMARKNET_URL)
+
+driver_pool = DriverPool(
+    create_chrome_driver, load_agmarknet_search_page,
+    size=AGMARKNET_DRIVER_POOL_SIZE, max_uses=AGMARKNET_DRIVER_MAX_USES,
+    acquire_timeout=AGMARKNET_DRIVER_WAIT, name="chrome driver")
+
+def scrape_price_rows_selenium(state, commodity, window_days, deadline, timer):
+    return selenium_engine().fetch_price_rows(driver_pool, commodity_resolver, state, commodity, window_days,
+                                              deadline, timer)
+
+# --- Scraping engine selection ---
+# "selenium" drives headless Chrome; "http" replays the ASP.NET postbacks with pooled requests sessions.
+AGMARKNET_ENGINE          = os.getenv('AGMARKNET_ENGINE', 'selenium')
+AGMARKNET_HTTP_POOL_SIZE  = int(os.getenv('AGMARKNET_HTTP_POOL_SIZE', '4'))
+AGMARKNET_SCRAPE_TIMEOUT  = int(os.getenv('AGMARKNET_SCRAPE_TIMEOUT', '45'))
+
+agmarknet_http = AgmarknetHttpClient(AGMARKNET_URL, pool_size=AGMARKNET_HTTP_POOL_SIZE,
+                                     resolver=commodity_resolver)
+scrape_phase_stats = PhaseStats()
+
+def _scrape_price_rows(state, commodity, window_days, deadline, timer):
+    if AGMARKNET_ENGINE == 'http':
+        return agmarknet_http.fetch_price_rows(state, commodity, window_days, deadline=deadline, timer=timer)
+    return scrape_price_rows_selenium(state, commodity, window_days, deadline, timer)
+
+def scrape_price_rows(state, commodity, window_days=2, timeout=None):
+    """Per-market grid rows for the commodity in the state, or None on failure/timeout."""
+    timer = PhaseTimer()
+    outcome = 'error'
+
+    def scrape(deadline):
+        nonlocal outcome
+        try:
+            return _scrape_price_rows(state, commodity, window_days, deadline, timer)
+        except ScrapeCancelled:
+            outcome = 'timeout'
+            raise
 
-def sanitize_commodity_name(driver, input_commodity):
     try:
-        dropdown = Select(driver.find_element(By.ID, 'ddlCommodity'))
-        commodity_options = [option.text.strip() for option in dropdown.options if option.text.strip() and option.text != "--Select--"]
-        match = get_close_matches(input_commodity, commodity_options, n=1, cutoff=0.6)
-        return match[0] if match else None
-    except Exception as e:
-        print(f"❌ Error sanitizing commodity name: {e}")
+        rows = run_with_timeout(scrape, timeout=timeout or AGMARKNET_SCRAPE_TIMEOUT)
+        if rows is not None:
+            outcome = 'ok' if rows else 'no_data'
+        return rows
+    finally:
+        scrape_phase_stats.record(timer, outcome)
+        for phase, seconds in timer.timings.items():
+            SCRAPE_PHASE_SECONDS.observe(seconds, phase=phase, outcome=outcome)
+        print(f"⏱️ Scrape {commodity}/{state} ({outcome}): {timer.summary()}")
+
+@timed("scrape.agmarknet")
+def scrape_agmarknet_prices(state, commodity, window_days=2, timeout=None):
+    """Price statistics (see price_stats.batch_statistics) for one scrape, or None."""
+    stats = price_statistics(scrape_price_rows(state, commodity, window_days, timeout) or [], window_days)
+    if not stats:
+        print("⚠️ No prices found.")
         return None
+    print(f"✅ Predicted price: ₹{stats['median']} per quintal from {stats['count']} quotes in {stats['markets']} markets")
+    return stats
+
+# --- Mandi price cache ---
+PRICE_CACHE_PATH       = os.getenv('PRICE_CACHE_PATH', 'cache/prices.sqlite3')
+PRICE_CACHE_TTL        = int(os.getenv('PRICE_CACHE_TTL', str(6 * 3600)))
+PRICE_CACHE_STALE_TTL  = int(os.getenv('PRICE_CACHE_STALE_TTL', str(18 * 3600)))
+PRICE_WINDOW_DAYS      = int(os.getenv('PRICE_WINDOW_DAYS', '2'))
+
+price_cache = PriceCache(PRICE_CACHE_PATH, ttl=PRICE_CACHE_TTL, stale_ttl=PRICE_CACHE_STALE_TTL, table='price_stats',
+                         resolve=sanitize_commodity_name)
+
+@timed("price.lookup")
+def get_price_statistics(state, commodity, window_days=PRICE_WINDOW_DAYS):
+    """Cached front for scrape_agmarknet_prices; concurrent lookups for one crop share a scrape."""
+    resolved = sanitize_commodity_name(commodity)
+    if resolved is None:
+        print(f"⚠️ '{commodity}' is not an Agmarknet commodity, skipping the price lookup")
+        return None
+    return price_cache.get(state, resolved, window_days,
+                           lambda: scrape_agmarknet_prices(state, resolved, window_days))
 
-def scrape_agmarknet_prices(state, commodity):
-    options = webdriver.ChromeOptions()
-    options.add_argument('--headless')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-
-    driver = webdriver.Chrome(options=options)
-    try:
-        driver.get("https://agmarknet.gov.in/SearchCmmMkt.aspx")
+PRICE_LOOKUP_WORKERS   = int(os.getenv('PRICE_LOOKUP_WORKERS', '4'))
 
-        # Close popup if any
+def lookup_prices(pairs):
+    """{(state, commodity): price statistics or None}, looking up a few pairs at a time."""
+    def lookup(pair):
         try:
-            popup = driver.find_element(By.CLASS_NAME, 'popup-onload')
-            close_btn = popup.find_element(By.CLASS_NAME, 'close')
-            close_btn.click()
-        except NoSuchElementException:
-            pass
-
-        # Sanitize commodity
-        sanitized_commodity = sanitize_commodity_name(driver, commodity)
-        if not sanitized_commodity:
-            print(f"⚠️ No close match found for commodity: '{commodity}'")
-            return None
-
-        print(f"✅ Using commodity: {sanitized_commodity}")
-
-        # Select inputs
-        Select(driver.find_element(By.ID, 'ddlCommodity')).select_by_visible_text(sanitized_commodity)
-        Select(driver.find_element(By.ID, 'ddlState')).select_by_visible_text(state)
-
-        # Wait for markets to load
-
-        # Set Date From and To
-        from_date = (datetime.now() - timedelta(days=2)).strftime('%d-%b-%Y')
-        to_date = datetime.now().strftime('%d-%b-%Y')
-
-        driver.find_element(By.ID, "txtDate").clear()
-        driver.find_element(By.ID, "txtDate").send_keys(from_date)
-        driver.find_element(By.ID, "txtToDate").clear()
-        driver.find_element(By.ID, "txtToDate").send_keys(to_date)
-
-        # Submit the form
-        driver.find_element(By.ID, 'btnGo').click()
-
-        # Wait for table to load
-        WebDriverWait(driver, 35).until(EC.presence_of_element_located((By.ID, 'cphBody_GridPriceData')))
-        time.sleep(5)  # Sometimes needs extra wait
-        driver.execute_script("arguments[0].scrollIntoView();", driver.find_element(By.ID, 'cphBody_GridPriceData'))
-
-        # Scrape the data
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        rows = soup.find_all("tr")
-        prices = []
-
-        for row in rows[4:]:  # Skip header rows
-            cols = [td.get_text(strip=True) for td in row.find_all("td")]
-            if len(cols) >= 11:
-                try:
-                    modal_price = int(cols[10])  # 11th column: Modal Price (Rs./Quintal)
-                    prices.append(modal_price)
-                except:
-                    continue
-
-        if not prices:
-            print("⚠️ No prices found.")
-            return None
-
-        print(f"📊 {len(prices)} prices found. Sample: {prices[:5]}")
-
-        # Filter and return median
-        q1 = np.percentile(prices, 25)
-        q3 = np.percentile(prices, 75)
-        iqr = q3 - q1
-        filtered = [p for p in prices if q1 - 1.5 * iqr <= p <= q3 + 1.5 * iqr]
-        predicted = int(np.median(filtered)) if filtered else int(np.median(prices))
-        print(f"✅ Predicted price: ₹{predicted} per quintal")
-        return predicted
-
-    except Exception as e:
-        print(f"❌ Error: {e}")
-        return None
-    finally:
-        driver.quit()
+            return pair, get_price_statistics(*pair)
+        except Exception as e:
+            print(f"❌ Price lookup failed for {pair[1]}/{pair[0]}: {e}")
+            return pair, None
+
+    pairs = sorted(pairs)
+    if len(pairs) == 1:
+        return dict([lookup(pairs[0])])
+    with ThreadPoolExecutor(max_workers=PRICE_LOOKUP_WORKERS, thread_name_prefix="price-lookup") as pool:
+        return dict(pool.map(lookup, pairs))
+
+# --- Off-peak price prefetch (state x catalog commodity) ---
+PREFETCH_HOUR          = os.getenv('PREFETCH_HOUR')  # e.g. "2" for 02:00 local time; unset disables
+PREFETCH_WORKERS       = int(os.getenv('PREFETCH_WORKERS', '2'))
+PREFETCH_RATE_PER_MIN  = float(os.getenv('PREFETCH_RATE_PER_MIN', '20'))
+PREFETCH_LOCK_PATH     = os.getenv('PREFETCH_LOCK_PATH', 'cache/prefetch.lock')
+
+def run_price_prefetch():
+    pairs = catalog_pairs(list(AGMARKNET_STATES), PRODUCTS_BY_CATEGORY, resolve=sanitize_commodity_name)
+    return prefetch_prices(pairs, scrape_price_rows, price_cache, PRICE_WINDOW_DAYS,
+                           workers=PREFETCH_WORKERS, per_minute=PREFETCH_RATE_PER_MIN,
+                           skip_younger_than=PRICE_CACHE_TTL,
+                           summarize_batch=lambda rows_by_pair: batch_statistics(rows_by_pair, PRICE_WINDOW_DAYS))
+
+# Started per worker by start_worker()
+prefetch_scheduler = None
+if PREFETCH_HOUR:
+    prefetch_scheduler = PrefetchScheduler(run_price_prefetch, int(PREFETCH_HOUR), PREFETCH_LOCK_PATH)
+
+# --- Outbound HTTP clients (pooled, retrying, timed per endpoint) ---
+GRAPH_API_URL        = os.getenv('GRAPH_API_URL', "https://graph.facebook.com/v19.0")
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))
+HTTP_READ_TIMEOUT    = float(os.getenv('HTTP_READ_TIMEOUT', '15'))
+HTTP_RETRIES         = int(os.getenv('HTTP_RETRIES', '3'))
+
+graph_client = HttpClient('graph', GRAPH_API_URL, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+                          retries=HTTP_RETRIES)
+backend_client = HttpClient('backend', API_BASE_URL, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+                            retries=HTTP_RETRIES)
+
+# --- WhatsApp media (audio prompts uploaded once, sent by id) ---
+AUDIO_DIR             = os.getenv('AUDIO_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Audio_files'))
+MEDIA_CACHE_PATH      = os.getenv('MEDIA_CACHE_PATH', 'cache/media_ids.json')
+MEDIA_REFRESH_HOURS   = float(os.getenv('MEDIA_REFRESH_HOURS', '6'))
+MEDIA_PRELOAD         = os.getenv('MEDIA_PRELOAD', '1') == '1'   # upload and refresh clips from start_worker()
+
+media_manager = MediaManager(graph_client, PHONE_NUMBER_ID, ACCESS_TOKEN, AUDIO_DIR, MEDIA_CACHE_PATH)
+
+# --- QA service (voice doubts), fed by a streaming relay ---
+QA_CHAT_URL          = os.getenv('QA_CHAT_URL', "https://agrivoice-2-ws-2a-8000.ml.iit-ropar.truefoundry.cloud/chat")
+QA_READ_TIMEOUT      = float(os.getenv('QA_READ_TIMEOUT', '60'))
+AUDIO_MAX_BYTES      = int(os.getenv('AUDIO_MAX_BYTES', str(16 * 1024 * 1024)))
+
+# No retries: a streamed upload body can only be sent once
+qa_client = HttpClient('qa', timeout=(HTTP_CONNECT_TIMEOUT, QA_READ_TIMEOUT), retries=0)
+audio_relay = AudioRelay(qa_client, QA_CHAT_URL, max_bytes=AUDIO_MAX_BYTES,
+                         timeout=(HTTP_CONNECT_TIMEOUT, QA_READ_TIMEOUT))
+
+# --- Answer cache (repeat questions answered without the QA model) ---
+# With QA_TRANSCRIBE_URL set (an ASR-only endpoint taking the same form as /chat),
+# voice doubts are transcribed first and a cached answer skips the LLM + TTS step.
+QA_TRANSCRIBE_URL      = os.getenv('QA_TRANSCRIBE_URL')
+ANSWER_CACHE_PATH      = os.getenv('ANSWER_CACHE_PATH', 'cache/answers.sqlite3')
+ANSWER_CACHE_TTL       = int(os.getenv('ANSWER_CACHE_TTL', str(30 * 24 * 3600)))
+ANSWER_CACHE_MAX       = int(os.getenv('ANSWER_CACHE_MAX', '20000'))
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.6'))
+
+answer_cache = AnswerCache(ANSWER_CACHE_PATH, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX,
+                           threshold=ANSWER_CACHE_SIMILARITY)
+
+def remember_answer(lang, out):
+    """Keep a QA service answer for the question it was given."""
+    if out.get('transcription') and out.get('response'):
+        answer_cache.put(lang, out['transcription'], {'response': out['response'],
+                                                       'audio_url': out.get('audio_url')})
+
+# --- Backend auth (cached existence checks and tokens per farmer) ---
+AUTH_DB_PATH           = os.getenv('AUTH_DB_PATH', 'cache/auth.sqlite3')
+AUTH_EXISTS_TTL        = int(os.getenv('AUTH_EXISTS_TTL', str(24 * 3600)))
+AUTH_REFRESH_MARGIN    = int(os.getenv('AUTH_REFRESH_MARGIN', '60'))
+
+auth_manager = AuthManager(backend_client, AUTH_DB_PATH, exists_ttl=AUTH_EXISTS_TTL,
+                           refresh_margin=AUTH_REFRESH_MARGIN)
 
 # --- Backend API helpers ---
-def check_farmer_exists(phone_number):
-    url = f"{API_BASE_URL}/api/v1/farmer/check/{phone_number}/"
-    try:
-        response = requests.get(url)
-        return response.status_code == 200 and response.json().get("exists", False)
-    except requests.exceptions.RequestException as e:
-        print(f"ERROR checking farmer existence: {e}")
-        return False
-
+@timed("backend.register")
 def register_farmer_api(user_data):
-    url = f"{API_BASE_URL}/api/v1/auth/signup/farmer/"
+    url = "/api/v1/auth/signup/farmer/"
     payload = {
         "username": user_data['username'],
         "password": user_data['password'],
@@ -276,26 +427,16 @@ def register_farmer_api(user_data):
         "address": user_data['address']
     }
     try:
-        res = requests.post(url, json=payload)
+        res = backend_client.post(url, json=payload, endpoint="farmer_signup")
         res.raise_for_status()
         return res.json()
     except Exception as e:
         print(f"Error in register_farmer_api: {e}")
         return None
 
-def login_farmer_api(username, password):
-    url = f"{API_BASE_URL}/api/v1/auth/token/"
-    payload = {"username": username, "password": password}
-    try:
-        res = requests.post(url, json=payload)
-        res.raise_for_status()
-        return res.json()
-    except Exception as e:
-        print(f"Error in login_farmer_api: {e}")
-        return None
-    
+@timed("backend.add_produce")
 def add_produce_api(produce_data, access_token):
-    url = f"{API_BASE_URL}/api/v1/produce/"
+    url = "/api/v1/produce/"
     headers = {
         "Authorization": f"Bearer {access_token}",
         "Content-Type": "application/json"
@@ -307,25 +448,90 @@ def add_produce_api(produce_data, access_token):
         "category": "Others"
     }
     try:
-        res = requests.post(url, headers=headers, json=payload)
+        res = backend_client.post(url, headers=headers, json=payload, endpoint="produce_create")
+        if res.status_code == 401:
+            raise TokenRejected(res.text[:200])
         res.raise_for_status()
         return res.json()
+    except TokenRejected:
+        raise
     except Exception as e:
         print(f"Error in add_produce_api: {e}")
         return None
 
+def save_produce(phone, produce_data):
+    """add_produce_api with the farmer's cached token; a token the backend rejects is refreshed once."""
+    for _ in range(2):
+        token = auth_manager.access_token(phone)
+        if not token:
+            return None
+        try:
+            return add_produce_api(produce_data, token)
+        except TokenRejected:
+            auth_manager.reject(phone)
+    return None
+
+LISTING_SUBMIT_WORKERS = int(os.getenv('LISTING_SUBMIT_WORKERS', '4'))
+
+def save_produce_batch(phone, items):
+    """Save several produce listings at once (the backend takes one per call); returns a result per item."""
+    if len(items) == 1:
+        return [save_produce(phone, items[0])]
+    with ThreadPoolExecutor(max_workers=LISTING_SUBMIT_WORKERS, thread_name_prefix="produce-save") as pool:
+        return list(pool.map(lambda item: save_produce(phone, item), items))
+
 # --- WhatsApp senders ---
-def send_whatsapp_message(to, msg):
-    url = f"https://graph.facebook.com/v19.0/{PHONE_NUMBER_ID}/messages"
+@timed("graph.send")
+def _post_graph_message(to, payload):
+    """POST to the Graph messages endpoint; returns the response, or None if none came back."""
+    url = f"/{PHONE_NUMBER_ID}/messages"
     headers = {"Authorization": f"Bearer {ACCESS_TOKEN}", "Content-Type": "application/json"}
+    try:
+        resp = graph_client.post(url, headers=headers, json=payload, endpoint="messages")
+    except requests.exceptions.RequestException as e:
+        print(f"❌ WhatsApp send to {to} failed: {e}")
+        return None
+    if not resp.ok:
+        print(f"❌ WhatsApp send to {to} rejected ({resp.status_code}): {resp.text[:300]}")
+    return resp
+
+def _send_graph_message(to, payload):
+    """POST to the Graph messages endpoint; returns True if Graph accepted the message."""
+    resp = _post_graph_message(to, payload)
+    return resp is not None and resp.ok
+
+# Graph's errors for a media id it no longer has (expired after 30 days, or deleted): the media
+# error itself, or an invalid-parameter error whose details name the media. Throttling, 5xx and
+# recipient errors are not fixed by re-uploading, so they are reported as they are.
+GRAPH_MEDIA_ERROR = 131053
+GRAPH_INVALID_PARAMETER = {100, 131009}
+
+def _media_id_rejected(resp):
+    try:
+        error = resp.json().get('error') or {}
+    except (ValueError, AttributeError):
+        return False
+    code = error.get('code')
+    if code == GRAPH_MEDIA_ERROR:
+        return True
+    details = str((error.get('error_data') or {}).get('details') or '')
+    return code in GRAPH_INVALID_PARAMETER and 'media' in details.lower()
+
+def send_whatsapp_message(to, msg):
     payload = {"messaging_product": "whatsapp", "to": to, "type": "text", "text": {"body": msg}}
-    requests.post(url, headers=headers, json=payload)
+    return _send_graph_message(to, payload)
 
 def send_whatsapp_audio(to, url_link):
-    url = f"https://graph.facebook.com/v19.0/{PHONE_NUMBER_ID}/messages"
-    headers = {"Authorization": f"Bearer {ACCESS_TOKEN}", "Content-Type": "application/json"}
+    # Bundled prompts go out by media id; anything else (e.g. QA answers) by link
+    media_id = media_manager.media_id(url_link)
+    if media_id:
+        payload = {"messaging_product": "whatsapp", "to": to, "type": "audio", "audio": {"id": media_id}}
+        resp = _post_graph_message(to, payload)
+        if resp is None or resp.ok or not _media_id_rejected(resp):
+            return resp is not None and resp.ok
+        media_manager.invalidate(url_link)   # expired or deleted on Graph's side; re-uploaded next time
     payload = {"messaging_product": "whatsapp", "to": to, "type": "audio", "audio": {"link": url_link}}
-    requests.post(url, headers=headers, json=payload)
+    return _send_graph_message(to, payload)
 
 # --- Webhook Handler ---
 @app.route('/webhook', methods=['GET', 'POST'])
@@ -335,239 +541,604 @@ def webhook():
             return request.args.get('hub.challenge'), 200
         return 'Unauthorized', 403
 
-    data = request.get_json()
+    raw = request.get_data()
+    if not has_messages(raw):
+        return 'OK', 200   # status updates (sent/delivered/read) need no work
+
+    busy = False
     try:
-        entry = data.get("entry", [])[0]
-        change = entry.get("changes", [])[0]
-        value = change.get("value", {})
-        messages = value.get("messages")
-
-        if not messages:
-            print("⚠️ Ignored non-message webhook event")
-            return 'OK', 200
-
-        message = messages[0]
-        from_number = message['from']
-        msg_body = message['text']['body'] if 'text' in message else ''
-        command = msg_body.strip().lower()
-        msg_audio_url = message['audio']['url'] if 'audio' in message else None
-
-        print(f"📩 Message from {from_number}: '{command}'")
-
-        # Initialize state if new user
-        if from_number not in user_states:
-            user_states[from_number] = {"data": {}}
-
-        current_state = user_states[from_number].get("state")
-        print(f"🔁 Current state for {from_number}: {current_state}")
-
-        # Greeting to start flow
-        if command in ['hi', 'hello', 'नमस्ते']:
-            print(f"📞 Greeting received from {from_number}. Checking existence...")
-            if check_farmer_exists(from_number):
-                user_states[from_number]['state'] = 'awaiting_lang_after_exists'
-                send_whatsapp_audio(from_number, AUDIO_CLIPS['welcome'])  # Ask language
-            else:
-                user_states[from_number]['state'] = 'awaiting_language_choice'
-                send_whatsapp_audio(from_number, AUDIO_CLIPS['welcome'])
-            return 'OK', 200
-
-        # --- State Machine ---
-        if current_state == 'awaiting_lang_after_exists':
-            lang = 'en' if '1' in command else 'hi'
-            user_states[from_number]['language'] = lang
-            last_password = user_states[from_number]['data'].get('password')
-            if last_password:
-                login_resp = login_farmer_api(from_number, last_password)
-                if login_resp and login_resp.get('access'):
-                    user_states[from_number]['access_token'] = login_resp['access']
-                    user_states[from_number]['state'] = 'awaiting_main_menu'
-                    send_whatsapp_audio(from_number, AUDIO_CLIPS[lang]['welcome_back'])
-                    send_whatsapp_message(from_number, MAIN_MENU_MSG)
-                else:
-                    send_whatsapp_audio(from_number, AUDIO_CLIPS[lang]['ask_password'])
-                    user_states[from_number]['state'] = 'awaiting_password'
-            else:
-                send_whatsapp_audio(from_number, AUDIO_CLIPS[lang]['ask_loginpassword'])
-                user_states[from_number]['state'] = 'awaiting_password'
-
-        elif current_state == 'awaiting_language_choice':
-            lang = 'en' if '1' in command else 'hi'
-            user_states[from_number]['language'] = lang
-            user_states[from_number]['state'] = 'awaiting_name'
-            send_whatsapp_audio(from_number, AUDIO_CLIPS[lang]['ask_name'])
-
-        elif current_state == 'awaiting_name':
-            lang = user_states[from_number]['language']
-            user_states[from_number]['data']['name'] = msg_body
-            user_states[from_number]['state'] = 'awaiting_address'
-            send_whatsapp_audio(from_number, AUDIO_CLIPS[lang]['ask_address'])
-
-        elif current_state == 'awaiting_address':
-            lang = user_states[from_number]['language']
-            user_states[from_number]['data']['address'] = msg_body
-            user_states[from_number]['state'] = 'awaiting_password'
-            send_whatsapp_audio(from_number, AUDIO_CLIPS[lang]['ask_password'])
-
-        elif current_state == 'awaiting_password':
-            lang = user_states[from_number]['language']
-            user_states[from_number]['data']['password'] = msg_body
-            user_states[from_number]['data']['username'] = from_number
-            user_states[from_number]['data']['phone_number'] = from_number
-
-            if check_farmer_exists(from_number):
-                login_resp = login_farmer_api(from_number, msg_body)
-                if login_resp and login_resp.get('access'):
-                    user_states[from_number]['access_token'] = login_resp['access']
-                    user_states[from_number]['state'] = 'awaiting_main_menu'
-                    send_whatsapp_audio(from_number, AUDIO_CLIPS[lang]['welcome_back'])
-                    send_whatsapp_message(from_number, MAIN_MENU_MSG)
-                else:
-                    send_whatsapp_message(from_number, "❌ Wrong password. Please try again.")
-            else:
-                if register_farmer_api(user_states[from_number]['data']):
-                    login_resp = login_farmer_api(from_number, msg_body)
-                    if login_resp and login_resp.get('access'):
-                        user_states[from_number]['access_token'] = login_resp['access']
-                        user_states[from_number]['state'] = 'awaiting_main_menu'
-                        send_whatsapp_audio(from_number, AUDIO_CLIPS[lang]['reg_complete'])
-                        send_whatsapp_message(from_number, MAIN_MENU_MSG)
-                    else:
-                        send_whatsapp_message(from_number, "❌ Registration failed. Try again with 'hi'.")
-
-        elif current_state == 'awaiting_main_menu':
-            if command in ['1', 'order', 'place order']:
-                user_states[from_number]['state'] = 'awaiting_crop_name'
-                lang = user_states[from_number]['language']
-                send_whatsapp_message(from_number, "What crop would you like to sell? (Type the name)")
-            elif command in ['2', 'ask', 'doubt', 'question']:
-                user_states[from_number]['state'] = 'awaiting_audio_doubt'
-                lang = user_states[from_number]['language']
-                send_whatsapp_message(from_number, "🎤 Please send your question as an audio message.")
-            elif command in ['3', 'weather']:
-                user_states[from_number]['state'] = 'awaiting_weather_location'
-                send_whatsapp_message(from_number, "Please type your location (city/town/village) for weather updates.")
-            else:
-                send_whatsapp_message(from_number, "Please reply with 1, 2, or 3.\n" + MAIN_MENU_MSG)
-
-        elif current_state == 'awaiting_crop_name':
-            lang = user_states[from_number]['language']
-            crop_name = msg_body.strip()
-            user_states[from_number]['temp_produce'] = {'name': crop_name}
-            send_whatsapp_message(from_number, f"🔍 Checking market prices for {crop_name}. Please wait...")
-
-            try:
-                # This may take 30+ seconds due to agmarknet load times
-                predicted_price = scrape_agmarknet_prices("Kerala", crop_name)
-
-                if predicted_price:
-                    msg = f"📈 Based on recent market data, the expected price for {crop_name} is ₹{predicted_price} per quintal."
-                    send_whatsapp_message(from_number, msg)
-                    user_states[from_number]['temp_produce']['predicted_price'] = predicted_price
-                else:
-                    send_whatsapp_message(from_number, "⚠️ Couldn't predict the price right now. Please enter it manually.")
-                    send_whatsapp_audio(from_number, AUDIO_CLIPS[lang]['ask_price'])
-
-            except Exception as e:
-                print(f"❌ Error during price prediction: {e}")
-                send_whatsapp_message(from_number, "⚠️ Error predicting price. Please enter it manually.")
-                send_whatsapp_audio(from_number, AUDIO_CLIPS[lang]['ask_price'])
-
-            user_states[from_number]['state'] = 'awaiting_price'
-
-        elif current_state == 'awaiting_price':
-            lang = user_states[from_number]['language']
-            user_states[from_number]['temp_produce']['price_per_kg'] = msg_body
-            user_states[from_number]['state'] = 'awaiting_quantity'
-            send_whatsapp_audio(from_number, AUDIO_CLIPS[lang]['ask_quantity'])
-
-        elif current_state == 'awaiting_quantity':
-            lang = user_states[from_number]['language']
-            user_states[from_number]['temp_produce']['quantity_kg'] = msg_body
-            token = user_states[from_number].get('access_token')
-            if token and add_produce_api(user_states[from_number]['temp_produce'], token):
-                send_whatsapp_audio(from_number, AUDIO_CLIPS[lang]['ask_more_crops'])
-            else:
-                send_whatsapp_message(from_number, "❌ Failed to save produce.")
-            user_states[from_number]['state'] = 'awaiting_more_crops'
-
-        elif current_state == 'awaiting_more_crops':
-            lang = user_states[from_number]['language']
-            if command in ['yes', 'y', 'ok', 'हाँ', 'हां']:
-                send_whatsapp_audio(from_number, AUDIO_CLIPS[lang]['next_crop'])
-                user_states[from_number]['state'] = 'awaiting_crop_name'
-            else:
-                send_whatsapp_audio(from_number, AUDIO_CLIPS[lang]['thank_you'])
-                user_states[from_number]['state'] = 'conversation_over'
-                send_whatsapp_message(from_number, MAIN_MENU_MSG)
-                user_states[from_number]['state'] = 'awaiting_main_menu'
-
-        elif current_state == 'conversation_over':
-            lang = user_states[from_number]['language']
-            send_whatsapp_audio(from_number, AUDIO_CLIPS[lang]['closing'])
-            send_whatsapp_message(from_number, MAIN_MENU_MSG)
-            user_states[from_number]['state'] = 'awaiting_main_menu'
-
-        # --- AUDIO DOUBT HANDLER ---
-        elif current_state == 'awaiting_audio_doubt':
-            lang = user_states[from_number].get('language', 'en')
-            if msg_audio_url:
-                # Download WhatsApp audio (needs auth)
-                audio_headers = {"Authorization": f"Bearer {ACCESS_TOKEN}"}
-                audio_resp = requests.get(msg_audio_url, headers=audio_headers)
-                if audio_resp.status_code == 200:
-                    with tempfile.NamedTemporaryFile(suffix=".ogg", delete=False) as temp_audio:
-                        temp_audio.write(audio_resp.content)
-                        temp_audio_path = temp_audio.name
-                    # Forward to /chat/ endpoint
-                    with open(temp_audio_path, "rb") as f:
-                        files = {"file": (os.path.basename(temp_audio_path), f, "audio/ogg")}
-                        data = {"lang": lang}
-                        try:
-                            chat_resp = requests.post(
-                                "https://agrivoice-2-ws-2a-8000.ml.iit-ropar.truefoundry.cloud/chat",
-                                files=files, data=data, timeout=60)
-                            chat_resp.raise_for_status()
-                            out = chat_resp.json()
-                            # Send answer as text
-                            send_whatsapp_message(from_number, f"📝 Q: {out.get('transcription','')}\nA: {out.get('response','')}")
-                            # Send answer as audio
-                            audio_url = out.get("audio_url")
-                            if audio_url:
-                                send_whatsapp_audio(from_number, audio_url)
-                        except Exception as e:
-                            send_whatsapp_message(from_number, f"❌ Failed to get answer: {e}")
-                        finally:
-                            os.remove(temp_audio_path)
-                else:
-                    send_whatsapp_message(from_number, "❌ Couldn't download your audio. Please try again.")
-            else:
-                send_whatsapp_message(from_number, "Please send your doubt as an audio message.")
-            # Return to main menu
-            user_states[from_number]['state'] = 'awaiting_main_menu'
-            send_whatsapp_message(from_number, MAIN_MENU_MSG)
-
-        # --- WEATHER HANDLER (SIMPLE) ---
-        elif current_state == 'awaiting_weather_location':
-            location = msg_body.strip()
-            # Placeholder: replace with actual weather API call if needed
-            send_whatsapp_message(from_number, f"🌦️ Weather in {location}:\n[Weather details here]")
-            user_states[from_number]['state'] = 'awaiting_main_menu'
-            send_whatsapp_message(from_number, MAIN_MENU_MSG)
+        data = json.loads(raw)
+        for message in iter_messages(data):
+            message_id = message.get('id')
+            # Meta redelivers whatever it thinks we missed; run each message once
+            if message_id and not message_dedup.claim(message_id):
+                print(f"♻️ Skipping duplicate delivery of {message_id}")
+                continue
+            # Acknowledge Meta right away; the conversation step runs on the worker pool,
+            # one message at a time per phone number.
+            if not webhook_queue.submit(message['from'], handle_message, message):
+                print(f"🚦 Webhook queue full, asking Meta to redeliver message from {message['from']}")
+                if message_id:
+                    message_dedup.release(message_id)
+                busy = True
 
     except Exception as e:
         print(f"❌ Error in webhook: {e}")
 
+    # Queued messages are already claimed, so the redelivery only re-runs the ones that didn't fit
+    if busy:
+        return 'Busy', 503
     return 'OK', 200
 
-@app.route('/notify-farmer', methods=['POST'])
-def notify_farmer():
-    data = request.json
-    phone = data.get('phone_number')
-    items = data.get('items',[])
-    if not phone or not items:
-        return jsonify({"error":"Invalid"}),400
-    lang = user_states.get(phone,{}).get('language','en')
+# --- Conversation state machine (runs on the webhook worker pool) ---
+# Each handler gets a Turn (message + session) and returns the next state; replies are
+# queued on the turn and delivered by handle_message once the session has been saved.
+conversation = StateMachine()
+
+def deliver_replies(replies):
+    for reply in replies:
+        if reply.kind == 'audio':
+            send_whatsapp_audio(reply.to, reply.body)
+        else:
+            send_whatsapp_message(reply.to, reply.body)
+
+# Greeting to start flow, from any state
+@conversation.trigger(['hi', 'hello', 'नमस्ते'], 'greeting', to={'awaiting_lang_after_exists', 'awaiting_language_choice'})
+def on_greeting(turn):
+    print(f"📞 Greeting received from {turn.phone}. Checking existence...")
+    turn.play(AUDIO_CLIPS['welcome'])  # Ask language
+    if auth_manager.farmer_exists(turn.phone):
+        return 'awaiting_lang_after_exists'
+    return 'awaiting_language_choice'
+
+@conversation.state('awaiting_lang_after_exists', to={'awaiting_main_menu', 'awaiting_password'})
+def on_lang_after_exists(turn):
+    lang = 'en' if '1' in turn.command else 'hi'
+    turn.session['language'] = lang
+    # A cached or refreshed token logs the farmer straight back in
+    token = auth_manager.access_token(turn.phone)
+    legacy_password = turn.session['data'].pop('password', None)   # sessions saved before passwords were dropped
+    if not token and legacy_password:
+        token = auth_manager.login(turn.phone, legacy_password)
+    if token:
+        turn.play(AUDIO_CLIPS[lang]['welcome_back'])
+        turn.say(MAIN_MENU_MSG)
+        return 'awaiting_main_menu'
+    turn.play(AUDIO_CLIPS[lang]['ask_loginpassword'])
+    return 'awaiting_password'
+
+@conversation.state('awaiting_language_choice', to={'awaiting_name'})
+def on_language_choice(turn):
+    lang = 'en' if '1' in turn.command else 'hi'
+    turn.session['language'] = lang
+    turn.play(AUDIO_CLIPS[lang]['ask_name'])
+    return 'awaiting_name'
+
+@conversation.state('awaiting_name', to={'awaiting_address'})
+def on_name(turn):
+    turn.session['data']['name'] = turn.body
+    turn.play(AUDIO_CLIPS[turn.lang]['ask_address'])
+    return 'awaiting_address'
+
+@conversation.state('awaiting_address', to={'awaiting_password'})
+def on_address(turn):
+    turn.session['data']['address'] = turn.body
+    turn.play(AUDIO_CLIPS[turn.lang]['ask_password'])
+    return 'awaiting_password'
+
+@conversation.state('awaiting_password', to={'awaiting_main_menu'})
+def on_password(turn):
+    data = turn.session['data']
+    data['username'] = turn.phone
+    data['phone_number'] = turn.phone
+    password = turn.body   # only sent to the backend, never kept in the session
+
+    if auth_manager.farmer_exists(turn.phone):
+        if auth_manager.login(turn.phone, password):
+            turn.play(AUDIO_CLIPS[turn.lang]['welcome_back'])
+            turn.say(MAIN_MENU_MSG)
+            return 'awaiting_main_menu'
+        turn.say("❌ Wrong password. Please try again.")
+        return None
+
+    if register_farmer_api(dict(data, password=password)):
+        auth_manager.mark_registered(turn.phone)
+        if auth_manager.login(turn.phone, password):
+            turn.play(AUDIO_CLIPS[turn.lang]['reg_complete'])
+            turn.say(MAIN_MENU_MSG)
+            return 'awaiting_main_menu'
+    turn.say("❌ Registration failed. Try again with 'hi'.")
+    return None
+
+@conversation.state('awaiting_main_menu', to={'awaiting_crop_name', 'awaiting_audio_doubt', 'awaiting_weather_location',
+                                               'awaiting_main_menu', 'awaiting_listing_confirm'})
+def on_main_menu(turn):
+    items = parse_listing(turn.body)
+    if items:
+        return start_listing(turn, items)
+    if turn.command in ['1', 'order', 'place order']:
+        turn.say("What crop would you like to sell? (Type the name, or list several at once: "
+                 "'Tomato 20kg ₹30, Onion 50kg ₹22')")
+        return 'awaiting_crop_name'
+    if turn.command in ['2', 'ask', 'doubt', 'question']:
+        turn.say("🎤 Please send your question as an audio message.")
+        return 'awaiting_audio_doubt'
+    if turn.command in ['3', 'weather']:
+        turn.say("🌦️ Please type your village or town and district (e.g. 'Rampur, Meerut') for the weather forecast.")
+        return 'awaiting_weather_location'
+    turn.say("Please reply with 1, 2, or 3.\n" + MAIN_MENU_MSG)
+    return None
+
+@conversation.state('awaiting_crop_name', to={'awaiting_price', 'awaiting_main_menu', 'awaiting_listing_confirm'})
+def on_crop_name(turn):
+    items = parse_listing(turn.body)
+    if items:
+        return start_listing(turn, items)
+    # Listed under the name the farmer typed; the Agmarknet name is only the price-lookup key
+    crop_name = turn.body.strip()
+    commodity = sanitize_commodity_name(crop_name)
+    turn.session['temp_produce'] = {'name': crop_name}
+    price_stats = market_prices(turn, {("Kerala", commodity)})[("Kerala", commodity)] if commodity else None
+
+    if commodity is None:
+        turn.say(f"❓ {crop_name} isn't in the mandi price list, so there's no market price to suggest. "
+                 "Please enter your price manually.")
+        turn.play(AUDIO_CLIPS[turn.lang]['ask_price'])
+    elif price_stats:
+        predicted_price = price_stats['median']
+        turn.say(f"📈 Based on recent market data from {price_stats['markets']} markets, the expected price "
+                 f"for {crop_name} is ₹{predicted_price} per quintal (₹{price_stats['per_kg']}/kg).")
+        turn.session['temp_produce']['predicted_price'] = predicted_price
+    else:
+        turn.say("⚠️ Couldn't predict the price right now. Please enter it manually.")
+        turn.play(AUDIO_CLIPS[turn.lang]['ask_price'])
+
+    return 'awaiting_price'
+
+# --- Market prices, looked up before the session is locked ---
+# A price-cache miss can take 30+ seconds due to agmarknet load times. The prefetch
+# runs the lookup on a snapshot of the session, so a second message from the farmer
+# is not left waiting on the lock; the handler then picks the prices up from the turn.
+def _priced_pairs(turn):
+    """The (state, commodity) pairs the handler for this message will look up."""
+    items = parse_listing(turn.body)
+    if items:
+        pending = []
+        _merge_listing(pending, items)
+        return {("Kerala", item['commodity']) for item in pending
+                if item.get('price_per_kg') is None and item.get('commodity')}
+    if turn.state == 'awaiting_crop_name':
+        commodity = sanitize_commodity_name(turn.body)
+        return {("Kerala", commodity)} if commodity else set()
+    return set()
+
+def _checking_prices(turn, pairs):
+    turn.say(f"🔍 Checking market prices for {', '.join(sorted(commodity for _, commodity in pairs))}. "
+             "Please wait...")
+    turn.flush()
+
+@conversation.prefetch('awaiting_main_menu', 'awaiting_crop_name')
+def fetch_market_prices(turn):
+    pairs = _priced_pairs(turn)
+    if not pairs:
+        return None
+    _checking_prices(turn, pairs)
+    return lookup_prices(pairs)
+
+def market_prices(turn, pairs):
+    """{pair: price statistics or None}, from the turn's prefetch when it covered these pairs."""
+    prefetched = turn.prefetched.value if turn.prefetched else None
+    if prefetched is not None and pairs <= prefetched.keys():
+        return {pair: prefetched[pair] for pair in pairs}
+    _checking_prices(turn, pairs)
+    return lookup_prices(pairs)
+
+@conversation.state('awaiting_price', to={'awaiting_quantity'})
+def on_price(turn):
+    turn.session['temp_produce']['price_per_kg'] = turn.body
+    turn.play(AUDIO_CLIPS[turn.lang]['ask_quantity'])
+    return 'awaiting_quantity'
+
+@conversation.state('awaiting_quantity', to={'awaiting_more_crops'})
+def on_quantity(turn):
+    turn.session['temp_produce']['quantity_kg'] = turn.body
+    if save_produce(turn.phone, turn.session['temp_produce']):
+        turn.play(AUDIO_CLIPS[turn.lang]['ask_more_crops'])
+    else:
+        turn.say("❌ Failed to save produce.")
+    return 'awaiting_more_crops'
+
+# --- BULK LISTING ("Tomato 20kg ₹30, Onion 50kg ₹22") ---
+# All crops in one message: names resolved together, missing prices looked up in
+# parallel, and everything saved in one go once the farmer confirms the summary.
+def _listing_summary(pending):
+    lines = []
+    for item in pending:
+        if item.get('price_per_kg') is not None:
+            lines.append(f"👉 {item['name']} | {item['quantity_kg']}kg | ₹{item['price_per_kg']}/kg")
+        elif item.get('market_price') is not None:
+            lines.append(f"👉 {item['name']} | {item['quantity_kg']}kg | market ₹{item['market_price']}/kg")
+        else:
+            lines.append(f"👉 {item['name']} | {item['quantity_kg']}kg | price needed")
+    return "\n".join(lines)
+
+def resolve_listing_name(name):
+    """
+    (commodity, key) for a listed crop: the Agmarknet name its price is looked up by (None
+    for catalog products Agmarknet doesn't trade, like Paneer), and the key that tells the
+    crops in a listing apart. None if it isn't a crop or runs several together ("Tomato Onion").
+    """
+    commodity = sanitize_commodity_name(name)
+    if commodity is None:
+        product = CATALOG_PRODUCTS.get(normalize(name))
+        return (None, product) if product else None
+    crops = {commodity_resolver.resolve_exact(word) for word in name.split()} - {None}
+    if len(crops) > 1:   # a missing comma, not a crop with a long name
+        return None
+    return commodity, commodity
+
+def _unrecognised_reply(names):
+    return (f"❓ Couldn't recognise: {', '.join(repr(n) for n in names)}. Send each crop with its quantity, "
+            "separated by commas (e.g. 'Tomato 20kg ₹30, Onion 50kg').")
+
+def _merge_listing(pending, items):
+    """
+    Add parsed items to the pending listing; a crop already in it gets the new quantity/price.
+    Returns the names that are not crops, which are left out.
+    """
+    by_key = {resolve_listing_name(item['name'])[1]: item for item in pending}
+    unrecognised = []
+    for item in items:
+        resolved = resolve_listing_name(item.name)
+        if resolved is None:
+            unrecognised.append(item.name)
+            continue
+        commodity, key = resolved
+        entry = by_key.get(key)
+        if entry is None:
+            # Listed under the farmer's name; the commodity is only for the price lookup
+            entry = by_key[key] = {'name': item.name, 'commodity': commodity}
+            pending.append(entry)
+        entry['quantity_kg'] = item.quantity_kg
+        if item.price_per_kg is not None:
+            entry['price_per_kg'] = item.price_per_kg
+    return unrecognised
+
+def start_listing(turn, items):
+    pending = []
+    unrecognised = _merge_listing(pending, items)
+    if unrecognised:
+        turn.say(_unrecognised_reply(unrecognised))
+    if not pending:
+        return None
+    # Products Agmarknet doesn't trade get no suggestion; the farmer is asked for their price
+    unpriced = [item for item in pending if item.get('price_per_kg') is None and item.get('commodity')]
+    if unpriced:
+        prices = market_prices(turn, {("Kerala", item['commodity']) for item in unpriced})
+        for item in unpriced:
+            price = prices.get(("Kerala", item['commodity']))
+            item['market_price'] = price['per_kg'] if price else None
+    return continue_listing(turn, pending)
+
+def continue_listing(turn, pending):
+    """Show the listing and wait for YES; nothing is saved before the farmer confirms."""
+    turn.session['pending_listing'] = pending
+    turn.say("📝 Your listing:\n" + _listing_summary(pending))
+    if all(item.get('price_per_kg') is not None for item in pending):
+        turn.say("Reply *YES* to list these crops, send changes (e.g. 'Onion ₹25/kg' or 'Onion 50kg ₹25'), "
+                 "or *NO* to cancel.")
+    elif all(item.get('price_per_kg') is not None or item.get('market_price') is not None for item in pending):
+        turn.say("Reply *YES* to list at the market prices, send your own prices (e.g. 'Onion ₹25/kg' "
+                 "or 'Onion 50kg ₹25'), or *NO* to cancel.")
+    else:
+        turn.say("Please send the missing prices (e.g. 'Onion 50kg ₹25'), or *NO* to cancel.")
+    return 'awaiting_listing_confirm'
+
+def submit_listing(turn, pending):
+    turn.session.pop('pending_listing', None)
+    produce = [{'name': item['name'], 'quantity_kg': item['quantity_kg'], 'price_per_kg': item['price_per_kg']}
+               for item in pending]
+    results = save_produce_batch(turn.phone, produce)
+    lines = [f"{'✅' if ok else '❌'} {item['name']} | {item['quantity_kg']}kg | ₹{item['price_per_kg']}/kg"
+             for item, ok in zip(produce, results)]
+    saved = sum(1 for ok in results if ok)
+    header = "🎉 All crops listed!" if saved == len(produce) else f"⚠️ Listed {saved} of {len(produce)} crops."
+    turn.say(header + "\n" + "\n".join(lines))
+    turn.say(MAIN_MENU_MSG)
+    return 'awaiting_main_menu'
+
+@conversation.state('awaiting_listing_confirm', to={'awaiting_main_menu', 'awaiting_listing_confirm'})
+def on_listing_confirm(turn):
+    pending = turn.session.get('pending_listing') or []
+    if turn.command in ['no', 'n', 'cancel', 'नहीं'] or not pending:
+        turn.session.pop('pending_listing', None)
+        turn.say("Listing cancelled.\n" + MAIN_MENU_MSG)
+        return 'awaiting_main_menu'
+    if turn.command in ['yes', 'y', 'ok', 'हाँ', 'हां']:
+        for item in pending:
+            if item.get('price_per_kg') is None:
+                item['price_per_kg'] = item.get('market_price')
+        if all(item.get('price_per_kg') is not None for item in pending):
+            return submit_listing(turn, pending)
+        return continue_listing(turn, pending)
+    # Prices alone ("Onion ₹25") update items already in the listing
+    items = parse_listing(turn.body) or _parse_price_updates(turn.body, pending)
+    if not items:
+        turn.say("Please reply YES, NO, or send prices like 'Onion 50kg ₹25'.")
+        return None
+    unrecognised = _merge_listing(pending, items)
+    if unrecognised:
+        turn.say(_unrecognised_reply(unrecognised))
+    return continue_listing(turn, pending)
+
+def _parse_price_updates(text, pending):
+    listed = {resolve_listing_name(item['name'])[1]: item for item in pending}
+    items = []
+    for part in text.split(','):
+        item = parse_listing(f"{part} 1 kg")   # borrow a quantity so the parser accepts "Onion ₹25"
+        if not item or item[0].price_per_kg is None:
+            return None
+        resolved = resolve_listing_name(item[0].name)
+        entry = listed.get(resolved[1]) if resolved else None
+        if entry is None:
+            return None
+        items.append(item[0]._replace(name=entry['name'], quantity_kg=entry['quantity_kg']))
+    return items
+
+@conversation.state('awaiting_more_crops', to={'awaiting_crop_name', 'awaiting_main_menu'})
+def on_more_crops(turn):
+    if turn.command in ['yes', 'y', 'ok', 'हाँ', 'हां']:
+        turn.play(AUDIO_CLIPS[turn.lang]['next_crop'])
+        return 'awaiting_crop_name'
+    turn.play(AUDIO_CLIPS[turn.lang]['thank_you'])
+    turn.say(MAIN_MENU_MSG)
+    return 'awaiting_main_menu'
+
+@conversation.state('conversation_over', to={'awaiting_main_menu'})
+def on_conversation_over(turn):
+    turn.play(AUDIO_CLIPS[turn.lang]['closing'])
+    turn.say(MAIN_MENU_MSG)
+    return 'awaiting_main_menu'
+
+# --- AUDIO DOUBT HANDLER ---
+# The answer can take a minute, so the question is handed to the QA pipeline and the
+# farmer gets an acknowledgement right away; the answer follows when it is ready.
+@conversation.state('awaiting_audio_doubt', to={'awaiting_main_menu'})
+def on_audio_doubt(turn):
+    if not turn.audio_url:
+        # A typed question that has been answered before gets that answer right away
+        cached = answer_cache.get(turn.lang, turn.body) if turn.body.strip() else None
+        if cached:
+            turn.replies.extend(doubt_answer_replies(turn.phone, turn.body.strip(), cached))
+            return 'awaiting_main_menu'
+        turn.say("Please send your doubt as an audio message.")
+        turn.say(MAIN_MENU_MSG)
+        return 'awaiting_main_menu'
+
+    outcome = qa_pipeline.submit(turn.phone, turn.audio_url, turn.lang)
+    if outcome == QA_ACCEPTED:
+        turn.say("⏳ Got your question! Working on the answer, I'll send it here shortly.")
+    elif outcome == QA_USER_BUSY:
+        turn.say("⏳ I'm still answering your previous question. Please wait for it before asking another.")
+        turn.say(MAIN_MENU_MSG)
+    else:
+        turn.say("🚦 Lots of questions right now. Please try again in a few minutes.")
+        turn.say(MAIN_MENU_MSG)
+    return 'awaiting_main_menu'
+
+@timed("qa.answer")
+def answer_voice_doubt(phone, audio_url, lang):
+    """QA pipeline job: stream the WhatsApp audio (needs auth) into the QA service; returns the replies."""
+    audio_headers = {"Authorization": f"Bearer {ACCESS_TOKEN}"}
+    try:
+        audio_resp = graph_client.get(audio_url, headers=audio_headers, endpoint="media_download", stream=True)
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Audio download failed for {phone}: {e}")
+        audio_resp = None
+    if audio_resp is None or audio_resp.status_code != 200:
+        if audio_resp is not None:
+            audio_resp.close()
+        return [Reply('text', phone, "❌ Couldn't download your audio. Please try again."),
+                Reply('text', phone, MAIN_MENU_MSG)]
+
+    try:
+        if QA_TRANSCRIBE_URL:
+            out = answer_transcribed(audio_resp, lang)
+        else:
+            out = audio_relay.relay_download(audio_resp, lang)
+            remember_answer(lang, out)
+    except AudioTooLarge:
+        return [Reply('text', phone, "❌ Your voice note is too long. Please keep it under a few minutes."),
+                Reply('text', phone, MAIN_MENU_MSG)]
+    return doubt_answer_replies(phone, out.get('transcription', ''), out)
+
+def answer_transcribed(audio_resp, lang):
+    """Transcribe first and answer from the cache when the question was asked before; else ask /chat."""
+    audio, content_type = audio_relay.read_download(audio_resp)
+    heard = audio_relay.relay([audio], 'voice.ogg', content_type, lambda: [('lang', lang)],
+                              url=QA_TRANSCRIBE_URL, endpoint="qa_transcribe")
+    cached = answer_cache.get(lang, heard.get('transcription', ''))
+    if cached:
+        return dict(cached, transcription=heard['transcription'])
+    out = audio_relay.relay([audio], 'voice.ogg', content_type, lambda: [('lang', lang)])
+    remember_answer(lang, out)
+    return out
+
+def doubt_answer_replies(phone, question, out):
+    # Answer as text, then as audio, then back to the main menu
+    replies = [Reply('text', phone, f"📝 Q: {question}\nA: {out.get('response','')}")]
+    if out.get("audio_url"):
+        replies.append(Reply('audio', phone, out["audio_url"]))
+    replies.append(Reply('text', phone, MAIN_MENU_MSG))
+    return replies
+
+def voice_doubt_failed(phone, error):
+    return [Reply('text', phone, f"❌ Failed to get answer: {error}"), Reply('text', phone, MAIN_MENU_MSG)]
+
+QA_CONCURRENCY       = int(os.getenv('QA_CONCURRENCY', '4'))
+QA_PER_USER          = int(os.getenv('QA_PER_USER', '1'))
+QA_QUEUE_MAX         = int(os.getenv('QA_QUEUE_MAX', '200'))
+qa_pipeline = QAPipeline(answer_voice_doubt, deliver_replies, voice_doubt_failed,
+                         concurrency=QA_CONCURRENCY, per_user=QA_PER_USER, max_pending=QA_QUEUE_MAX)
+
+# --- Weather (offline gazetteer, forecasts cached per grid cell) ---
+GAZETTEER_PATH       = os.getenv('GAZETTEER_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'india_places.tsv'))
+WEATHER_PROVIDER     = os.getenv('WEATHER_PROVIDER', 'open-meteo')
+WEATHER_API_URL      = os.getenv('WEATHER_API_URL', "https://api.open-meteo.com")
+WEATHER_DAYS         = int(os.getenv('WEATHER_DAYS', '3'))
+WEATHER_CACHE_PATH   = os.getenv('WEATHER_CACHE_PATH', 'cache/weather.sqlite3')
+WEATHER_TTL          = int(os.getenv('WEATHER_TTL', '1800'))
+WEATHER_STALE_TTL    = int(os.getenv('WEATHER_STALE_TTL', str(6 * 3600)))
+WEATHER_CELL_DEG     = float(os.getenv('WEATHER_CELL_DEG', '0.25'))
+
+# Loaded at import, so preloaded gunicorn workers share one copy
+gazetteer = Gazetteer(GAZETTEER_PATH)
+weather_client = HttpClient('weather', WEATHER_API_URL, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+                            retries=HTTP_RETRIES)
+weather_provider = create_provider(WEATHER_PROVIDER, weather_client, days=WEATHER_DAYS)
+forecast_cache = ForecastCache(WEATHER_CACHE_PATH, ttl=WEATHER_TTL, stale_ttl=WEATHER_STALE_TTL,
+                               cell_deg=WEATHER_CELL_DEG)
+
+# A place matched by spelling or by one word of the name is checked with the farmer first
+UNSURE_MATCHES = {'fuzzy', 'partial'}
+
+@conversation.state('awaiting_weather_location', to={'awaiting_main_menu', 'awaiting_weather_confirm'})
+def on_weather_location(turn):
+    if turn.command in ['0', 'menu', 'back', 'cancel']:
+        turn.say(MAIN_MENU_MSG)
+        return 'awaiting_main_menu'
+    state = gazetteer.named_state(turn.body)
+    if state:
+        turn.say(f"📍 Which district or town in {state}? Please send it with the district "
+                 "(e.g. 'Rampur, Meerut'), or 0 for the main menu.")
+        return None
+    match = gazetteer.lookup(turn.body)
+    if match is None:
+        turn.say(f"❓ Couldn't find '{turn.body.strip()}'. Please send the nearest town or your district "
+                 "(e.g. 'Meerut' or 'Rampur, Meerut'), or 0 for the main menu.")
+        return None
+    if match.how in UNSURE_MATCHES:
+        turn.session['weather_match'] = {**match.place._asdict(), 'how': match.how, 'query': match.query}
+        turn.say(f"📍 Did you mean {place_title(match.place)}? Reply *YES* for its forecast, or send your "
+                 "town again with its district (e.g. 'Rampur, Meerut').")
+        return 'awaiting_weather_confirm'
+    return send_forecast(turn, match)
+
+@conversation.state('awaiting_weather_confirm', to={'awaiting_main_menu', 'awaiting_weather_confirm'})
+def on_weather_confirm(turn):
+    saved = turn.session.pop('weather_match', None)
+    if saved and turn.command in ['yes', 'y', 'ok', 'हाँ', 'हां']:
+        return send_forecast(turn, _saved_match(saved))
+    if turn.command in ['no', 'n', 'नहीं']:
+        turn.say("Please send your village or town with its district (e.g. 'Rampur, Meerut'), "
+                 "or 0 for the main menu.")
+        return None
+    return on_weather_location(turn)   # anything else is another try at the place
+
+def _saved_match(saved):
+    return Match(Place(**{field: saved[field] for field in Place._fields}), saved['how'], saved['query'])
+
+def send_forecast(turn, match):
+    place = match.place
+    prefetched = turn.prefetched.value if turn.prefetched else None
+    if prefetched and prefetched[0] == (place.lat, place.lon):
+        cached = prefetched[1]
+    else:
+        cached = forecast_cache.get(place.lat, place.lon, weather_provider.fetch)
+    if cached is None:
+        turn.say(f"⚠️ Couldn't get the weather for {place.name} right now. Please try again later.")
+    else:
+        turn.say(format_forecast(match, *cached, lang=turn.lang))
+    turn.say(MAIN_MENU_MSG)
+    return 'awaiting_main_menu'
+
+@conversation.prefetch('awaiting_weather_location', 'awaiting_weather_confirm')
+def fetch_forecast(turn):
+    """((lat, lon), forecast) for the place the handler will answer with, if it answers right away."""
+    saved = turn.session.get('weather_match')
+    if turn.state == 'awaiting_weather_confirm' and saved and turn.command in ['yes', 'y', 'ok', 'हाँ', 'हां']:
+        place = _saved_match(saved).place
+    elif turn.command in ['0', 'menu', 'back', 'cancel', 'no', 'n', 'नहीं'] or gazetteer.named_state(turn.body):
+        return None
+    else:
+        match = gazetteer.lookup(turn.body)
+        if match is None or match.how in UNSURE_MATCHES:
+            return None
+        place = match.place
+    return (place.lat, place.lon), forecast_cache.get(place.lat, place.lon, weather_provider.fetch)
+
+MESSAGE_LOCK_RETRIES = int(os.getenv('MESSAGE_LOCK_RETRIES', '2'))
+
+def handle_message(message, attempt=0):
+    # The WhatsApp message id is the trace id: it also shows up in Graph's status webhooks
+    with trace(message.get('id')) as trace_id:
+        # A requeued message gives its dedup claim back; skip it if Meta's redelivery took it since
+        if attempt and message.get('id') and not message_dedup.claim(message['id']):
+            return
+        if profiling_requested():
+            with SamplingProfiler() as profiler:
+                _handle_message(message, attempt)
+            print(f"🔬 Profile of message {trace_id}: {profiler.save(PROFILE_DIR, f'message-{os.getpid()}-{time.time():.0f}')}")
+        else:
+            _handle_message(message, attempt)
+
+def requeue_message(message, attempt):
+    """The farmer's session stayed locked: queue the message again instead of dropping it."""
+    message_id = message.get('id')
+    if message_id:
+        message_dedup.release(message_id)   # so a redelivery from Meta is not dropped as a duplicate
+    if attempt < MESSAGE_LOCK_RETRIES and webhook_queue.submit(message['from'], handle_message, message, attempt + 1):
+        print(f"🔒 Session for {message['from']} is busy, requeued message {message_id} (attempt {attempt + 1})")
+    else:
+        print(f"❌ Session for {message['from']} stayed locked, giving up on message {message_id}")
+
+@timed("message.handle")
+def _handle_message(message, attempt=0):
+    try:
+        print(f"📩 Message from {message['from']}: '{message.get('text', {}).get('body', '').strip().lower()}'")
+
+        # Slow lookups (mandi prices, forecasts) run on a snapshot of the session first,
+        # so the transaction below only locks it for the quick step that uses them
+        snapshot = Turn.from_message(message, session_store.get(message['from']), deliver=deliver_replies)
+        prefetched = conversation.fetch(snapshot)
+
+        # One transaction per message: the farmer's session is locked until this step is done
+        with session_store.transaction(message['from']) as session:
+            turn = Turn.from_message(message, session, deliver=deliver_replies, prefetched=prefetched)
+            print(f"🔁 Current state for {turn.phone}: {turn.state}")
+            transition = conversation.dispatch(turn)
+        HANDLER_SECONDS.observe(transition.seconds, handler=transition.handler or 'unhandled')
+        TRANSITIONS.inc(from_state=transition.from_state or 'none', to_state=transition.to_state or 'none')
+
+        # Sent after the new state is saved, so a quick reply from the farmer sees it
+        deliver_replies(transition.replies)
+
+    except SessionLockTimeout:
+        requeue_message(message, attempt)
+    except Exception as e:
+        print(f"❌ Error handling message: {e}")
+
+# --- Broadcasts (bulk order notifications, daily price alerts) ---
+# WhatsApp caps messages per second per business number; BROADCAST_RATE is per worker
+# process, so set it to the number's throughput tier divided by the gunicorn workers.
+BROADCAST_DB_PATH      = os.getenv('BROADCAST_DB_PATH', 'cache/broadcasts.sqlite3')
+BROADCAST_RATE         = float(os.getenv('BROADCAST_RATE', '20'))
+BROADCAST_BURST        = int(os.getenv('BROADCAST_BURST', '20'))
+BROADCAST_WORKERS      = int(os.getenv('BROADCAST_WORKERS', '16'))
+BROADCAST_QUEUE_MAX    = int(os.getenv('BROADCAST_QUEUE_MAX', '20'))
+
+callback_client = HttpClient('callbacks', timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT), retries=HTTP_RETRIES)
+
+def post_broadcast_report(callback_url, report):
+    callback_client.post(callback_url, json=report, endpoint="broadcast_report").raise_for_status()
+
+broadcaster = Broadcaster(send_whatsapp_message, BROADCAST_DB_PATH, rate=BROADCAST_RATE, burst=BROADCAST_BURST,
+                          workers=BROADCAST_WORKERS, max_queued=BROADCAST_QUEUE_MAX, notify=post_broadcast_report)
+
+def farmer_language(phone):
+    return (session_store.get(phone) or {}).get('language', 'en')
+
+def order_notification_text(lang, items):
     lines=[]
     hdr = "🎉 *New Order!*" if lang=='en' else "🎉 *नया ऑर्डर!*"
     lines.append(hdr)
@@ -576,49 +1147,266 @@ def notify_farmer():
             lines.append(f"👉 {it['produce']} | बिक: {it['quantity_bought']}kg | बचे: {it['remaining_stock']}kg")
         else:
             lines.append(f"👉 {it['produce']} | Sold: {it['quantity_bought']}kg | Left: {it['remaining_stock']}kg")
-    send_whatsapp_message(phone, "\n".join(lines))
+    return "\n".join(lines)
+
+def price_alert_text(lang, commodity, state, price):
+    if lang == 'hi':
+        return (f"📈 *भाव सूचना*: {state} में {commodity} का भाव ₹{price['median']} प्रति क्विंटल "
+                f"(₹{price['per_kg']}/kg), {price['markets']} मंडियों के अनुसार।")
+    return (f"📈 *Price alert*: {commodity} in {state} is at ₹{price['median']} per quintal "
+            f"(₹{price['per_kg']}/kg) across {price['markets']} markets.")
+
+def price_alert_messages(alerts):
+    """(phone, text) per alert. Each (state, commodity) is looked up once, a few at a time."""
+    alerts = [(a['phone_number'], sanitize_commodity_name(a['commodity']) or a['commodity'], a.get('state') or 'Kerala')
+              for a in alerts]
+    prices = lookup_prices({(state, commodity) for _, commodity, state in alerts})
+    # No price for the crop: the recipient is recorded as skipped
+    return [(phone, price_alert_text(farmer_language(phone), commodity, state, prices[(state, commodity)])
+             if prices[(state, commodity)] else None)
+            for phone, commodity, state in alerts]
+
+def broadcast_accepted(broadcast_id, recipients):
+    if broadcast_id is None:
+        return jsonify({"error": "Too many broadcasts queued, try again later"}), 503
+    return jsonify({"status": "queued", "broadcast_id": broadcast_id, "recipients": recipients,
+                    "status_url": f"/broadcasts/{broadcast_id}"}), 202
+
+@app.route('/notify-farmer', methods=['POST'])
+def notify_farmer():
+    data = request.get_json(silent=True) or {}
+    phone = data.get('phone_number')
+    if not phone:
+        return jsonify({"error": "phone_number is required"}), 400
+    try:
+        items = parse_order_items(data.get('items'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    send_whatsapp_message(phone, order_notification_text(farmer_language(phone), items))
     return jsonify({"status":"notified"}),200
 
+@app.route('/notify-farmers', methods=['POST'])
+def notify_farmers():
+    """
+    Bulk order notifications: {"orders": [{"phone_number", "items"}, ...], "callback_url"?}.
+    Orders for the same farmer are merged into one message. Answers 202 with a
+    broadcast id; per-farmer results come from /broadcasts/<id> or the callback.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        orders = parse_orders(data.get('orders'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    by_farmer = merge_orders(orders)
+    broadcast_id = broadcaster.submit(
+        'orders', lambda: [(phone, order_notification_text(farmer_language(phone), items))
+                           for phone, items in by_farmer.items()],
+        callback_url=data.get('callback_url'))
+    return broadcast_accepted(broadcast_id, len(by_farmer))
+
+@app.route('/price-alerts', methods=['POST'])
+def price_alerts():
+    """
+    Price alert broadcast: {"alerts": [{"phone_number", "commodity", "state"?}, ...], "callback_url"?}
+    or one crop for many farmers: {"phone_numbers": [...], "commodity", "state"?}.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        alerts = parse_alerts(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    broadcast_id = broadcaster.submit('price_alert', lambda: price_alert_messages(alerts),
+                                      callback_url=data.get('callback_url'))
+    return broadcast_accepted(broadcast_id, len({a['phone_number'] for a in alerts}))
+
+@app.route('/broadcasts/<broadcast_id>', methods=['GET'])
+def broadcast_status(broadcast_id):
+    report = broadcaster.status(broadcast_id, recipients=request.args.get('recipients', '1') != '0')
+    if report is None:
+        return jsonify({"error": "Not found"}), 404
+    return jsonify(report), 200
+
+def component_stats():
+    return {
+        "webhook_queue": webhook_queue.stats(),
+        "webhook_dedup": message_dedup.stats(),
+        "driver_pool": driver_pool.stats(),
+        "price_cache": price_cache.stats(),
+        "commodity_resolver": commodity_resolver.stats(),
+        "sessions": session_store.stats(),
+        "auth": auth_manager.stats(),
+        "conversation_states": conversation.stats(),
+        "qa_pipeline": qa_pipeline.stats(),
+        "answer_cache": answer_cache.stats(),
+        "broadcasts": broadcaster.stats(),
+        "scrape_phases": scrape_phase_stats.stats(),
+        "http": {"graph": graph_client.stats(), "backend": backend_client.stats(), "qa": qa_client.stats(),
+                 "callbacks": callback_client.stats(), "weather": weather_client.stats()},
+        "media": media_manager.stats(),
+        "weather": {"gazetteer": gazetteer.stats(), "forecasts": forecast_cache.stats()},
+        "process": process_stats(),
+    }
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify(component_stats()), 200
+
+# --- /metrics (Prometheus text format) ---
+@REGISTRY.collector
+def collect_component_stats():
+    samples = []
+    for component, component_stats_ in component_stats().items():
+        samples.extend((labels, value) for labels, value in stats_samples(component, component_stats_)
+                       if '.buckets_ms.' not in labels['stat'])
+    return [("agrikart_component_stat", "gauge", "Counters and gauges from each component's stats().", samples)]
+
+@REGISTRY.collector
+def collect_http_latency():
+    name = "agrikart_http_request_duration_seconds"
+    samples = []
+    for client in (graph_client, backend_client, qa_client, callback_client, weather_client):
+        for endpoint, snapshot in client.stats()["endpoints"].items():
+            labels = {"client": client.name, "endpoint": endpoint}
+            for bound, cumulative in snapshot["buckets_ms"].items():
+                le = bound if bound == "+Inf" else repr(float(bound) / 1000)
+                samples.append((f"{name}_bucket", dict(labels, le=le), cumulative))
+            samples.append((f"{name}_count", labels, snapshot["buckets_ms"]["+Inf"]))
+            samples.append((f"{name}_sum", labels, round(snapshot["sum_ms"] / 1000, 6)))
+    return [(name, "histogram", "Outbound HTTP latency per client and endpoint.", samples)]
+
+@REGISTRY.collector
+def collect_session_states():
+    counts = session_store.state_counts()
+    if counts is None:
+        return []
+    return [("agrikart_sessions_by_state", "gauge", "Live sessions per conversation state.",
+             [({"state": state}, n) for state, n in counts.items()])]
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return REGISTRY.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+# --- Per-request sampling profiler ("X-Profile: $PROFILE_TOKEN") ---
+@app.before_request
+def start_profiler():
+    if PROFILE_TOKEN and request.headers.get('X-Profile') == PROFILE_TOKEN:
+        # Webhook messages are handled on queue threads; the flag travels with the queued job
+        g.profile_flag = request_profiling()
+        g.profiler = SamplingProfiler().__enter__()
+
+@app.after_request
+def stop_profiler(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.__exit__(None, None, None)
+        path = profiler.save(PROFILE_DIR, f"request-{os.getpid()}-{time.time():.0f}")
+        response.headers['X-Profile-Output'] = path
+    return response
+
+@app.teardown_request
+def reset_profiling(exc):
+    if g.pop('profile_flag', None) is not None:
+        request_profiling(False)
+
 # --- /chat/ ENDPOINT (AUDIO QA PROXY) ---
 @app.route('/chat/', methods=['POST'])
 def chat():
     """
     Accepts audio + lang, forwards to truefoundry cloud endpoint, returns transcription, answer, and audio_url.
+    The upload is parsed and forwarded chunk by chunk; nothing is written to disk.
     """
-    if 'file' not in request.files or 'lang' not in request.form:
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/form-data' or not boundary:
         return jsonify({'error': 'Missing file or lang'}), 400
+    if request.content_length and request.content_length > AUDIO_MAX_BYTES + 64 * 1024:
+        return jsonify({'error': 'Audio too large'}), 413
 
-    file = request.files['file']
-    lang = request.form['lang']
-
-    # Save incoming file to a temp location
-    temp_dir = tempfile.mkdtemp()
-    temp_path = os.path.join(temp_dir, file.filename)
-    file.save(temp_path)
-
-    # Forward to truefoundry endpoint
-    files = {'file': open(temp_path, 'rb')}
-    data = {'lang': lang}
     try:
-        resp = requests.post(
-            'https://agrivoice-2-ws-2a-8000.ml.iit-ropar.truefoundry.cloud/chat',
-            files=files,
-            data=data,
-            timeout=60
-        )
-        resp.raise_for_status()
-        output = resp.json()
+        upload = StreamingUpload(request.stream, boundary)
+        if upload.filename is None:
+            return jsonify({'error': 'Missing file or lang'}), 400
+
+        def form_fields():
+            if 'lang' not in upload.fields:
+                raise BadUpload('Missing file or lang')
+            return [('lang', upload.fields['lang'])]
+
+        output = audio_relay.relay(upload.chunks(), upload.filename, upload.content_type, form_fields)
+    except BadUpload as e:
+        return jsonify({'error': str(e)}), 400
+    except AudioTooLarge as e:
+        return jsonify({'error': str(e)}), 413
     except Exception as e:
-        shutil.rmtree(temp_dir)
         return jsonify({'error': str(e)}), 500
 
-    # Clean up temp file
-    shutil.rmtree(temp_dir)
+    remember_answer(upload.fields.get('lang'), output)
     return jsonify(output), 200
 
+# --- Startup ---
+# Importing this module only builds objects. Background threads, browsers and media uploads
+# start per process in start_worker(), so gunicorn --preload can import the app once in the
+# master and fork workers that share its memory (gunicorn.conf.py calls start_worker() after
+# the fork; anything else gets it on its first request).
+WARMUP               = os.getenv('WARMUP', '0') == '1'
+STATIC_AUDIO_DIR     = os.path.join(app.static_folder, 'audio')
+IMPORT_PID           = os.getpid()
+
+_startup = {"import_seconds": None, "warmup_seconds": None, "worker_pid": None, "worker_started_at": None}
+_startup_lock = threading.Lock()
+
+def warm_up():
+    """Load what the first price lookup would otherwise load: numpy, the scraping engine, the crop index."""
+    started = time.perf_counter()
+    import numpy  # noqa: F401  (price_stats)
+    if AGMARKNET_ENGINE == 'http':
+        import bs4  # noqa: F401  (agmarknet_http)
+    else:
+        selenium_engine()
+    sanitize_commodity_name("Tomato")
+    _startup["warmup_seconds"] = round(time.perf_counter() - started, 3)
+    print(f"🔥 Warmed up in {_startup['warmup_seconds']}s")
+
+def create_app():
+    """
+    The WSGI app, ready to serve; `gunicorn 'app:create_app()'` (app:app works as well).
+    With WARMUP=1 the heavy libraries are loaded here, i.e. once in the master under
+    --preload, instead of on some farmer's first price lookup in every worker.
+    """
+    os.makedirs(STATIC_AUDIO_DIR, exist_ok=True)
+    if WARMUP and _startup["warmup_seconds"] is None:
+        warm_up()
+    return app
+
+def start_worker():
+    """Start this process's background work: prefetch scheduler, media refresher, browser prewarm. Once per pid."""
+    with _startup_lock:
+        if _startup["worker_pid"] == os.getpid():
+            return False
+        _startup["worker_pid"] = os.getpid()
+        _startup["worker_started_at"] = time.time()
+    if prefetch_scheduler is not None:
+        prefetch_scheduler.start()
+    if MEDIA_PRELOAD and media_manager.enabled:
+        media_manager.start_refresher(interval=MEDIA_REFRESH_HOURS * 3600)
+    if AGMARKNET_DRIVER_PREWARM:
+        driver_pool.prewarm()
+    return True
+
+@app.before_request
+def ensure_worker_started():
+    if _startup["worker_pid"] != os.getpid():
+        start_worker()
+
+def process_stats():
+    started_at = _startup["worker_started_at"] if _startup["worker_pid"] == os.getpid() else None
+    return dict(process_memory(), pid=os.getpid(), preloaded=IMPORT_PID != os.getpid(),
+                import_seconds=_startup["import_seconds"], warmup_seconds=_startup["warmup_seconds"],
+                uptime_seconds=round(time.time() - started_at, 1) if started_at else None)
+
+_startup["import_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+print(f"🚀 App imported in {_startup['import_seconds']}s, RSS {process_memory()['rss_mb']} MB (pid {os.getpid()})")
+
 if __name__ == '__main__':
     print("🚀 WhatsApp Bot Running...")
-    # Create static/audio directory if it doesn't exist
-    if not os.path.exists('static/audio'):
-        os.makedirs('static/audio')
+    create_app()
     app.run(port=5000, debug=True)
@@ -0,0 +1,180 @@
+"""
+Streams voice notes to the QA service without buffering them whole or touching disk.
+
+Chunks of audio (from the WhatsApp media download, or from an incoming /chat/
+upload parsed incrementally by StreamingUpload) are wrapped in a multipart body
+generated on the fly, which `requests` sends with chunked transfer encoding.
+At most one CHUNK_SIZE buffer per relay is held in memory.
+"""
+import uuid
+
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.sansio.multipart import NEED_DATA, Data, Epilogue, Field, File, MultipartDecoder
+
+CHUNK_SIZE = 64 * 1024
+
+
+class AudioTooLarge(Exception):
+    """The voice note is bigger than the relay's max_bytes."""
+
+
+class BadUpload(Exception):
+    """The incoming multipart body is malformed or misses a required part."""
+
+
+def limited(chunks, max_bytes):
+    """Pass chunks through, raising AudioTooLarge once more than max_bytes have gone by."""
+    total = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        total += len(chunk)
+        if max_bytes and total > max_bytes:
+            raise AudioTooLarge(f"audio exceeds {max_bytes // 1024} KB")
+        yield chunk
+
+
+def _quote(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def multipart_body(boundary, file_field, filename, content_type, chunks, fields=None):
+    """
+    multipart/form-data body as a generator. The file part comes first and `fields`
+    is only called after the file has been streamed, so text fields that arrive
+    after the file in an incoming upload can still be forwarded.
+    """
+    dash = b"--" + boundary.encode()
+    yield (dash + b'\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\nContent-Type: %s\r\n\r\n'
+           % (_quote(file_field).encode(), _quote(filename).encode(), content_type.encode()))
+    yield from chunks
+    for name, value in (fields() if fields else ()):
+        yield (b'\r\n' + dash + b'\r\nContent-Disposition: form-data; name="%s"\r\n\r\n' % _quote(name).encode()
+               + str(value).encode('utf-8'))
+    yield b"\r\n" + dash + b"--\r\n"
+
+
+class StreamingUpload:
+    """
+    Incremental reader for a multipart/form-data request body.
+
+    On creation it parses up to the start of the `file_field` part, collecting any
+    text fields before it. chunks() then yields the file's bytes as they arrive
+    and, once the file is done, parses the rest of the body, so fields sent after
+    the file also end up in `fields`.
+    """
+
+    def __init__(self, stream, boundary, file_field='file', max_field_bytes=64 * 1024):
+        self.stream = stream
+        self.file_field = file_field
+        self.fields = {}
+        self.filename = None
+        self.content_type = None
+        # We only feed the decoder when it asks for data, so its buffer stays around one chunk
+        self._decoder = MultipartDecoder(boundary.encode() if isinstance(boundary, str) else boundary,
+                                         max_form_memory_size=4 * CHUNK_SIZE)
+        self.max_field_bytes = max_field_bytes
+        self._events = self._iter_events()
+        self._field = None
+        self._value = []
+        self._consumed = False
+        for event in self._events:
+            if isinstance(event, File) and event.name == file_field:
+                self.filename = event.filename or 'audio'
+                self.content_type = event.headers.get('Content-Type', 'application/octet-stream')
+                return
+            self._collect(event)
+        self._consumed = True
+
+    def _iter_events(self):
+        ended = False
+        while True:
+            try:
+                event = self._decoder.next_event()
+            except (ValueError, RequestEntityTooLarge) as e:
+                raise BadUpload(str(e))
+            if event is NEED_DATA:
+                if ended:
+                    raise BadUpload("multipart body ended early")
+                chunk = self.stream.read(CHUNK_SIZE)
+                ended = not chunk
+                self._decoder.receive_data(chunk or None)
+                continue
+            yield event
+            if isinstance(event, Epilogue):
+                return
+
+    def _collect(self, event):
+        if isinstance(event, Field):
+            self._field, self._value = event.name, []
+        elif isinstance(event, File):
+            self._field = None   # some other file part: skip its data
+        elif isinstance(event, Data) and self._field is not None:
+            self._value.append(event.data)
+            if sum(map(len, self._value)) > self.max_field_bytes:
+                raise BadUpload(f"form field {self._field!r} is too large")
+            if not event.more_data:
+                self.fields[self._field] = b''.join(self._value).decode('utf-8', 'replace')
+                self._field = None
+
+    def chunks(self):
+        """The file part's bytes, then the remainder of the body is parsed for trailing fields."""
+        if self.filename is None or self._consumed:
+            return
+        for event in self._events:
+            if not isinstance(event, Data):
+                raise BadUpload("unexpected part inside the file data")
+            if event.data:
+                yield event.data
+            if not event.more_data:
+                break
+        for event in self._events:
+            self._collect(event)
+        self._consumed = True
+
+
+class AudioRelay:
+    """Posts streamed audio plus form fields to the QA /chat service and returns its JSON."""
+
+    def __init__(self, client, url, max_bytes=16 * 1024 * 1024, timeout=(3.05, 60)):
+        self.client = client
+        self.url = url
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+
+    def relay(self, chunks, filename, content_type, fields, url=None, endpoint="qa_chat"):
+        """`fields` is a callable returning (name, value) pairs; it runs after the audio has been sent."""
+        boundary = uuid.uuid4().hex
+        body = multipart_body(boundary, 'file', filename, content_type, limited(chunks, self.max_bytes), fields)
+        resp = self.client.post(
+            url or self.url, data=body, timeout=self.timeout, endpoint=endpoint,
+            headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+        resp.raise_for_status()
+        return resp.json()
+
+    def relay_download(self, download, lang, filename='voice.ogg'):
+        """Relay a streamed requests.Response (e.g. the WhatsApp media download)."""
+        try:
+            length = int(download.headers.get('Content-Length') or 0)
+            if self.max_bytes and length > self.max_bytes:
+                raise AudioTooLarge(f"audio exceeds {self.max_bytes // 1024} KB")
+            content_type = download.headers.get('Content-Type', 'audio/ogg').split(';')[0]
+            return self.relay(download.iter_content(CHUNK_SIZE), filename, content_type,
+                              lambda: [('lang', lang)])
+        finally:
+            download.close()
+
+    def read_download(self, download):
+        """
+        Read a streamed download into memory (bounded by max_bytes) for when the audio
+        has to be sent twice, e.g. to a transcription endpoint and then to /chat.
+        Returns (audio bytes, content type).
+        """
+        try:
+            length = int(download.headers.get('Content-Length') or 0)
+            if self.max_bytes and length > self.max_bytes:
+                raise AudioTooLarge(f"audio exceeds {self.max_bytes // 1024} KB")
+            content_type = download.headers.get('Content-Type', 'audio/ogg').split(';')[0]
+            return b''.join(limited(download.iter_content(CHUNK_SIZE), self.max_bytes)), content_type
+        finally:
+            download.close()
@@ -0,0 +1,184 @@
+import json
+import time
+import base64
+import hashlib
+import threading
+
+import requests
+
+from local_state import SingleFlight, SqliteConnection
+
+
+class TokenRejected(Exception):
+    """The backend answered 401 to a request made with a cached access token."""
+
+
+def jwt_expiry(token):
+    """The `exp` claim of a JWT (not verified, only read), or None."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class AuthManager:
+    """
+    Backend credentials per farmer, so the bot stops logging in on every "hi".
+
+    Existence checks are cached: a known farmer for `exists_ttl` seconds and an
+    unknown number for `missing_ttl`. Failed checks are not cached. Access and refresh
+    tokens are kept per phone number with their JWT expiry. access_token() returns
+    the cached access token until `refresh_margin` seconds before it expires, then
+    swaps the refresh token for a new one. Only when that fails does the farmer need
+    to log in with a password again. Concurrent logins or refreshes for the same
+    farmer share one backend call. Everything is stored in a SQLite file, so all
+    the workers on the host share the tokens. Passwords are never stored.
+    """
+
+    def __init__(self, client, path, login_path="/api/v1/auth/token/", refresh_path="/api/v1/auth/token/refresh/",
+                 exists_path="/api/v1/farmer/check/{phone}/", exists_ttl=24 * 3600, missing_ttl=300,
+                 refresh_margin=60, default_access_ttl=300, default_refresh_ttl=24 * 3600):
+        self.client = client
+        self.path = path
+        self.login_path = login_path
+        self.refresh_path = refresh_path
+        self.exists_path = exists_path
+        self.exists_ttl = exists_ttl
+        self.missing_ttl = missing_ttl
+        self.refresh_margin = refresh_margin
+        self.default_access_ttl = default_access_ttl
+        self.default_refresh_ttl = default_refresh_ttl
+
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()   # keyed by (kind, phone[, password hash])
+        self._conn = SqliteConnection(path, [
+            "CREATE TABLE IF NOT EXISTS farmer_auth ("
+            " phone TEXT PRIMARY KEY, exists_flag INTEGER, checked_at REAL,"
+            " access TEXT, access_exp REAL, refresh TEXT, refresh_exp REAL)"], private=True)   # holds bearer tokens
+        self._counters = {
+            "exists_hits": 0, "exists_checks": 0, "logins": 0, "login_failures": 0, "refreshes": 0,
+            "refresh_failures": 0, "token_hits": 0, "coalesced": 0, "rejected_tokens": 0,
+        }
+
+    # --- SQLite layer ---
+    def _row(self, phone):
+        with self._lock:
+            row = self._conn().execute(
+                "SELECT exists_flag, checked_at, access, access_exp, refresh, refresh_exp FROM farmer_auth"
+                " WHERE phone = ?", (phone,)).fetchone()
+        keys = ("exists_flag", "checked_at", "access", "access_exp", "refresh", "refresh_exp")
+        return dict(zip(keys, row)) if row else {}
+
+    def _update(self, phone, **fields):
+        columns = ", ".join(f"{name} = excluded.{name}" for name in fields)
+        with self._lock:
+            db = self._conn()
+            db.execute(
+                f"INSERT INTO farmer_auth (phone, {', '.join(fields)}) VALUES (?{', ?' * len(fields)})"
+                f" ON CONFLICT(phone) DO UPDATE SET {columns}", (phone, *fields.values()))
+            db.commit()
+
+    # --- single flight ---
+    def _once(self, key, func):
+        """Run func() unless an identical call is already running; then share its result."""
+        value, shared = self._flights.do(key, func)
+        if shared:
+            self._count("coalesced")
+        return value
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    # --- existence ---
+    def farmer_exists(self, phone):
+        row = self._row(phone)
+        if row.get("checked_at") is not None:
+            ttl = self.exists_ttl if row["exists_flag"] else self.missing_ttl
+            if time.time() - row["checked_at"] < ttl:
+                self._count("exists_hits")
+                return bool(row["exists_flag"])
+        return self._once(("exists", phone), lambda: self._check_exists(phone))
+
+    def _check_exists(self, phone):
+        self._count("exists_checks")
+        try:
+            response = self.client.get(self.exists_path.format(phone=phone), endpoint="farmer_check")
+            if response.status_code not in (200, 404):
+                response.raise_for_status()
+            exists = response.status_code == 200 and bool(response.json().get("exists", False))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"ERROR checking farmer existence: {e}")
+            return False   # not cached: the next message asks again
+        self._update(phone, exists_flag=int(exists), checked_at=time.time())
+        return exists
+
+    def mark_registered(self, phone):
+        self._update(phone, exists_flag=1, checked_at=time.time())
+
+    # --- tokens ---
+    def _store_tokens(self, phone, tokens, keep_refresh=None):
+        now = time.time()
+        access = tokens["access"]
+        refresh = tokens.get("refresh") or keep_refresh
+        self._update(
+            phone, exists_flag=1, checked_at=now, access=access,
+            access_exp=jwt_expiry(access) or now + self.default_access_ttl,
+            refresh=refresh,
+            refresh_exp=(jwt_expiry(refresh) or now + self.default_refresh_ttl) if refresh else None)
+        return access
+
+    def login(self, phone, password):
+        """Log in with the farmer's password; returns the access token, or None if refused."""
+        key = ("login", phone, hashlib.sha256(password.encode("utf-8")).hexdigest())
+        return self._once(key, lambda: self._login(phone, password))
+
+    def _login(self, phone, password):
+        self._count("logins")
+        try:
+            res = self.client.post(self.login_path, json={"username": phone, "password": password},
+                                   endpoint="auth_token")
+            res.raise_for_status()
+            tokens = res.json()
+            return self._store_tokens(phone, tokens)
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            print(f"❌ Login failed for {phone}: {e}")
+            self._count("login_failures")
+            return None
+
+    def access_token(self, phone):
+        """A valid access token for the farmer, refreshed if needed; None means log in again."""
+        row = self._row(phone)
+        now = time.time()
+        if row.get("access") and (row["access_exp"] or 0) - self.refresh_margin > now:
+            self._count("token_hits")
+            return row["access"]
+        if row.get("refresh") and (row["refresh_exp"] or 0) > now:
+            return self._once(("refresh", phone), lambda: self._refresh(phone, row["refresh"]))
+        return None
+
+    def _refresh(self, phone, refresh):
+        self._count("refreshes")
+        try:
+            res = self.client.post(self.refresh_path, json={"refresh": refresh}, endpoint="auth_refresh")
+            if res.status_code in (400, 401):
+                self._update(phone, access=None, access_exp=None, refresh=None, refresh_exp=None)
+            res.raise_for_status()
+            return self._store_tokens(phone, res.json(), keep_refresh=refresh)
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            print(f"⚠️ Token refresh failed for {phone}: {e}")
+            self._count("refresh_failures")
+            return None
+
+    def reject(self, phone):
+        """The backend refused the access token; the next access_token() call refreshes it."""
+        self._count("rejected_tokens")
+        self._update(phone, access=None, access_exp=None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["farmers"] = self._conn().execute("SELECT COUNT(*) FROM farmer_auth").fetchone()[0]
+        return stats
@@ -0,0 +1,73 @@
+"""
+Benchmark: indexed CommodityResolver vs. the old difflib.get_close_matches lookup,
+over the farmer-input corpus in fixtures/farmer_inputs.tsv.
+
+    python -m benchmarks.bench_commodity_resolver [--repeat 200]
+"""
+import os
+import time
+import argparse
+
+from agmarknet import closest_commodity
+from commodity_resolver import SEED_COMMODITIES, CommodityResolver, catalog_aliases
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures', 'farmer_inputs.tsv')
+
+# Same table as app.PRODUCTS_BY_CATEGORY; repeated here so the benchmark does not import the app
+PRODUCTS_BY_CATEGORY = {
+    "Fruits": ["Apple", "Mango", "Banana", "Grapes", "Orange", "Pineapple", "Papaya", "Guava", "Watermelon", "Pomegranate"],
+    "Vegetables": ["Potato", "Onion", "Tomato", "Carrot", "Cauliflower", "Brinjal", "Spinach", "Cabbage", "Lady Finger", "Beetroot"],
+    "Organic": ["Organic Honey", "Organic Tea", "Organic Rice", "Organic Turmeric", "Organic Jaggery", "Organic Wheat"],
+    "Dairy & Eggs": ["Milk", "Cheese", "Butter", "Eggs", "Curd", "Paneer", "Ghee"],
+    "Grains & Pulses": ["Wheat", "Rice", "Maize", "Arhar Dal", "Moong Dal", "Chana Dal", "Urad Dal", "Masoor Dal", "Barley", "Bajra"],
+}
+
+
+def load_corpus():
+    pairs = []
+    with open(CORPUS, encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            text, _, expected = line.rstrip('\n').partition('\t')
+            pairs.append((text, expected or None))
+    return pairs
+
+
+def run(name, lookup, corpus, repeat):
+    correct = sum(lookup(text) == expected for text, expected in corpus)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text, _ in corpus:
+            lookup(text)
+    per_lookup = (time.perf_counter() - started) / (repeat * len(corpus))
+    print(f"{name:<28}{correct:>4}/{len(corpus):<5}{per_lookup * 1e6:>12.1f}")
+    return per_lookup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--show-misses', action='store_true')
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    started = time.perf_counter()
+    resolver = CommodityResolver(aliases=catalog_aliases(PRODUCTS_BY_CATEGORY))
+    print(f"index build: {(time.perf_counter() - started) * 1000:.1f} ms, {resolver.stats()}")
+
+    print(f"{'lookup':<28}{'correct':>10}{'µs/lookup':>12}")
+    baseline = run("difflib (old)", lambda t: closest_commodity(t, SEED_COMMODITIES), corpus, max(1, args.repeat // 20))
+    cold = run("resolver (uncached)", lambda t: resolver._resolve_normalized(t.lower().strip()), corpus, max(1, args.repeat // 20))
+    warm = run("resolver (memoized)", resolver.resolve, corpus, args.repeat)
+    print(f"speedup: {baseline / cold:.0f}x uncached, {baseline / warm:.0f}x memoized")
+
+    if args.show_misses:
+        for text, expected in corpus:
+            got = resolver.resolve(text)
+            if got != expected:
+                print(f"  {text!r}: expected {expected!r}, got {got!r}")
+
+
+if __name__ == '__main__':
+    main()
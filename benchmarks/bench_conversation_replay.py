@@ -0,0 +1,167 @@
+"""
+Replay recorded WhatsApp webhook payloads through the conversation state machine,
+offline. The backend, price lookups, weather forecasts and WhatsApp sends are
+replaced by in-memory fakes, so this measures the engine and handlers themselves.
+
+    python -m benchmarks.bench_conversation_replay [--copies 200] [--transcript]
+
+Each copy replays fixtures/webhooks/conversations.jsonl with the phone numbers
+made unique, so copies are independent conversations. Before the replay, the
+webhook's raw-body pre-check is run over those payloads and the status-only
+deliveries in fixtures/webhooks/statuses.jsonl: it must keep the former and
+skip the latter.
+"""
+import os
+import json
+import time
+import argparse
+
+import requests
+
+os.environ.setdefault('SESSION_STORE', 'memory')   # must be set before app is imported
+
+import app  # noqa: E402
+from auth_manager import AuthManager  # noqa: E402
+from weather import ForecastCache  # noqa: E402
+from state_machine import Turn  # noqa: E402
+from webhook_events import has_messages  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures', 'webhooks')
+PAYLOADS = os.path.join(FIXTURES, 'conversations.jsonl')
+STATUS_PAYLOADS = os.path.join(FIXTURES, 'statuses.jsonl')
+
+# Farmers the fake backend already knows, with their passwords
+KNOWN_FARMERS = {"919800000002": "secret456", "919800000004": "rightpass"}
+CANNED_PRICE = {"median": 2370, "markets": 11, "per_kg": 23.7}
+CANNED_FORECAST = {
+    "current": {"temp_c": 31.0, "humidity": 62, "wind_kmh": 9.0, "code": 2},
+    "days": [{"date": "2024-06-10", "code": 2, "min_c": 24.0, "max_c": 35.0, "rain_mm": 0.0, "rain_chance": 10},
+             {"date": "2024-06-11", "code": 63, "min_c": 23.0, "max_c": 31.0, "rain_mm": 12.5, "rain_chance": 80}],
+}
+
+
+def load_messages():
+    messages = []
+    with open(PAYLOADS, encoding='utf-8') as f:
+        for line in f:
+            payload = json.loads(line)
+            for entry in payload.get('entry', []):
+                for change in entry.get('changes', []):
+                    messages.extend(change.get('value', {}).get('messages', []))
+    return messages
+
+
+def check_precheck():
+    """has_messages() must keep every message delivery and skip every status-only one."""
+    with open(PAYLOADS, 'rb') as f:
+        missed = sum(1 for line in f if not has_messages(line))
+    with open(STATUS_PAYLOADS, 'rb') as f:
+        statuses = f.read().splitlines()
+    parsed = sum(1 for line in statuses if has_messages(line))
+    print(f"webhook pre-check: {missed} message deliveries missed, {parsed} of {len(statuses)} status deliveries parsed")
+    if missed or parsed:
+        raise SystemExit("webhook pre-check misclassified a fixture")
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.payload = payload
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error")
+
+
+class FakeBackend:
+    """Answers the auth endpoints AuthManager calls, from an in-memory farmer table."""
+
+    def __init__(self):
+        self.farmers = {}
+
+    @staticmethod
+    def base_phone(phone):
+        return phone[-12:]
+
+    def password(self, phone):
+        return self.farmers.get(phone) or KNOWN_FARMERS.get(self.base_phone(phone))
+
+    def get(self, path, **kwargs):
+        phone = path.rstrip('/').rsplit('/', 1)[-1]
+        return FakeResponse(200, {"exists": self.password(phone) is not None})
+
+    def post(self, path, json=None, **kwargs):
+        if path.endswith('/refresh/'):
+            return FakeResponse(200, {"access": f"token-{json['refresh']}"})
+        phone = json['username']
+        if self.password(phone) is None or json['password'] != self.password(phone):
+            return FakeResponse(401, {"detail": "No active account found with the given credentials"})
+        return FakeResponse(200, {"access": f"token-{phone}", "refresh": f"refresh-{phone}"})
+
+
+def install_fakes():
+    """Point the app's backend and price calls at in-memory fakes."""
+    backend = FakeBackend()
+
+    def register_farmer_api(data):
+        backend.farmers[data['phone_number']] = data['password']
+        return {"id": len(backend.farmers)}
+
+    app.auth_manager = AuthManager(backend, ':memory:')
+    app.register_farmer_api = register_farmer_api
+    app.add_produce_api = lambda produce, token: {"id": 1}
+    app.get_price_statistics = lambda state, commodity, window_days=None: CANNED_PRICE
+    app.weather_provider.fetch = lambda lat, lon: CANNED_FORECAST
+    app.forecast_cache = ForecastCache(':memory:')
+
+
+def replay(messages, copies, transcript=False):
+    machine = app.conversation
+    sessions = {}
+    delivered = []
+    started = time.perf_counter()
+    for copy in range(copies):
+        for message in messages:
+            if copy:
+                message = dict(message, **{'from': f"{copy}{message['from']}"})
+            session = sessions.setdefault(message['from'], {"data": {}})
+            turn = Turn.from_message(message, session, deliver=delivered.extend)
+            transition = machine.dispatch(turn)
+            delivered.extend(transition.replies)
+            if transcript and not copy:
+                print(f"{turn.phone} [{transition.from_state} -> {transition.to_state}] {turn.body!r}")
+                for reply in transition.replies:
+                    print(f"    <- {reply.kind}: {reply.body[:70]!r}")
+    elapsed = time.perf_counter() - started
+    return elapsed, len(delivered), sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--copies', type=int, default=200)
+    parser.add_argument('--transcript', action='store_true', help="Print the first copy's conversations")
+    args = parser.parse_args()
+
+    check_precheck()
+    install_fakes()
+    messages = load_messages()
+    elapsed, replies, sessions = replay(messages, args.copies, args.transcript)
+    total = len(messages) * args.copies
+
+    final_states = {}
+    for session in sessions.values():
+        final_states[session.get('state')] = final_states.get(session.get('state'), 0) + 1
+    print(f"\nreplayed {total} messages ({len(sessions)} conversations) in {elapsed * 1000:.1f} ms: "
+          f"{total / elapsed:,.0f} msgs/s, {replies} replies")
+    print(f"final states: {final_states}")
+    print(f"{'handler':<28}{'ok':>7}{'err':>5}{'avg_ms':>9}{'p95_ms':>9}{'max_ms':>9}")
+    for name, stats in sorted(app.conversation.stats().items()):
+        print(f"{name:<28}{stats['ok']:>7}{stats['error']:>5}{stats['avg_ms']:>9}{stats['p95_ms']:>9}{stats['max_ms']:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Micro-benchmark: streaming grid parser vs. the original BeautifulSoup path,
+on the recorded Agmarknet pages in fixtures/agmarknet.
+
+    python -m benchmarks.bench_grid_parser [--repeat 20]
+"""
+import os
+import time
+import argparse
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from grid_parser import parse_price_rows
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures', 'agmarknet')
+PAGES = ['results_tomato_KL.html', 'results_onion_KL.html', 'results_potato_UP.html']
+
+
+def beautifulsoup_modal_prices(page_source):
+    """The pre-grid-parser scrape: soup the whole page and read column 10 of every row."""
+    soup = BeautifulSoup(page_source, 'html.parser')
+    rows = soup.find_all("tr")
+    prices = []
+    for row in rows[1:]:
+        cols = [td.get_text(strip=True) for td in row.find_all("td")]
+        if len(cols) >= 11:
+            try:
+                prices.append(int(cols[10]))
+            except ValueError:
+                continue
+    return prices
+
+
+def streaming_modal_prices(page_source):
+    return [row.modal_price for row in parse_price_rows(page_source)]
+
+
+def measure(func, html, repeat):
+    func(html)  # warm-up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func(html)
+    per_call = (time.perf_counter() - started) / repeat
+
+    tracemalloc.start()
+    func(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, per_call, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'page':<26}{'rows':>6}{'bs4 ms':>10}{'stream ms':>11}{'speedup':>9}{'bs4 peak KB':>13}{'stream peak KB':>16}")
+    for name in PAGES:
+        with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+            html = f.read()
+        baseline, base_time, base_peak = measure(beautifulsoup_modal_prices, html, args.repeat)
+        streamed, stream_time, stream_peak = measure(streaming_modal_prices, html, args.repeat)
+        assert baseline == streamed, f"parsers disagree on {name}"
+        print(f"{name:<26}{len(streamed):>6}{base_time * 1000:>10.2f}{stream_time * 1000:>11.2f}"
+              f"{base_time / stream_time:>8.1f}x{base_peak / 1024:>13.0f}{stream_peak / 1024:>16.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,505 @@
+"""
+Load test: the real app under gunicorn, with every outside service replaced by a
+local stub (stubs/graph.py, backend.py, qa.py, agmarknet.py, weather.py), so it runs offline.
+
+    python -m benchmarks.load_test [--configs 1x8,2x4] [--farmers 60] [--graph-latency 0.15]
+                                   [--error-rate 0.02] [--json] [--fail-p95-ms 3000]
+
+For each worker config ("WxT": W gunicorn workers with T threads each) a fresh
+gunicorn is started against fresh stubs and an empty cache directory. Concurrent
+farmers then POST Meta-format webhook deliveries to /webhook and wait for the
+bot's reply to arrive at the Graph stub before sending their next message:
+
+    onboarding   new farmer: hi, language, name, address, password, bulk listing, confirm
+    listing      returning farmer: log in, list one crop step by step
+    voice        returning farmer: log in, ask a voice doubt, wait for the answer
+    weather      returning farmer: log in, ask for the forecast for one of LOCATIONS
+
+while /notify-farmer bursts run alongside. Reported per config: webhook ack and
+reply latency (p50/p95/p99), answer latency for voice doubts, messages/sec and
+peak RSS of the gunicorn workers (VmHWM, plus the highest sum of VmRSS seen),
+with the time gunicorn took to serve /stats, and how many forecasts the weather
+stub served. --preload starts gunicorn with --preload.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import shutil
+import tempfile
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from job_queue import summarize_latencies
+from stubs import agmarknet as agmarknet_stub
+from stubs import backend as backend_stub
+from stubs import graph as graph_stub
+from stubs import qa as qa_stub
+from stubs import weather as weather_stub
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MENU = "What would you like to do"
+PRICE_REPLIES = ("expected price", "Couldn't predict", "Error predicting")
+DOUBT_ACKS = ("Got your question", "still answering", "Lots of questions")
+DOUBT_ANSWERS = ("📝 Q:", "Failed to get answer", "Couldn't download")
+WEATHER_REPLIES = ("🌦️ Weather", "Couldn't get the weather", "Couldn't find")
+
+# Several spellings per place, so farmers share forecast grid cells
+LOCATIONS = ["Pune", "Poona", "पुणे", "Meerut", "Village Rampur, Dist. Meerut", "Nashik", "Kochi, Kerala"]
+
+# (latency label, message kind, body, replies that end the turn)
+# kind None sends nothing and waits for a reply to the previous message; until None
+# means any reply will do (audio prompts carry no text to match).
+LOGIN = [
+    ("greeting", "text", "hi", None),
+    ("language", "text", "1", None),
+    ("password", "text", "{password}", (MENU,)),
+]
+SCENARIOS = {
+    "onboarding": [
+        ("greeting", "text", "hi", None),
+        ("language", "text", "1", None),
+        ("name", "text", "Load Farmer {n}", None),
+        ("address", "text", "Village {n}, Dist. Meerut", None),
+        ("password", "text", "{password}", (MENU,)),
+        ("bulk_listing", "text", "Tomato 20kg ₹30, Onion 50kg ₹22", ("Reply *YES*",)),
+        ("listing_confirm", "text", "yes", (MENU,)),
+    ],
+    "listing": LOGIN + [
+        ("menu", "text", "1", ("What crop",)),
+        ("crop_name", "text", "Tomato", PRICE_REPLIES),
+        ("price", "text", "24", None),
+        ("quantity", "text", "150", None),
+        ("more_crops", "text", "no", (MENU,)),
+    ],
+    "voice": LOGIN + [
+        ("menu", "text", "2", ("send your question",)),
+        ("voice_doubt", "audio", None, DOUBT_ACKS),
+        ("answer", None, None, DOUBT_ANSWERS),
+    ],
+    "weather": LOGIN + [
+        ("menu", "text", "3", ("weather forecast",)),
+        ("location", "text", "{location}", WEATHER_REPLIES),
+    ],
+}
+
+# Every cache/state file the app writes, pointed into the run's temp dir
+PATH_VARS = {
+    "SESSION_DB_PATH": "sessions.sqlite3", "WEBHOOK_DEDUP_PATH": "webhook_dedup.sqlite3",
+    "COMMODITY_OPTIONS_PATH": "commodity_options.json", "PRICE_CACHE_PATH": "prices.sqlite3",
+    "PREFETCH_LOCK_PATH": "prefetch.lock", "MEDIA_CACHE_PATH": "media_ids.json",
+    "ANSWER_CACHE_PATH": "answers.sqlite3", "AUTH_DB_PATH": "auth.sqlite3",
+    "BROADCAST_DB_PATH": "broadcasts.sqlite3", "PROFILE_DIR": "profiles",
+    "WEATHER_CACHE_PATH": "weather.sqlite3",
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def webhook_payload(message):
+    return {"object": "whatsapp_business_account", "entry": [{"id": "load-test", "changes": [{
+        "field": "messages",
+        "value": {"messaging_product": "whatsapp",
+                  "metadata": {"display_phone_number": "15550000000", "phone_number_id": "load-test"},
+                  "contacts": [{"profile": {"name": "Load Farmer"}, "wa_id": message["from"]}],
+                  "messages": [message]},
+    }]}]}
+
+
+class RssSampler:
+    """Samples VmRSS/VmHWM of a process and its children from /proc (Linux only)."""
+
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = {}         # pid -> highest VmHWM seen
+        self.peak_total_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    @staticmethod
+    def _status(pid):
+        fields = {}
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    name, _, value = line.partition(":")
+                    if name in ("VmRSS", "VmHWM", "PPid"):
+                        fields[name] = int(value.split()[0])
+        except (OSError, ValueError):
+            return None
+        return fields
+
+    def _children(self):
+        children = []
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                status = self._status(entry)
+                if status and status.get("PPid") == self.pid:
+                    children.append(int(entry))
+        return children
+
+    def sample(self):
+        total = 0
+        for pid in [self.pid] + self._children():
+            status = self._status(pid)
+            if not status or "VmRSS" not in status:
+                continue
+            total += status["VmRSS"]
+            self.peak_kb[pid] = max(self.peak_kb.get(pid, 0), status.get("VmHWM", status["VmRSS"]))
+        self.peak_total_kb = max(self.peak_total_kb, total)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        if os.path.isdir("/proc"):
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+            self.sample()
+        return False
+
+    def report(self):
+        workers = [kb for pid, kb in self.peak_kb.items() if pid != self.pid]
+        return {
+            "master_peak_mb": round(self.peak_kb.get(self.pid, 0) / 1024, 1),
+            "worker_peak_mb": round(max(workers, default=0) / 1024, 1),
+            "total_peak_mb": round(self.peak_total_kb / 1024, 1),
+            "processes_seen": len(self.peak_kb),
+        }
+
+
+def quiet_disconnects(server):
+    """Don't print tracebacks for keep-alive connections gunicorn drops when it stops."""
+    handle_error = server.handle_error
+
+    def handle(request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            handle_error(request, client_address)
+    server.handle_error = handle
+    return server
+
+
+class Stubs:
+    """All five stand-ins, in this process, and the app environment pointing at them."""
+
+    def __init__(self, args, known_farmers):
+        self.graph, self.graph_url = graph_stub.serve_in_thread(
+            latency=args.graph_latency, error_rate=args.error_rate, throttle=args.throttle)
+        self.backend, self.backend_url = backend_stub.serve_in_thread(
+            latency=args.backend_latency, error_rate=args.error_rate, farmers=known_farmers)
+        self.qa, self.qa_url = qa_stub.serve_in_thread(latency=args.qa_latency, error_rate=args.error_rate)
+        self.agmarknet, self.agmarknet_url = agmarknet_stub.serve_in_thread(
+            latency=args.agmarknet_latency, error_rate=args.error_rate)
+        self.weather, self.weather_url = weather_stub.serve_in_thread(
+            latency=args.weather_latency, error_rate=args.error_rate)
+        for server in self.servers():
+            quiet_disconnects(server)
+        self.messages = self.graph.RequestHandlerClass
+        self.media_url = f"http://127.0.0.1:{self.graph.server_address[1]}/media/voice.ogg"
+
+    def servers(self):
+        return (self.graph, self.backend, self.qa, self.agmarknet, self.weather)
+
+    def forecasts_served(self):
+        return sum(self.weather.RequestHandlerClass.requests.values())
+
+    def env(self, cache_dir):
+        env = dict(os.environ)
+        env.update({
+            "GRAPH_API_URL": self.graph_url, "ACCESS_TOKEN": "load-test-token",
+            "WHATSAPP_PHONE_NUMBER_ID": "load-test", "VERIFY_TOKEN": "load-test",
+            "BACKEND_API_BASE_URL": self.backend_url, "QA_CHAT_URL": self.qa_url,
+            "AGMARKNET_URL": self.agmarknet_url, "AGMARKNET_ENGINE": "http", "WEATHER_API_URL": self.weather_url,
+            "MEDIA_PRELOAD": "0", "SESSION_STORE": "sqlite", "PYTHONUNBUFFERED": "1",
+        })
+        env.update({name: os.path.join(cache_dir, filename) for name, filename in PATH_VARS.items()})
+        return env
+
+    def shutdown(self):
+        for server in self.servers():
+            server.shutdown()
+            server.server_close()
+
+
+class Gunicorn:
+    def __init__(self, workers, threads, env, log_path, preload=False, boot_timeout=90):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._log = open(log_path, "w")
+        command = [sys.executable, "-m", "gunicorn", "app:create_app()", "-w", str(workers),
+                   "--threads", str(threads), "-b", f"127.0.0.1:{self.port}", "--timeout", "120", "--log-level", "info"]
+        if preload:
+            command.append("--preload")
+        started = time.monotonic()
+        self.process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=self._log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + boot_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with {self.process.returncode}, see {log_path}")
+            try:
+                if requests.get(f"{self.url}/stats", timeout=2).ok:
+                    self.boot_seconds = round(time.monotonic() - started, 2)
+                    return
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.25)
+        self.stop()
+        raise RuntimeError(f"gunicorn did not come up within {boot_timeout}s, see {log_path}")
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self._log.close()
+
+
+class LoadRun:
+    def __init__(self, app_url, stubs, step_timeout):
+        self.app_url = app_url
+        self.stubs = stubs
+        self.step_timeout = step_timeout
+        self.lock = threading.Lock()
+        self.acks = []
+        self.replies = {}       # step label -> [seconds]
+        self.notifies = []
+        self.sent = 0
+        self.errors = {}        # reason -> count
+        self.completed = {}     # scenario -> finished conversations
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _error(self, reason):
+        with self.lock:
+            self.errors[reason] = self.errors.get(reason, 0) + 1
+
+    def post_message(self, phone, kind, body):
+        message = {"from": phone, "id": f"wamid.load{uuid.uuid4().hex}", "timestamp": str(int(time.time())),
+                   "type": kind}
+        if kind == "audio":
+            message["audio"] = {"id": uuid.uuid4().hex, "mime_type": "audio/ogg; codecs=opus",
+                                "url": self.stubs.media_url}
+        else:
+            message["text"] = {"body": body}
+        started = time.monotonic()
+        response = self._session().post(f"{self.app_url}/webhook", json=webhook_payload(message), timeout=30)
+        with self.lock:
+            self.acks.append(time.monotonic() - started)
+            self.sent += 1
+        if response.status_code != 200:
+            self._error(f"webhook_{response.status_code}")
+        return started
+
+    def wait_reply(self, phone, seen, until, since):
+        """Seconds from `since` to the first new reply matching `until`, and the new reply count; None on timeout."""
+        deadline = time.monotonic() + self.step_timeout
+        count = seen
+        while True:
+            replies = self.stubs.messages.wait_for(phone, count, deadline - time.monotonic())
+            if replies is None:
+                return None, count
+            for at, _, _, text in replies[count:]:
+                if until is None or any(marker in (text or "") for marker in until):
+                    return at - since, len(replies)
+            count = len(replies)
+
+    def converse(self, scenario, phone, n, password):
+        seen = 0
+        sent_at = None
+        for label, kind, body, until in SCENARIOS[scenario]:
+            if kind is not None:
+                seen = len(self.stubs.messages.replies_to(phone))
+                text = (body or "").format(n=n, password=password, location=LOCATIONS[n % len(LOCATIONS)])
+                sent_at = self.post_message(phone, kind, text)
+            elapsed, seen = self.wait_reply(phone, seen, until, sent_at)
+            if elapsed is None:
+                self._error(f"timeout_{scenario}_{label}")
+                return
+            with self.lock:
+                self.replies.setdefault(label, []).append(elapsed)
+        with self.lock:
+            self.completed[scenario] = self.completed.get(scenario, 0) + 1
+
+    def notify_bursts(self, phones, size, every, stop):
+        """POST `size` concurrent /notify-farmer calls every `every` seconds until `stop` is set."""
+        def notify(phone):
+            started = time.monotonic()
+            try:
+                response = self._session().post(f"{self.app_url}/notify-farmer", timeout=30, json={
+                    "phone_number": phone, "items": [{"produce": "Tomato", "quantity_bought": 20, "remaining_stock": 80}]})
+                if response.status_code != 200:
+                    self._error(f"notify_{response.status_code}")
+            except requests.exceptions.RequestException:
+                self._error("notify_failed")
+                return
+            with self.lock:
+                self.notifies.append(time.monotonic() - started)
+
+        with ThreadPoolExecutor(max_workers=size) as pool:
+            burst = 0
+            while not stop.wait(every if burst else 0):
+                list(pool.map(notify, [phones[(burst * size + i) % len(phones)] for i in range(size)]))
+                burst += 1
+
+
+def run_config(workers, threads, args):
+    run_id = uuid.uuid4().int % 10 ** 6
+    scenarios = [name for name in SCENARIOS for _ in range(args.mix[name])]
+    farmers = []
+    for n in range(args.farmers):
+        scenario = scenarios[n % len(scenarios)]
+        farmers.append((scenario, f"91{run_id:06d}{n:04d}", n, f"pass{n}"))
+    known = {phone: password for scenario, phone, _, password in farmers if scenario != "onboarding"}
+    notify_phones = [f"91{run_id:06d}9{n:03d}" for n in range(max(args.burst_size, 1))]
+
+    stubs = Stubs(args, known)
+    cache_dir = tempfile.mkdtemp(prefix="agrikart-load-")
+    server = None
+    try:
+        server = Gunicorn(workers, threads, stubs.env(cache_dir), os.path.join(cache_dir, "gunicorn.log"),
+                          preload=args.preload)
+        run = LoadRun(server.url, stubs, args.step_timeout)
+        stop = threading.Event()
+        bursts = threading.Thread(target=run.notify_bursts, daemon=True,
+                                  args=(notify_phones, args.burst_size, args.burst_every, stop))
+        with RssSampler(server.process.pid) as rss:
+            started = time.monotonic()
+            if args.burst_size:
+                bursts.start()
+            with ThreadPoolExecutor(max_workers=args.farmers) as pool:
+                for i, farmer in enumerate(farmers):
+                    pool.submit(run.converse, *farmer)
+                    time.sleep(args.ramp / max(len(farmers), 1))
+            stop.set()
+            if bursts.is_alive():
+                bursts.join()
+            elapsed = time.monotonic() - started
+        every_reply = [s for label, samples in run.replies.items() if label != "answer" for s in samples]
+        return {
+            "config": f"{workers}x{threads}", "workers": workers, "threads": threads, "preload": args.preload,
+            "boot_seconds": server.boot_seconds,
+            "farmers": len(farmers), "completed": run.completed, "errors": run.errors,
+            "messages": run.sent, "seconds": round(elapsed, 2), "msgs_per_sec": round(run.sent / elapsed, 2),
+            "webhook_ack": summarize_latencies(run.acks),
+            "reply": summarize_latencies(every_reply),
+            "answer": summarize_latencies(run.replies.get("answer", [])),
+            "notify_farmer": summarize_latencies(run.notifies),
+            "steps": {label: summarize_latencies(samples) for label, samples in sorted(run.replies.items())},
+            "weather_lookups": run.completed.get("weather", 0), "forecasts_fetched": stubs.forecasts_served(),
+            "rss": rss.report(),
+        }
+    finally:
+        if server is not None:
+            server.stop()
+        stubs.shutdown()
+        if args.keep_logs:
+            print(f"📁 Logs and caches for {workers}x{threads} kept in {cache_dir}")
+        else:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def parse_configs(text):
+    configs = []
+    for part in text.split(","):
+        workers, _, threads = part.strip().lower().partition("x")
+        configs.append((int(workers), int(threads or 1)))
+    return configs
+
+
+def parse_mix(text):
+    mix = dict.fromkeys(SCENARIOS, 0)
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in mix:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}")
+        mix[name.strip()] = int(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("the mix needs at least one scenario")
+    return mix
+
+
+def print_table(results):
+    print(f"\n{'config':<8}{'boot_s':>7}{'msgs':>6}{'msg/s':>8}{'ack_p50':>9}{'ack_p99':>9}{'rpl_p50':>9}"
+          f"{'rpl_p95':>9}{'rpl_p99':>9}{'ans_p95':>9}{'ntf_p95':>9}{'wrk_MB':>8}{'tot_MB':>8}{'errors':>8}")
+    for r in results:
+        print(f"{r['config']:<8}{r['boot_seconds']:>7}{r['messages']:>6}{r['msgs_per_sec']:>8}"
+              f"{r['webhook_ack']['p50_ms']:>9}{r['webhook_ack']['p99_ms']:>9}{r['reply']['p50_ms']:>9}{r['reply']['p95_ms']:>9}"
+              f"{r['reply']['p99_ms']:>9}{r['answer']['p95_ms']:>9}{r['notify_farmer']['p95_ms']:>9}"
+              f"{r['rss']['worker_peak_mb']:>8}{r['rss']['total_peak_mb']:>8}{sum(r['errors'].values()):>8}")
+    for r in results:
+        print(f"\n{r['config']}: completed {r['completed']}, errors {r['errors'] or 'none'}, "
+              f"forecasts fetched {r['forecasts_fetched']} for {r['weather_lookups']} weather lookups")
+        print(f"  {'step':<16}{'count':>7}{'p50_ms':>9}{'p95_ms':>9}{'p99_ms':>9}{'max_ms':>9}")
+        for label, s in r['steps'].items():
+            print(f"  {label:<16}{s['count']:>7}{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}{s['max_ms']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--configs', type=parse_configs, default=parse_configs("1x8,2x4"),
+                        help='Comma-separated gunicorn configs, WORKERSxTHREADS')
+    parser.add_argument('--farmers', type=int, default=60, help='Concurrent conversations per config')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix("onboarding=1,listing=1,voice=1,weather=1"),
+                        help='Scenario weights, e.g. onboarding=1,listing=2,voice=1,weather=1')
+    parser.add_argument('--ramp', type=float, default=2.0, help='Seconds over which the farmers start')
+    parser.add_argument('--step-timeout', type=float, default=60.0, help='Seconds to wait for each reply')
+    parser.add_argument('--burst-size', type=int, default=20, help='/notify-farmer calls per burst (0: none)')
+    parser.add_argument('--burst-every', type=float, default=2.0, help='Seconds between bursts')
+    parser.add_argument('--graph-latency', type=float, default=0.1)
+    parser.add_argument('--backend-latency', type=float, default=0.05)
+    parser.add_argument('--qa-latency', type=float, default=2.0)
+    parser.add_argument('--agmarknet-latency', type=float, default=0.3)
+    parser.add_argument('--weather-latency', type=float, default=0.3)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of stub requests that fail (0-1)')
+    parser.add_argument('--throttle', action='store_true', help='Graph stub fails with 429s instead of 500s')
+    parser.add_argument('--preload', action='store_true', help='Start gunicorn with --preload')
+    parser.add_argument('--keep-logs', action='store_true', help="Keep each run's gunicorn log and caches")
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    parser.add_argument('--fail-p95-ms', type=float, default=None,
+                        help='Exit with status 1 if any config has a reply p95 above this')
+    args = parser.parse_args()
+
+    results = []
+    for workers, threads in args.configs:
+        print(f"🚀 {workers} worker(s) x {threads} thread(s), {args.farmers} farmers...", file=sys.stderr)
+        results.append(run_config(workers, threads, args))
+
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        print_table(results)
+
+    if args.fail_p95_ms is not None:
+        slow = [r['config'] for r in results if r['reply']['p95_ms'] > args.fail_p95_ms]
+        if slow:
+            print(f"❌ reply p95 above {args.fail_p95_ms} ms for {', '.join(slow)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+import os
+import time
+import uuid
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from local_state import SqliteConnection
+
+SENT = "sent"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class TokenBucket:
+    """
+    `rate` sends per second with bursts of up to `burst`, shared by every thread
+    that calls acquire(). WhatsApp limits throughput per business number, so all
+    broadcasts in a process draw from one bucket.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def acquire(self):
+        """Take one token, sleeping until one is available; returns the seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Tokens may go negative: that reserves a future slot for this caller
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited += wait
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+def _quantity(value):
+    """A kg amount from JSON (number or numeric string) as int/float, or None if it isn't one."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+    if not isinstance(value, (int, float)) or value != value or value < 0:
+        return None
+    return int(value) if value == int(value) else value
+
+
+def parse_order_items(items, where="items"):
+    """
+    Checked copy of an order's items, with the quantities as numbers so they can be added up.
+    Raises ValueError naming the bad field, e.g. "items[1].quantity_bought must be a number".
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError(f"{where} must be a non-empty list")
+    parsed = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f"{where}[{i}] must be an object")
+        if not isinstance(item.get('produce'), str) or not item['produce'].strip():
+            raise ValueError(f"{where}[{i}].produce is required")
+        item = dict(item)
+        for field in ('quantity_bought', 'remaining_stock'):
+            item[field] = _quantity(item.get(field))
+            if item[field] is None:
+                raise ValueError(f"{where}[{i}].{field} must be a number")
+        parsed.append(item)
+    return parsed
+
+
+def parse_orders(orders):
+    """Checked copy of a bulk notification's orders; raises ValueError naming the bad field."""
+    if not isinstance(orders, list) or not orders:
+        raise ValueError("orders must be a non-empty list")
+    parsed = []
+    for i, order in enumerate(orders):
+        if not isinstance(order, dict) or not order.get('phone_number'):
+            raise ValueError(f"orders[{i}].phone_number is required")
+        parsed.append(dict(order, items=parse_order_items(order.get('items'), f"orders[{i}].items")))
+    return parsed
+
+
+def _text(value):
+    return isinstance(value, str) and bool(value.strip())
+
+
+def parse_alerts(data):
+    """
+    Checked list of price alerts from a request body: either {"alerts": [{"phone_number",
+    "commodity", "state"?}, ...]} or one crop for many farmers, {"phone_numbers": [...],
+    "commodity", "state"?}. Raises ValueError naming the bad field.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("body must be an object")
+    alerts = data.get('alerts')
+    if alerts is None:
+        if not _text(data.get('commodity')):
+            raise ValueError("alerts or commodity is required")
+        phones = data.get('phone_numbers')
+        if not isinstance(phones, list) or not phones:
+            raise ValueError("phone_numbers must be a non-empty list")
+        for i, phone in enumerate(phones):
+            if not _text(phone):
+                raise ValueError(f"phone_numbers[{i}] must be a string")
+        if data.get('state') is not None and not _text(data['state']):
+            raise ValueError("state must be a string")
+        return [{'phone_number': phone, 'commodity': data['commodity'], 'state': data.get('state')}
+                for phone in phones]
+    if not isinstance(alerts, list) or not alerts:
+        raise ValueError("alerts must be a non-empty list")
+    for i, alert in enumerate(alerts):
+        if not isinstance(alert, dict):
+            raise ValueError(f"alerts[{i}] must be an object")
+        for field in ('phone_number', 'commodity'):
+            if not _text(alert.get(field)):
+                raise ValueError(f"alerts[{i}].{field} is required")
+        if alert.get('state') is not None and not _text(alert['state']):
+            raise ValueError(f"alerts[{i}].state must be a string")
+    return [dict(alert) for alert in alerts]
+
+
+def merge_orders(orders):
+    """
+    Group order notifications by farmer: {phone: [items]} in first-seen order.
+    A produce sold in several orders becomes one line with the quantities added
+    up and the stock left after the last of them. Orders come from parse_orders().
+    """
+    merged = OrderedDict()
+    for order in orders:
+        items = merged.setdefault(order['phone_number'], OrderedDict())
+        for item in order.get('items', []):
+            line = items.get(item['produce'])
+            if line is None:
+                items[item['produce']] = dict(item)
+            else:
+                line['quantity_bought'] = line['quantity_bought'] + item['quantity_bought']
+                line['remaining_stock'] = item['remaining_stock']
+    return OrderedDict((phone, list(items.values())) for phone, items in merged.items())
+
+
+class Broadcaster:
+    """
+    Sends one text to each of many farmers without holding up the request that
+    asked for it.
+
+    submit() queues a broadcast and returns its id straight away. A dispatcher
+    thread runs broadcasts one after another, fanning each out over `workers`
+    sending threads that all take from one TokenBucket. Every recipient's
+    outcome (sent, failed or skipped) is written to SQLite, so status() answers
+    from any worker process. When a broadcast finishes, its report goes to
+    notify(callback_url, report) if it was submitted with a callback URL.
+
+    `messages` is a list of (phone, text) or a callable returning one. A callable
+    runs on the dispatcher thread, so slow preparation such as price lookups is
+    kept out of the request. A text of None marks that recipient as skipped.
+    """
+
+    def __init__(self, send, path, rate=20, burst=None, workers=16, max_queued=20, notify=None,
+                 keep_days=7, flush_every=200):
+        self.send = send
+        self.path = path
+        self.bucket = TokenBucket(rate, burst)
+        self.workers = workers
+        self.notify = notify
+        self.keep_days = keep_days
+        self.flush_every = flush_every
+
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._conn = SqliteConnection(path, [
+            "CREATE TABLE IF NOT EXISTS broadcasts ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, callback_url TEXT,"
+            " created_at REAL NOT NULL, started_at REAL, finished_at REAL, error TEXT)",
+            "CREATE TABLE IF NOT EXISTS broadcast_recipients ("
+            " broadcast_id TEXT NOT NULL, phone TEXT NOT NULL, status TEXT NOT NULL,"
+            " error TEXT, updated_at REAL NOT NULL, PRIMARY KEY (broadcast_id, phone))"])
+        self._counters = {"submitted": 0, "rejected": 0, "completed": 0,
+                          SENT: 0, FAILED: 0, SKIPPED: 0, "callback_errors": 0}
+
+    # --- SQLite layer ---
+    def _execute(self, sql, params=(), many=False):
+        with self._lock:
+            db = self._conn()
+            if many:
+                db.executemany(sql, params)
+            else:
+                db.execute(sql, params)
+            db.commit()
+
+    def _purge(self):
+        cutoff = time.time() - self.keep_days * 86400
+        self._execute("DELETE FROM broadcast_recipients WHERE broadcast_id IN"
+                      " (SELECT id FROM broadcasts WHERE created_at < ?)", (cutoff,))
+        self._execute("DELETE FROM broadcasts WHERE created_at < ?", (cutoff,))
+
+    # --- dispatcher ---
+    def _ensure_started(self):
+        # Threads do not survive fork(), so a new pid means a fresh dispatcher.
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._dispatch, name="broadcast", daemon=True)
+        self._thread.start()
+
+    def _dispatch(self):
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="broadcast-send") as pool:
+            while True:
+                broadcast_id, messages = self._queue.get()
+                try:
+                    self._run(pool, broadcast_id, messages)
+                except Exception as e:
+                    print(f"❌ Broadcast {broadcast_id} failed: {e}")
+                    self._execute("UPDATE broadcasts SET status = 'failed', finished_at = ?, error = ? WHERE id = ?",
+                                  (time.time(), str(e), broadcast_id))
+                    self._report(broadcast_id)
+
+    def _send_one(self, message):
+        phone, text = message
+        if text is None:
+            return phone, SKIPPED, None
+        self.bucket.acquire()
+        try:
+            ok = self.send(phone, text)
+        except Exception as e:
+            return phone, FAILED, str(e)
+        return phone, (SENT if ok else FAILED), (None if ok else "rejected by WhatsApp")
+
+    def _run(self, pool, broadcast_id, messages):
+        started = time.time()
+        self._execute("UPDATE broadcasts SET status = 'running', started_at = ? WHERE id = ?",
+                      (started, broadcast_id))
+        if callable(messages):
+            messages = messages()
+        unique = OrderedDict()
+        for phone, text in messages:
+            unique.setdefault(phone, text)   # one message per farmer per broadcast
+        messages = list(unique.items())
+        self._execute("INSERT OR REPLACE INTO broadcast_recipients (broadcast_id, phone, status, updated_at)"
+                      " VALUES (?, ?, 'pending', ?)", [(broadcast_id, phone, started) for phone, _ in messages],
+                      many=True)
+
+        done = []
+
+        def flush():
+            self._execute("UPDATE broadcast_recipients SET status = ?, error = ?, updated_at = ?"
+                          " WHERE broadcast_id = ? AND phone = ?",
+                          [(status, error, time.time(), broadcast_id, phone) for phone, status, error in done],
+                          many=True)
+            with self._lock:
+                for _, status, _ in done:
+                    self._counters[status] += 1
+            done.clear()
+
+        for result in pool.map(self._send_one, messages):
+            done.append(result)
+            if len(done) >= self.flush_every:
+                flush()
+        flush()
+
+        self._execute("UPDATE broadcasts SET status = 'done', finished_at = ? WHERE id = ?", (time.time(), broadcast_id))
+        with self._lock:
+            self._counters["completed"] += 1
+        report = self._report(broadcast_id)
+        print(f"📣 Broadcast {broadcast_id} done in {time.time() - started:.1f}s: {report['counts']}")
+
+    def _report(self, broadcast_id):
+        report = self.status(broadcast_id)
+        if report and report.get("callback_url") and self.notify is not None:
+            try:
+                self.notify(report["callback_url"], report)
+            except Exception as e:
+                print(f"⚠️ Broadcast {broadcast_id} callback failed: {e}")
+                with self._lock:
+                    self._counters["callback_errors"] += 1
+        return report
+
+    # --- public API ---
+    def submit(self, kind, messages, callback_url=None):
+        """Queue a broadcast; returns its id, or None when too many broadcasts are already waiting."""
+        broadcast_id = uuid.uuid4().hex[:16]
+        self._purge()
+        self._execute("INSERT INTO broadcasts (id, kind, status, callback_url, created_at) VALUES (?, ?, 'queued', ?, ?)",
+                      (broadcast_id, kind, callback_url, time.time()))
+        with self._lock:
+            self._ensure_started()
+        try:
+            self._queue.put_nowait((broadcast_id, messages))
+        except queue.Full:
+            self._execute("DELETE FROM broadcasts WHERE id = ?", (broadcast_id,))
+            with self._lock:
+                self._counters["rejected"] += 1
+            return None
+        with self._lock:
+            self._counters["submitted"] += 1
+        return broadcast_id
+
+    def status(self, broadcast_id, recipients=True):
+        """The broadcast's state, counts per outcome and (optionally) every recipient's result."""
+        with self._lock:
+            db = self._conn()
+            row = db.execute("SELECT kind, status, callback_url, created_at, started_at, finished_at, error"
+                             " FROM broadcasts WHERE id = ?", (broadcast_id,)).fetchone()
+            if row is None:
+                return None
+            counts = dict(db.execute("SELECT status, COUNT(*) FROM broadcast_recipients"
+                                     " WHERE broadcast_id = ? GROUP BY status", (broadcast_id,)).fetchall())
+            rows = db.execute("SELECT phone, status, error, updated_at FROM broadcast_recipients"
+                              " WHERE broadcast_id = ? ORDER BY rowid", (broadcast_id,)).fetchall() if recipients else None
+        kind, status, callback_url, created_at, started_at, finished_at, error = row
+        report = {
+            "broadcast_id": broadcast_id, "kind": kind, "status": status, "callback_url": callback_url,
+            "created_at": created_at, "started_at": started_at, "finished_at": finished_at,
+            "counts": counts, "error": error,
+        }
+        if rows is not None:
+            report["recipients"] = [{"phone_number": phone, "status": st, "error": err, "updated_at": at}
+                                    for phone, st, err, at in rows]
+        return report
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats["queued"] = self._queue.qsize()
+        stats["rate_per_sec"] = self.bucket.rate
+        stats["throttled_seconds"] = round(self.bucket.waited, 1)
+        return stats
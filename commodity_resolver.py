@@ -0,0 +1,279 @@
+import os
+import re
+import json
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from fuzzy import shortlist, similarity, trigrams, votes
+
+
+# Agmarknet ddlCommodity texts used until the live dropdown has been seen once.
+SEED_COMMODITIES = [
+    "Amaranthus", "Apple", "Arhar (Tur/Red Gram)(Whole)", "Arhar Dal(Tur Dal)", "Ash Gourd",
+    "Bajra(Pearl Millet/Cumbu)", "Banana", "Banana - Green", "Barley (Jau)", "Beetroot",
+    "Bengal Gram Dal (Chana Dal)", "Bengal Gram(Gram)(Whole)", "Bhindi(Ladies Finger)", "Bitter gourd",
+    "Black Gram (Urd Beans)(Whole)", "Black Gram Dal (Urd Dal)", "Bottle gourd", "Brinjal", "Cabbage",
+    "Capsicum", "Carrot", "Cauliflower", "Coconut", "Colacasia", "Coriander(Leaves)", "Cotton",
+    "Cowpea(Veg)", "Cucumbar(Kheera)", "Drumstick", "Elephant Yam (Suran)", "French Beans (Frasbean)",
+    "Garlic", "Ginger(Dry)", "Ginger(Green)", "Grapes", "Green Chilli", "Green Gram (Moong)(Whole)",
+    "Green Gram Dal (Moong Dal)", "Green Peas", "Groundnut", "Guava", "Gur(Jaggery)", "Jack Fruit",
+    "Jowar(Sorghum)", "Lemon", "Lentil (Masur)(Whole)", "Lime", "Litchi", "Maize", "Mango",
+    "Mango (Raw-Ripe)", "Masur Dal", "Mousambi(Sweet Lime)", "Mustard", "Onion", "Orange",
+    "Paddy(Dhan)(Common)", "Papaya", "Pear", "Pineapple", "Pomegranate", "Potato", "Pumpkin", "Radish",
+    "Ragi (Finger Millet)", "Rice", "Ridgeguard(Tori)", "Round gourd", "Snakeguard", "Soyabean",
+    "Spinach", "Sweet Potato", "Tapioca", "Tender Coconut", "Tinda", "Tomato", "Turmeric", "Water Melon",
+    "Wheat",
+]
+
+# Hindi (Devanagari) and common transliterated names -> Agmarknet commodity text.
+HINDI_ALIASES = {
+    "आलू": "Potato", "aloo": "Potato", "alu": "Potato", "batata": "Potato",
+    "प्याज": "Onion", "प्याज़": "Onion", "pyaz": "Onion", "pyaaz": "Onion", "piyaz": "Onion", "kanda": "Onion",
+    "टमाटर": "Tomato", "tamatar": "Tomato", "tamater": "Tomato",
+    "भिंडी": "Bhindi(Ladies Finger)", "bhindi": "Bhindi(Ladies Finger)", "bhendi": "Bhindi(Ladies Finger)",
+    "okra": "Bhindi(Ladies Finger)", "lady finger": "Bhindi(Ladies Finger)",
+    "गाजर": "Carrot", "gajar": "Carrot",
+    "फूलगोभी": "Cauliflower", "फूल गोभी": "Cauliflower", "phool gobhi": "Cauliflower", "phool gobi": "Cauliflower",
+    "gobhi": "Cauliflower", "gobi": "Cauliflower",
+    "पत्तागोभी": "Cabbage", "पत्ता गोभी": "Cabbage", "बंदगोभी": "Cabbage", "patta gobhi": "Cabbage",
+    "band gobhi": "Cabbage", "bandh gobi": "Cabbage",
+    "बैंगन": "Brinjal", "baingan": "Brinjal", "baigan": "Brinjal", "eggplant": "Brinjal",
+    "पालक": "Spinach", "palak": "Spinach",
+    "चुकंदर": "Beetroot", "chukandar": "Beetroot",
+    "लहसुन": "Garlic", "lahsun": "Garlic", "lehsun": "Garlic",
+    "अदरक": "Ginger(Green)", "adrak": "Ginger(Green)",
+    "हरी मिर्च": "Green Chilli", "मिर्च": "Green Chilli", "mirch": "Green Chilli", "hari mirch": "Green Chilli",
+    "सेब": "Apple", "seb": "Apple", "saib": "Apple",
+    "आम": "Mango", "aam": "Mango",
+    "केला": "Banana", "kela": "Banana",
+    "अंगूर": "Grapes", "angoor": "Grapes", "angur": "Grapes",
+    "संतरा": "Orange", "santra": "Orange", "santara": "Orange",
+    "अनानास": "Pineapple", "ananas": "Pineapple",
+    "पपीता": "Papaya", "papita": "Papaya",
+    "अमरूद": "Guava", "amrud": "Guava", "amrood": "Guava",
+    "तरबूज": "Water Melon", "tarbooz": "Water Melon", "tarbuj": "Water Melon",
+    "अनार": "Pomegranate", "anar": "Pomegranate", "anaar": "Pomegranate",
+    "गेहूं": "Wheat", "गेहूँ": "Wheat", "gehu": "Wheat", "gehun": "Wheat", "gehoon": "Wheat",
+    "चावल": "Rice", "chawal": "Rice", "chaawal": "Rice",
+    "धान": "Paddy(Dhan)(Common)", "dhan": "Paddy(Dhan)(Common)", "paddy": "Paddy(Dhan)(Common)",
+    "मक्का": "Maize", "makka": "Maize", "makki": "Maize", "corn": "Maize",
+    "बाजरा": "Bajra(Pearl Millet/Cumbu)", "bajra": "Bajra(Pearl Millet/Cumbu)",
+    "जौ": "Barley (Jau)", "jau": "Barley (Jau)",
+    "ज्वार": "Jowar(Sorghum)", "jowar": "Jowar(Sorghum)", "jwar": "Jowar(Sorghum)",
+    "अरहर": "Arhar (Tur/Red Gram)(Whole)", "arhar": "Arhar (Tur/Red Gram)(Whole)",
+    "तुअर": "Arhar (Tur/Red Gram)(Whole)", "toor": "Arhar (Tur/Red Gram)(Whole)",
+    "अरहर दाल": "Arhar Dal(Tur Dal)", "toor dal": "Arhar Dal(Tur Dal)", "tur dal": "Arhar Dal(Tur Dal)",
+    "मूंग": "Green Gram (Moong)(Whole)", "moong": "Green Gram (Moong)(Whole)", "mung": "Green Gram (Moong)(Whole)",
+    "मूंग दाल": "Green Gram Dal (Moong Dal)", "moong dal": "Green Gram Dal (Moong Dal)",
+    "चना": "Bengal Gram(Gram)(Whole)", "chana": "Bengal Gram(Gram)(Whole)", "channa": "Bengal Gram(Gram)(Whole)",
+    "चना दाल": "Bengal Gram Dal (Chana Dal)", "chana dal": "Bengal Gram Dal (Chana Dal)",
+    "उड़द": "Black Gram (Urd Beans)(Whole)", "urad": "Black Gram (Urd Beans)(Whole)",
+    "उड़द दाल": "Black Gram Dal (Urd Dal)", "urad dal": "Black Gram Dal (Urd Dal)",
+    "मसूर": "Lentil (Masur)(Whole)", "masoor": "Lentil (Masur)(Whole)", "masur": "Lentil (Masur)(Whole)",
+    "मसूर दाल": "Masur Dal", "masoor dal": "Masur Dal",
+    "हल्दी": "Turmeric", "haldi": "Turmeric",
+    "गुड़": "Gur(Jaggery)", "gud": "Gur(Jaggery)", "gur": "Gur(Jaggery)", "jaggery": "Gur(Jaggery)",
+    "नारियल": "Coconut", "nariyal": "Coconut",
+    "मूली": "Radish", "mooli": "Radish", "muli": "Radish",
+    "कद्दू": "Pumpkin", "kaddu": "Pumpkin",
+    "लौकी": "Bottle gourd", "lauki": "Bottle gourd", "ghiya": "Bottle gourd",
+    "करेला": "Bitter gourd", "karela": "Bitter gourd",
+    "खीरा": "Cucumbar(Kheera)", "kheera": "Cucumbar(Kheera)", "khira": "Cucumbar(Kheera)",
+    "मटर": "Green Peas", "matar": "Green Peas", "mattar": "Green Peas", "peas": "Green Peas",
+    "शिमला मिर्च": "Capsicum", "shimla mirch": "Capsicum",
+    "सरसों": "Mustard", "sarson": "Mustard",
+    "मूंगफली": "Groundnut", "moongphali": "Groundnut", "mungfali": "Groundnut",
+    "सोयाबीन": "Soyabean", "soyabean": "Soyabean",
+}
+
+# PRODUCTS_BY_CATEGORY names whose Agmarknet text differs from the catalog spelling.
+CATALOG_ALIASES = {
+    "Lady Finger": "Bhindi(Ladies Finger)",
+    "Watermelon": "Water Melon",
+    "Arhar Dal": "Arhar Dal(Tur Dal)",
+    "Moong Dal": "Green Gram Dal (Moong Dal)",
+    "Chana Dal": "Bengal Gram Dal (Chana Dal)",
+    "Urad Dal": "Black Gram Dal (Urd Dal)",
+    "Masoor Dal": "Masur Dal",
+    "Barley": "Barley (Jau)",
+    "Bajra": "Bajra(Pearl Millet/Cumbu)",
+}
+
+
+def catalog_aliases(products_by_category):
+    """Alias for every catalog product, pointing at its Agmarknet spelling."""
+    return {name: CATALOG_ALIASES.get(name, name)
+            for products in products_by_category.values() for name in products}
+
+
+# Parenthetical qualifiers that describe a form, not a crop, so they are never indexed alone.
+_GENERIC_PARTS = {"whole", "common", "other", "dry", "green", "veg", "leaves", "raw ripe", "gram", "dal"}
+_ORGANIC_PREFIX = "organic "
+
+
+def normalize(text):
+    """Lower-case, strip punctuation (keeping Devanagari), collapse whitespace."""
+    text = re.sub(r"[^\wऀ-ॿ]+", " ", text.lower())
+    return " ".join(text.split())
+
+
+def _variants(option):
+    """Searchable names for one dropdown text: the whole thing, the part outside brackets, each bracketed part."""
+    names = {normalize(option)}
+    outside = re.sub(r"\(.*?\)", " ", option)
+    if normalize(outside):
+        names.add(normalize(outside))
+    for part in re.findall(r"\(([^)]*)\)", option):
+        for piece in part.split("/"):
+            piece = normalize(piece)
+            if piece and piece not in _GENERIC_PARTS:
+                names.add(piece)
+    return names
+
+
+def _singular(key):
+    """Crude English singular for the last word: tomatoes -> tomato, onions -> onion."""
+    for suffix in ("oes", "es", "s"):
+        if key.endswith(suffix) and len(key) > len(suffix) + 2:
+            return key[:-len(suffix)] + ("o" if suffix == "oes" else "")
+    return key
+
+
+class CommodityResolver:
+    """
+    Maps a farmer's crop name (English, Hindi, transliterated, misspelt) to an
+    Agmarknet ddlCommodity text without touching the browser.
+
+    Lookups try an exact alias/name table first. After that, a trigram inverted
+    index picks candidates, which are ranked by Levenshtein ratio. Ties are
+    broken by name, so the answer never depends on the hash seed. A candidate
+    must share `min_overlap` of the input's trigrams, and keys of up to
+    `short_key` characters need `short_cutoff` ("pea" is not "Pear"). Results are
+    memoized. The option list is persisted to `path` and refreshed whenever a
+    scraping engine reports the live dropdown with update_options().
+    """
+
+    def __init__(self, path=None, aliases=None, cutoff=0.6, candidates=8, short_key=4, short_cutoff=0.88,
+                 min_overlap=0.4):
+        self.path = path
+        self.cutoff = cutoff
+        self.candidates = candidates
+        self.short_key = short_key
+        self.short_cutoff = short_cutoff
+        self.min_overlap = min_overlap
+        self._lock = threading.Lock()
+        self._aliases = {normalize(k): v for k, v in HINDI_ALIASES.items()}
+        self._aliases.update({normalize(k): v for k, v in (aliases or {}).items()})
+        self.options = self._load() or list(SEED_COMMODITIES)
+        self._build()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read commodity options from {self.path}: {e}")
+            return None
+
+    def _save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.options, f, ensure_ascii=False, indent=0)
+        os.replace(tmp, self.path)
+
+    def _build(self):
+        exact = {}
+        names = []                       # (normalized name, option or alias target, is_alias)
+        grams = defaultdict(list)        # trigram -> indexes into names
+
+        def index(name, target, is_alias):
+            position = len(names)
+            names.append((name, target, is_alias))
+            for gram in trigrams(name):
+                grams[gram].append(position)
+
+        for option in self.options:
+            for name in sorted(_variants(option)):
+                exact.setdefault(name, option)
+                index(name, option, False)
+        for alias, target in self._aliases.items():
+            if alias not in exact:
+                index(alias, target, True)
+                exact.setdefault(alias, target)
+        self._exact = exact
+        self._names = names
+        self._grams = dict(grams)
+        self._option_set = set(self.options)
+        self._lookup = lru_cache(maxsize=4096)(self._resolve_normalized)
+
+    def update_options(self, options):
+        """Feed the live dropdown texts; rebuilds and persists only if they changed."""
+        options = [o for o in options if o and o != "--Select--"]
+        if not options or options == self.options:
+            return False
+        with self._lock:
+            self.options = options
+            self._build()
+            self._save()
+        print(f"📚 Commodity index rebuilt with {len(options)} options")
+        return True
+
+    def resolve(self, text):
+        """Agmarknet commodity text for the input, or None if nothing is close enough."""
+        key = normalize(text or "")
+        if not key:
+            return None
+        return self._lookup(key)
+
+    def resolve_exact(self, text):
+        """Agmarknet commodity text for an exact name or alias (no fuzzy matching), or None."""
+        key = normalize(text or "")
+        return self._option(self._exact.get(key) or self._exact.get(_singular(key)))
+
+    def _resolve_normalized(self, key):
+        if key.startswith(_ORGANIC_PREFIX):
+            return self._resolve_normalized(key[len(_ORGANIC_PREFIX):])
+        return self._option(self._exact.get(key) or self._exact.get(_singular(key)) or
+                            self._fuzzy(key, include_aliases=True))
+
+    def _option(self, target):
+        """The dropdown text for an alias target, or None if this dropdown has no such name."""
+        if target is None or target in self._option_set:
+            return target
+        # Spelt differently here ("Ginger (Green)"), or not traded at all (catalog items like "Ghee")
+        option = self._exact.get(normalize(target))
+        return option if option in self._option_set else None
+
+    def _fuzzy(self, key, include_aliases):
+        # Vote for names sharing trigrams with the input, then rank the top few exactly
+        grams = trigrams(key)
+        shared = votes(grams, self._grams)
+        cutoff = self.short_cutoff if len(key) <= self.short_key else self.cutoff
+        best, best_rank = None, None
+        for position in shortlist(shared, self.candidates, name=lambda p: self._names[p][0]):
+            name, target, is_alias = self._names[position]
+            if (is_alias and not include_aliases) or shared[position] < self.min_overlap * len(grams):
+                continue
+            score = similarity(key, name)
+            rank = (score, not is_alias)   # on a tie, a real dropdown name beats an alias
+            if score >= cutoff and (best_rank is None or rank > best_rank):
+                best, best_rank = target, rank
+        return best
+
+    def stats(self):
+        info = self._lookup.cache_info()
+        return {
+            "options": len(self.options),
+            "indexed_names": len(self._names),
+            "aliases": len(self._aliases),
+            "memo_hits": info.hits,
+            "memo_misses": info.misses,
+        }
@@ -0,0 +1,204 @@
+import os
+import time
+import threading
+from collections import deque
+
+from job_queue import summarize_latencies
+
+
+class DriverPoolTimeout(Exception):
+    """Raised when no browser driver became free within the acquire timeout."""
+
+
+class DriverPool:
+    """
+    Bounded pool of long-lived browser drivers.
+
+    `create()` starts a new driver and `reset(driver)` puts it back on the start
+    page; both are supplied by the caller so the pool stays Selenium-agnostic.
+    Drivers are reset in the background after each checkin, so the next caller
+    gets one that is already sitting on the page. A driver is quit and replaced
+    after `max_uses` checkouts, when it fails a health check, or when the caller
+    reports it as broken. When every driver is busy, callers wait in line.
+    """
+
+    def __init__(self, create, reset, size=2, max_uses=25, acquire_timeout=60, name="driver"):
+        self._create = create
+        self._reset = reset
+        self.size = size
+        self.max_uses = max_uses
+        self.acquire_timeout = acquire_timeout
+        self.name = name
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._uses = {}          # id(driver) -> checkouts so far
+        self._total = 0          # drivers alive or being started
+        self._waiting = 0
+        self._pid = os.getpid()
+
+        self._created = 0
+        self._recycled = 0
+        self._broken = 0
+        self._timeouts = 0
+        self._wait_times = deque(maxlen=500)
+
+    def _check_fork(self):
+        # Drivers belong to the process that started them; a forked worker starts empty.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle.clear()
+            self._uses.clear()
+            self._total = 0
+
+    def _start_driver(self):
+        driver = self._create()
+        try:
+            self._reset(driver)
+        except Exception:
+            self._quit(driver)
+            raise
+        with self._cond:
+            self._uses[id(driver)] = 0
+            self._created += 1
+        return driver
+
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"⚠️ Error quitting {self.name}: {e}")
+
+    def _healthy(self, driver):
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, driver, broken=False):
+        """Quit a driver and free its slot; counted as broken, or as recycled after max_uses."""
+        with self._cond:
+            self._uses.pop(id(driver), None)
+            self._total -= 1
+            if broken:
+                self._broken += 1
+            else:
+                self._recycled += 1
+            self._cond.notify_all()
+        threading.Thread(target=self._quit, args=(driver,), daemon=True).start()
+
+    def acquire(self, timeout=None):
+        """Check out a driver, starting one if the pool has room. Raises DriverPoolTimeout."""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        requested = time.monotonic()
+        deadline = requested + timeout
+        while True:
+            start_new = False
+            with self._cond:
+                self._check_fork()
+                self._waiting += 1
+                try:
+                    while not self._idle and self._total >= self.size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._timeouts += 1
+                            raise DriverPoolTimeout(f"No {self.name} free after {timeout}s")
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+                if self._idle:
+                    driver = self._idle.popleft()
+                else:
+                    self._total += 1
+                    start_new = True
+
+            if start_new:
+                try:
+                    driver = self._start_driver()
+                except Exception:
+                    with self._cond:
+                        self._total -= 1
+                        self._cond.notify_all()
+                    raise
+            elif not self._healthy(driver):
+                print(f"♻️ Replacing unhealthy {self.name}")
+                self._discard(driver, broken=True)
+                continue
+
+            with self._cond:
+                self._wait_times.append(time.monotonic() - requested)
+            return driver
+
+    def release(self, driver, broken=False):
+        """Check a driver back in. Broken or worn-out drivers are quit and replaced."""
+        with self._cond:
+            if id(driver) not in self._uses:
+                # Started before a fork or already discarded; nothing to return it to.
+                return
+            self._uses[id(driver)] += 1
+            worn_out = self._uses[id(driver)] >= self.max_uses
+        if broken or worn_out:
+            self._discard(driver, broken=broken)
+            return
+        threading.Thread(target=self._reset_and_return, args=(driver,), daemon=True).start()
+
+    def _reset_and_return(self, driver):
+        try:
+            self._reset(driver)
+        except Exception as e:
+            print(f"♻️ Reset failed for {self.name}, replacing it: {e}")
+            self._discard(driver, broken=True)
+            return
+        with self._cond:
+            self._idle.append(driver)
+            self._cond.notify_all()
+
+    def prewarm(self, count=None):
+        """Start drivers in the background until `count` (default: pool size) exist."""
+        count = self.size if count is None else min(count, self.size)
+
+        def warm_one():
+            try:
+                driver = self._start_driver()
+            except Exception as e:
+                print(f"⚠️ Could not prewarm {self.name}: {e}")
+                with self._cond:
+                    self._total -= 1
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._idle.append(driver)
+                self._cond.notify_all()
+
+        with self._cond:
+            self._check_fork()
+            missing = max(0, count - self._total)
+            self._total += missing
+        for _ in range(missing):
+            threading.Thread(target=warm_one, daemon=True).start()
+
+    def close(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._total -= len(idle)
+            for driver in idle:
+                self._uses.pop(id(driver), None)
+        for driver in idle:
+            self._quit(driver)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "alive": self._total,
+                "idle": len(self._idle),
+                "busy": self._total - len(self._idle),
+                "waiting": self._waiting,
+                "created": self._created,
+                "recycled": self._recycled,
+                "broken": self._broken,
+                "timeouts": self._timeouts,
+                "acquire_wait": summarize_latencies(list(self._wait_times)),
+            }
@@ -0,0 +1,45 @@
+"""
+Trigram candidate search and string similarity, shared by the commodity
+resolver and the gazetteer.
+
+An index maps each trigram to the positions of the names containing it. A
+lookup counts the trigrams each name shares with the input (its votes) and
+ranks a shortlist of the best-voted names by similarity. The shortlist breaks
+ties on the name and then the position, never on dict order, so results do not
+depend on the hash seed.
+"""
+import heapq
+from collections import defaultdict
+
+try:
+    from Levenshtein import ratio as similarity
+except ImportError:  # python-Levenshtein is optional; difflib gives the same scale, just slower
+    from difflib import SequenceMatcher
+
+    def similarity(a, b):
+        return SequenceMatcher(None, a, b).ratio()
+
+
+def trigrams(text):
+    """Character trigrams of a normalized name, padded so word starts weigh more than endings."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def votes(grams, index):
+    """{position: trigrams shared with `grams`} for every name in `index` (trigram -> positions)."""
+    counts = defaultdict(int)
+    for gram in grams:
+        for position in index.get(gram, ()):
+            counts[position] += 1
+    return counts
+
+
+def shortlist(counts, limit, name=None):
+    """
+    The `limit` best-voted positions. Ties go to the smaller name(position) when `name` is
+    given, then to the smaller position.
+    """
+    if name is None:
+        return heapq.nsmallest(limit, counts, key=lambda p: (-counts[p], p))
+    return heapq.nsmallest(limit, counts, key=lambda p: (-counts[p], name(p), p))
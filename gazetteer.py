@@ -0,0 +1,289 @@
+import re
+import bisect
+import threading
+from array import array
+from collections import defaultdict
+from typing import NamedTuple
+
+from commodity_resolver import normalize
+from fuzzy import shortlist, similarity, trigrams, votes
+
+
+class Place(NamedTuple):
+    name: str
+    district: str
+    state: str
+    lat: float
+    lon: float
+    population: int     # thousands
+
+
+class Match(NamedTuple):
+    place: Place
+    how: str            # exact, prefix, fuzzy, partial (one word matched), or district (only a wider part)
+    query: str
+
+
+# Words farmers put around a place name that are not part of it.
+FILLER_WORDS = {
+    "village", "vill", "vil", "vpo", "gaon", "gao", "gram", "block", "mandal", "near", "town", "city",
+    "the", "in", "at", "of", "my", "area", "weather", "mausam", "forecast",
+    "गाँव", "गांव", "ग्राम", "ब्लॉक", "शहर", "के", "का", "की", "में", "पास", "मौसम",
+}
+
+# Words that start the next, wider part of an address ("Rampur post Daurala dist Meerut").
+MARKER_WORDS = {
+    "post", "po", "ps", "tehsil", "teh", "tahsil", "taluka", "taluk", "tq", "dist", "distt", "district",
+    "zila", "jila", "पोस्ट", "तहसील", "जिला", "ज़िला",
+}
+
+# Short and Hindi names for states, on top of the state names in the data file.
+STATE_ALIASES = {
+    "up": "Uttar Pradesh", "mp": "Madhya Pradesh", "hp": "Himachal Pradesh", "ap": "Andhra Pradesh",
+    "tn": "Tamil Nadu", "wb": "West Bengal", "jk": "Jammu and Kashmir", "j k": "Jammu and Kashmir",
+    "orissa": "Odisha", "uttaranchal": "Uttarakhand", "pondicherry": "Puducherry",
+    "उत्तर प्रदेश": "Uttar Pradesh", "मध्य प्रदेश": "Madhya Pradesh", "हिमाचल प्रदेश": "Himachal Pradesh",
+    "बिहार": "Bihar", "राजस्थान": "Rajasthan", "महाराष्ट्र": "Maharashtra", "हरियाणा": "Haryana",
+    "पंजाब": "Punjab", "गुजरात": "Gujarat", "उत्तराखंड": "Uttarakhand", "झारखंड": "Jharkhand",
+    "छत्तीसगढ़": "Chhattisgarh", "ओडिशा": "Odisha", "पश्चिम बंगाल": "West Bengal", "दिल्ली": "Delhi",
+    "कर्नाटक": "Karnataka", "केरल": "Kerala", "तमिलनाडु": "Tamil Nadu", "तेलंगाना": "Telangana",
+    "आंध्र प्रदेश": "Andhra Pradesh", "असम": "Assam",
+}
+
+
+def location_parts(text):
+    """Pieces of a location, most specific first, normalized and without filler words."""
+    parts = []
+    for piece in re.split(r"[,;\n/]+", text or ""):
+        words = []
+        for word in normalize(piece).split() + [None]:
+            if word is None or word in MARKER_WORDS:
+                if words:
+                    parts.append(" ".join(words))
+                words = []
+            elif word not in FILLER_WORDS:
+                words.append(word)
+    return parts
+
+
+class Gazetteer:
+    """
+    Offline place-name index used to turn a farmer's free-text location into
+    coordinates, so the weather feature needs no geocoding call per message.
+
+    The tab-separated file is loaded once into a compact layout: coordinates and
+    populations in typed arrays, district and state names interned, and every
+    searchable name (place names and aliases, English and Hindi) in one sorted
+    list. Exact and prefix lookups bisect that list. Misspellings go through a
+    trigram index ranked by Levenshtein ratio (fuzzy.py, as in CommodityResolver).
+    Places sharing a name are told apart by a district or state mentioned
+    alongside, then by population. Short names are one or two edits away from many others
+    ("Panna" and "Patna"), so keys of up to `short_key` characters need
+    `short_cutoff` to match fuzzily. The index is read-only after loading, so
+    gunicorn workers share it when the app is preloaded.
+    """
+
+    def __init__(self, path, cutoff=0.75, candidates=8, min_prefix=4, short_key=5, short_cutoff=0.85):
+        self.path = path
+        self.cutoff = cutoff
+        self.short_key = short_key
+        self.short_cutoff = short_cutoff
+        self.candidates = candidates
+        self.min_prefix = min_prefix
+
+        self._names = []                 # place id -> display name
+        self._districts = []             # interned district names
+        self._states = []                # interned state names
+        self._district_of = array('H')   # place id -> index into _districts
+        self._state_of = array('B')      # place id -> index into _states
+        self._lat = array('f')
+        self._lon = array('f')
+        self._population = array('I')
+
+        self._lock = threading.Lock()
+        self._counters = {"lookups": 0, "exact": 0, "prefix": 0, "fuzzy": 0, "partial": 0,
+                          "district": 0, "misses": 0}
+        self._load()
+
+    # --- Loading ---
+    def _load(self):
+        district_ids, state_ids = {}, {}
+        keyed = []                       # (normalized name, place id)
+        with open(self.path, encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip() or line.startswith("#"):
+                    continue
+                fields = line.rstrip("\n").split("\t")
+                try:
+                    name, district, state, lat, lon = fields[:5]
+                    population = int(fields[5]) if len(fields) > 5 and fields[5] else 0
+                    lat, lon = float(lat), float(lon)
+                except ValueError:
+                    print(f"⚠️ Skipping malformed gazetteer line {line_no} in {self.path}")
+                    continue
+                place_id = len(self._names)
+                self._names.append(name)
+                self._district_of.append(district_ids.setdefault((district, state), len(district_ids)))
+                self._state_of.append(state_ids.setdefault(state, len(state_ids)))
+                self._lat.append(lat)
+                self._lon.append(lon)
+                self._population.append(population)
+                aliases = fields[6].split("|") if len(fields) > 6 and fields[6] else []
+                for key in {normalize(n) for n in [name] + aliases} - {""}:
+                    keyed.append((key, place_id))
+
+        self._districts = [district for district, _ in district_ids]
+        self._states = list(state_ids)
+        keyed.sort()
+        self._keys = [key for key, _ in keyed]
+        self._key_place = array('I', (place_id for _, place_id in keyed))
+
+        grams = defaultdict(lambda: array('I'))   # trigram -> indexes into _keys
+        for position, key in enumerate(self._keys):
+            for gram in trigrams(key):
+                grams[gram].append(position)
+        self._grams = dict(grams)
+
+        # Hints: normalized district/state name -> ids
+        self._district_keys = defaultdict(set)
+        for district_id, district in enumerate(self._districts):
+            self._district_keys[normalize(district)].add(district_id)
+        self._state_keys = {normalize(state): state_id for state_id, state in enumerate(self._states)}
+        for alias, state in STATE_ALIASES.items():
+            if state in state_ids:
+                self._state_keys[normalize(alias)] = state_ids[state]
+        self._state_pattern = re.compile(
+            r"(?<!\S)(" + "|".join(map(re.escape, sorted(self._state_keys, key=len, reverse=True))) + r")(?!\S)")
+
+    def place(self, place_id):
+        return Place(self._names[place_id], self._districts[self._district_of[place_id]],
+                     self._states[self._state_of[place_id]], round(self._lat[place_id], 4),
+                     round(self._lon[place_id], 4), self._population[place_id])
+
+    def __len__(self):
+        return len(self._names)
+
+    # --- Lookups ---
+    def _exact(self, key):
+        position = bisect.bisect_left(self._keys, key)
+        ids = []
+        while position < len(self._keys) and self._keys[position] == key:
+            ids.append(self._key_place[position])
+            position += 1
+        return ids
+
+    def _prefix(self, key, limit=50):
+        if len(key) < self.min_prefix:
+            return []
+        position = bisect.bisect_left(self._keys, key)
+        ids = []
+        while position < len(self._keys) and self._keys[position].startswith(key) and len(ids) < limit:
+            ids.append(self._key_place[position])
+            position += 1
+        return ids
+
+    def _fuzzy(self, key):
+        cutoff = self.short_cutoff if len(key) <= self.short_key else self.cutoff
+        scored = defaultdict(float)
+        # _keys is sorted, so ties between positions are ties between names in order
+        for position in shortlist(votes(trigrams(key), self._grams), self.candidates):
+            score = similarity(key, self._keys[position])
+            if score >= cutoff:
+                place_id = self._key_place[position]
+                scored[place_id] = max(scored[place_id], score)
+        if not scored:
+            return []
+        best = max(scored.values())
+        return [place_id for place_id, score in scored.items() if score == best]
+
+    def _candidates(self, key, fuzzy=True):
+        for how, finder in (("exact", self._exact), ("prefix", self._prefix), ("fuzzy", self._fuzzy)):
+            if how == "fuzzy" and not fuzzy:
+                break
+            ids = finder(key)
+            if ids:
+                return ids, how
+        return [], None
+
+    def _hints(self, parts):
+        """Strip state names out of the parts; returns (state ids, [(part, district ids it names)])."""
+        states, named = set(), []
+        for part in parts:
+            for found in self._state_pattern.findall(part):
+                states.add(self._state_keys[found])
+            # "Delhi" and "Bihar Sharif" are places, not a state plus the rest
+            if not self._exact(part):
+                part = " ".join(self._state_pattern.sub(" ", part).split()) or part
+            named.append((part, self._district_keys.get(part, set())))
+        return states, named
+
+    def _best(self, ids, states, districts):
+        def rank(place_id):
+            return (self._district_of[place_id] in districts, self._state_of[place_id] in states,
+                    self._population[place_id])
+        return max(ids, key=rank)
+
+    def named_state(self, text):
+        """The state, if the text names one and nothing narrower ("Bihar", "UP"); else None."""
+        states = set()
+        for part in location_parts(text):
+            found = self._state_pattern.findall(part)
+            # Something besides the state, or a state that is also a place ("Delhi")
+            if not found or self._state_pattern.sub(" ", part).strip() or self._exact(part):
+                return None
+            states.update(self._state_keys[name] for name in found)
+        return self._states[states.pop()] if len(states) == 1 else None
+
+    def lookup(self, text):
+        """Best Match for a free-text location, or None if nothing in the index is close enough."""
+        states, named = self._hints(location_parts(text))
+        all_districts = set().union(*(districts for _, districts in named))
+        # Addresses run from narrow to wide, so a district named after a part is its hint
+        wider = [set().union(*(districts for _, districts in named[i + 1:])) for i in range(len(named))]
+        # Most specific first: each part whole, then its single words without fuzzy matching
+        queries = [(i, part, True) for i, (part, _) in enumerate(named)]
+        queries += [(i, word, False) for i, (part, _) in enumerate(named) if " " in part
+                    for word in part.split() if len(word) > 2]
+        fallback = None
+        for i, key, fuzzy in queries:
+            ids, how = self._candidates(key, fuzzy)
+            if not ids:
+                continue
+            districts = wider[i]
+            if i:
+                how = "district"   # the narrower parts of the address were not found
+            elif not fuzzy:
+                how = "partial"    # one word of a longer name
+            if districts:   # a named district is the stronger hint; the state alone does not settle it
+                hinted = [p for p in ids if self._district_of[p] in districts]
+            else:
+                hinted = [p for p in ids if self._state_of[p] in states]
+            if hinted or not (states or districts):
+                return self._matched(self._best(hinted or ids, states, districts), how, text)
+            # A name known only outside the hinted district/state; prefer the district town itself
+            fallback = fallback or (self._best(ids, states, districts), how)
+        if all_districts:
+            headquarters = [p for p in range(len(self._names)) if self._district_of[p] in all_districts]
+            if headquarters:
+                return self._matched(self._best(headquarters, states, all_districts), "district", text)
+        if fallback:
+            return self._matched(*fallback, text)
+        self._count("lookups", "misses")
+        return None
+
+    def _matched(self, place_id, how, text):
+        self._count("lookups", how)
+        return Match(self.place(place_id), how, text)
+
+    def _count(self, *names):
+        with self._lock:
+            for name in names:
+                self._counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats["places"] = len(self._names)
+        stats["indexed_names"] = len(self._keys)
+        stats["districts"] = len(self._districts)
+        return stats
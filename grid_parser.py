@@ -0,0 +1,180 @@
+from datetime import date, datetime
+from html.parser import HTMLParser
+from typing import NamedTuple, Optional
+
+from agmarknet import GRID_ID, MODAL_PRICE_COLUMN
+
+
+class PriceRow(NamedTuple):
+    """One market's quote from the Agmarknet price grid. Prices are Rs./Quintal."""
+    district: str
+    market: str
+    commodity: str
+    variety: str
+    grade: str
+    arrival_date: Optional[date]
+    min_price: Optional[int]
+    max_price: Optional[int]
+    modal_price: int
+
+
+# Header text fragment -> PriceRow field. Checked in order, so "Modal Price" wins over "Price Date".
+HEADER_FIELDS = [
+    ("district", "district"),
+    ("market", "market"),
+    ("commodity", "commodity"),
+    ("variety", "variety"),
+    ("grade", "grade"),
+    ("min price", "min_price"),
+    ("max price", "max_price"),
+    ("modal price", "modal_price"),
+    ("arrival date", "arrival_date"),
+    ("price date", "arrival_date"),
+]
+
+# Column layout used when the grid arrives without a header row.
+DEFAULT_COLUMNS = {
+    "district": 1, "market": 2, "commodity": 3, "variety": 4, "grade": 5,
+    "arrival_date": 6, "min_price": 8, "max_price": 9, "modal_price": MODAL_PRICE_COLUMN,
+}
+
+DATE_FORMATS = ('%d %b %Y', '%d-%b-%Y', '%d/%m/%Y')
+
+
+def columns_from_header(cells):
+    columns = {}
+    for index, text in enumerate(cells):
+        text = text.lower()
+        for fragment, field in HEADER_FIELDS:
+            if fragment in text and field not in columns:
+                columns[field] = index
+                break
+    return columns if "modal_price" in columns else None
+
+
+def _price(text):
+    try:
+        return int(float(text.replace(',', '')))
+    except ValueError:
+        return None
+
+
+def _date(text):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def build_row(cells, columns):
+    """PriceRow for one data row, or None for rows without a usable modal price."""
+    if len(cells) <= max(columns.values()):
+        return None
+    modal = _price(cells[columns["modal_price"]])
+    if modal is None:
+        return None
+
+    def text(field):
+        index = columns.get(field)
+        return cells[index] if index is not None else ""
+
+    return PriceRow(
+        district=text("district"),
+        market=text("market"),
+        commodity=text("commodity"),
+        variety=text("variety"),
+        grade=text("grade"),
+        arrival_date=_date(text("arrival_date")),
+        min_price=_price(text("min_price")) if "min_price" in columns else None,
+        max_price=_price(text("max_price")) if "max_price" in columns else None,
+        modal_price=modal,
+    )
+
+
+class _GridTokenizer(HTMLParser):
+    """
+    Tokenizer that ignores everything outside the price grid table. Inside it,
+    only cell text is buffered, and each finished <tr> becomes a PriceRow.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []          # finished rows, drained by the caller after each feed
+        self.done = False
+        self._depth = 0         # nesting depth of <table> inside the grid; 0 = outside
+        self._cells = None
+        self._cell = None
+        self._header = False
+        self._columns = None
+
+    def handle_starttag(self, tag, attrs):
+        if self._depth == 0:
+            if tag == 'table' and not self.done and ('id', GRID_ID) in attrs:
+                self._depth = 1
+            return
+        if tag == 'table':
+            self._depth += 1
+        elif tag == 'tr':
+            self._cells = []
+            self._header = False
+        elif tag in ('td', 'th') and self._cells is not None:
+            self._cell = []
+            self._header = self._header or tag == 'th'
+
+    def handle_endtag(self, tag):
+        if self._depth == 0:
+            return
+        if tag == 'table':
+            self._depth -= 1
+            if self._depth == 0:
+                self.done = True
+        elif tag in ('td', 'th') and self._cell is not None:
+            self._cells.append(''.join(self._cell).strip())
+            self._cell = None
+        elif tag == 'tr' and self._cells is not None:
+            self._finish_row()
+            self._cells = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+    def _finish_row(self):
+        if self._header:
+            self._columns = columns_from_header(self._cells) or self._columns
+            return
+        row = build_row(self._cells, self._columns or DEFAULT_COLUMNS)
+        if row is not None:
+            self.rows.append(row)
+
+
+def iter_price_rows(chunks):
+    """
+    Yield PriceRows from an iterable of HTML text chunks (e.g. a streamed response)
+    as soon as each grid row is complete, and stop reading once the grid closes.
+    """
+    tokenizer = _GridTokenizer()
+    for chunk in chunks:
+        if not chunk:
+            continue
+        tokenizer.feed(chunk)
+        if tokenizer.rows:
+            yield from tokenizer.rows
+            tokenizer.rows = []
+        if tokenizer.done:
+            return
+    tokenizer.close()
+    yield from tokenizer.rows
+
+
+def parse_price_rows(html):
+    """All PriceRows of the grid in an already-downloaded page (e.g. Selenium's page_source)."""
+    start = html.find(GRID_ID)
+    if start == -1:
+        return []
+    # Start tokenizing at the grid's <table> tag; the tokenizer stops once it closes
+    start = max(0, html.rfind('<table', 0, start))
+    chunk = 64 * 1024
+    return list(iter_price_rows(html[i:i + chunk] for i in range(start, len(html), chunk)))
@@ -0,0 +1,42 @@
+"""
+gunicorn settings; gunicorn reads this file by itself when started from this directory.
+
+    gunicorn --bind 0.0.0.0:5000 'app:create_app()'
+    GUNICORN_PRELOAD=1 WARMUP=1 gunicorn -w 4 'app:create_app()'     # or --preload
+
+With preload the master imports the app once (plus numpy and the scraper with
+WARMUP=1) and forks the workers, which share those pages copy-on-write instead of
+each importing everything again. Each worker starts its own background threads
+after the fork. Boot time and RSS are logged for the master and every worker.
+"""
+import gc
+import os
+import time
+
+from metrics import process_memory
+
+preload_app = os.getenv('GUNICORN_PRELOAD', '0') == '1'
+
+_boot = {"started": time.perf_counter()}   # gunicorn reads this file before it preloads the app
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        # Park the preloaded objects in the permanent generation, so the collector's
+        # bookkeeping in the workers does not copy the pages they share with the master.
+        gc.freeze()
+    server.log.info("Master ready in %.2fs (preload %s), RSS %s MB",
+                    time.perf_counter() - _boot["started"], "on" if server.cfg.preload_app else "off",
+                    process_memory()["rss_mb"])
+
+
+def post_fork(server, worker):
+    _boot["forked"] = time.perf_counter()
+
+
+def post_worker_init(worker):
+    import app
+    app.start_worker()
+    memory = process_memory()
+    worker.log.info("Worker %s booted in %.2fs, RSS %s MB (peak %s MB)", worker.pid,
+                    time.perf_counter() - _boot["forked"], memory["rss_mb"], memory["peak_rss_mb"])
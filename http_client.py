@@ -0,0 +1,258 @@
+import os
+import re
+import json
+import time
+import random
+import threading
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from job_queue import summarize_latencies
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is +Inf.
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """Cumulative bucket counts plus a window of recent samples for percentiles."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS, sample_size=500):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total_ms = 0.0
+        self.samples = deque(maxlen=sample_size)
+
+    def observe(self, seconds):
+        ms = seconds * 1000
+        for i, bound in enumerate(self.buckets):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total_ms += ms
+        self.samples.append(seconds)
+
+    def snapshot(self):
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {"buckets_ms": buckets, "sum_ms": round(self.total_ms, 2), **summarize_latencies(list(self.samples))}
+
+
+def graph_throttle_delay(resp):
+    """
+    Seconds to hold off according to Graph's usage headers, or 0.
+
+    X-App-Usage / X-Business-Use-Case-Usage report percentages of the rate limit
+    used; near 100 Graph starts rejecting calls, and the business header also says
+    how many minutes until access is regained.
+    """
+    delay = 0.0
+    usage = resp.headers.get("X-App-Usage")
+    if usage:
+        try:
+            if max(json.loads(usage).values()) >= 95:
+                delay = max(delay, 60.0)
+        except (ValueError, TypeError, AttributeError):
+            pass
+    business = resp.headers.get("X-Business-Use-Case-Usage")
+    if business:
+        try:
+            for entries in json.loads(business).values():
+                for entry in entries:
+                    used = max(entry.get("call_count", 0), entry.get("total_time", 0), entry.get("total_cputime", 0))
+                    regain = entry.get("estimated_time_to_regain_access", 0) or 0
+                    if regain:
+                        delay = max(delay, regain * 60.0)
+                    elif used >= 95:
+                        delay = max(delay, 60.0)
+        except (ValueError, TypeError, AttributeError):
+            pass
+    return delay
+
+
+def retry_after_delay(resp):
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return 0.0   # HTTP-date form; fall back to our own backoff
+
+
+def never_connected(exc):
+    """True if the request failed before a connection was made, so the server cannot have seen it."""
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(exc, requests.exceptions.ConnectionError):
+        return False
+    # requests wraps urllib3's MaxRetryError, whose .reason is the underlying failure
+    cause = exc.args[0] if exc.args else None
+    while cause is not None:
+        if isinstance(cause, NewConnectionError):
+            return True
+        cause = getattr(cause, "reason", None) or cause.__cause__
+    return False
+
+
+def _endpoint_label(method, url):
+    path = requests.utils.urlparse(url).path
+    path = re.sub(r"/\d[\w.-]*", "/{id}", path)   # phone numbers, ids, graph versions
+    return f"{method} {path or '/'}"
+
+
+class HttpClient:
+    """
+    Shared client for one upstream (WhatsApp Graph, the AgriKart backend, ...).
+
+    Requests go over a pooled keep-alive session (one per process, since sessions
+    must not cross a gunicorn fork) with explicit (connect, read) timeouts.
+    Connection errors and RETRY_STATUSES are retried with full-jitter exponential
+    backoff, honouring Retry-After. Graph usage headers pause every caller of the
+    client until the rate limit window has passed. Latency is recorded per endpoint.
+
+    Non-idempotent requests (POST) are only retried when the request cannot have
+    been processed: connect failures, 429, and 503.
+    """
+
+    def __init__(self, name, base_url=None, pool_size=10, timeout=(3.05, 15), retries=3,
+                 backoff=0.5, max_backoff=8.0, max_throttle=300.0):
+        self.name = name
+        self.base_url = base_url.rstrip("/") + "/" if base_url else None
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_throttle = max_throttle
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._session_pid = None
+        self._paused_until = 0.0
+        self._histograms = {}
+        self._counters = {}
+
+    def _get_session(self):
+        if self._session is None or self._session_pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+                    self._session_pid = os.getpid()
+        return self._session
+
+    def url(self, path):
+        if self.base_url is None or path.startswith(("http://", "https://")):
+            return path
+        return requests.compat.urljoin(self.base_url, path.lstrip("/"))
+
+    def _record(self, endpoint, seconds, outcome):
+        with self._lock:
+            histogram = self._histograms.get(endpoint)
+            if histogram is None:
+                histogram = self._histograms[endpoint] = LatencyHistogram()
+                self._counters[endpoint] = {"requests": 0, "errors": 0, "retries": 0, "throttled": 0}
+            counters = self._counters[endpoint]
+            if outcome == "retry":
+                counters["retries"] += 1
+                return
+            if outcome == "throttled":
+                counters["throttled"] += 1
+                return
+            counters["requests"] += 1
+            if outcome == "error":
+                counters["errors"] += 1
+            histogram.observe(seconds)
+
+    def _wait_for_throttle(self):
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+
+    def _throttle(self, seconds):
+        seconds = min(seconds, self.max_throttle)
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        print(f"🚦 {self.name} rate limited, pausing calls for {seconds:.0f}s")
+
+    def _sleep_before_retry(self, attempt, floor=0.0):
+        # Full jitter: a random delay up to the exponential cap, so callers don't retry in lockstep
+        cap = min(self.max_backoff, self.backoff * (2 ** attempt))
+        time.sleep(max(floor, random.uniform(0, cap)))
+
+    def request(self, method, path, endpoint=None, timeout=None, **kwargs):
+        """
+        Send the request and return the final requests.Response (which may still be an
+        error status once retries run out). Raises requests.RequestException when the
+        last attempt could not get a response at all.
+        """
+        method = method.upper()
+        url = self.url(path)
+        endpoint = endpoint or _endpoint_label(method, url)
+        idempotent = method in IDEMPOTENT_METHODS
+        session = self._get_session()
+
+        attempt = 0
+        while True:
+            self._wait_for_throttle()
+            started = time.monotonic()
+            try:
+                resp = session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except requests.exceptions.RequestException as e:
+                elapsed = time.monotonic() - started
+                # A reset or dropped connection may come after the body was sent, so a POST
+                # is only retried when it never reached the server
+                safe = idempotent or never_connected(e)
+                if attempt < self.retries and safe:
+                    self._record(endpoint, elapsed, "retry")
+                    self._sleep_before_retry(attempt)
+                    attempt += 1
+                    continue
+                self._record(endpoint, elapsed, "error")
+                raise
+            elapsed = time.monotonic() - started
+
+            throttle = graph_throttle_delay(resp)
+            if throttle:
+                self._record(endpoint, elapsed, "throttled")
+                self._throttle(throttle)
+
+            retryable = resp.status_code in RETRY_STATUSES and (idempotent or resp.status_code in (429, 503))
+            if retryable and attempt < self.retries:
+                self._record(endpoint, elapsed, "retry")
+                floor = retry_after_delay(resp)
+                resp.close()
+                self._sleep_before_retry(attempt, floor=min(floor, self.max_backoff))
+                attempt += 1
+                continue
+
+            self._record(endpoint, elapsed, "ok" if resp.status_code < 400 else "error")
+            return resp
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            endpoints = {
+                endpoint: {**self._counters[endpoint], **histogram.snapshot()}
+                for endpoint, histogram in self._histograms.items()
+            }
+            paused = max(0.0, self._paused_until - time.monotonic())
+        return {"paused_for_s": round(paused, 1), "endpoints": endpoints}
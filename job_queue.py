@@ -0,0 +1,155 @@
+import os
+import time
+import threading
+import contextvars
+from collections import deque
+
+
+def summarize_latencies(samples):
+    """Return count/avg/p50/p95/p99/max (in ms) for a list of seconds."""
+    if not samples:
+        return {"count": 0, "avg_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    ordered = sorted(samples)
+    n = len(ordered)
+
+    def pct(p):
+        return round(ordered[min(n - 1, int(p * n))] * 1000, 2)
+
+    return {
+        "count": n,
+        "avg_ms": round(sum(ordered) / n * 1000, 2),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+class KeyedJobQueue:
+    """
+    In-process job queue backed by a bounded pool of worker threads.
+
+    Jobs submitted with the same key (a phone number) run one at a time and in
+    submission order; jobs for different keys run in parallel. Worker threads are
+    started lazily on the first submit, so the queue is safe to create before a
+    gunicorn fork. Each job runs in a copy of the submitter's contextvars, so a
+    trace id set around submit() follows the job onto the worker thread.
+    """
+
+    def __init__(self, workers=8, max_pending=1000, name="jobs", sample_size=1000):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.name = name
+
+        self._cond = threading.Condition()
+        self._pending = {}        # key -> deque of (context, func, args, kwargs, enqueued_at)
+        self._ready = deque()     # keys with pending jobs and no job running
+        self._running = set()     # keys currently held by a worker
+        self._depth = 0
+        self._threads = []
+        self._pid = None
+        self._stopping = False
+
+        self._processed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_times = deque(maxlen=sample_size)
+        self._run_times = deque(maxlen=sample_size)
+
+    def submit(self, key, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) behind earlier jobs for key. Returns False if full."""
+        with self._cond:
+            self._ensure_started()
+            if self._depth >= self.max_pending:
+                self._rejected += 1
+                return False
+            jobs = self._pending.get(key)
+            if jobs is None:
+                jobs = self._pending[key] = deque()
+                if key not in self._running:
+                    self._ready.append(key)
+            jobs.append((contextvars.copy_context(), func, args, kwargs, time.monotonic()))
+            self._depth += 1
+            self._cond.notify_all()
+        return True
+
+    def _ensure_started(self):
+        # Threads do not survive fork(), so a new pid means a fresh pool.
+        if self._pid == os.getpid() and self._threads:
+            return
+        self._pid = os.getpid()
+        self._threads = []
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._stopping:
+                    self._cond.wait()
+                if self._stopping and not self._ready:
+                    return
+                key = self._ready.popleft()
+                jobs = self._pending[key]
+                context, func, args, kwargs, enqueued_at = jobs.popleft()
+                if not jobs:
+                    del self._pending[key]
+                self._running.add(key)
+                self._depth -= 1
+
+            started = time.monotonic()
+            failed = False
+            try:
+                context.run(func, *args, **kwargs)
+            except Exception as e:
+                failed = True
+                print(f"❌ Job for {key} failed in {self.name}: {e}")
+            finished = time.monotonic()
+
+            with self._cond:
+                self._running.discard(key)
+                if key in self._pending:
+                    self._ready.append(key)
+                    self._cond.notify_all()
+                self._wait_times.append(started - enqueued_at)
+                self._run_times.append(finished - started)
+                self._processed += 1
+                if failed:
+                    self._failed += 1
+                if self._depth == 0 and not self._running:
+                    self._cond.notify_all()
+
+    def join(self, timeout=None):
+        """Block until every queued job has finished. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._depth or self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def shutdown(self, wait=True):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if wait:
+            for t in self._threads:
+                t.join()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "depth": self._depth,
+                "in_flight": len(self._running),
+                "max_pending": self.max_pending,
+                "processed": self._processed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "queue_wait": summarize_latencies(list(self._wait_times)),
+                "processing": summarize_latencies(list(self._run_times)),
+            }
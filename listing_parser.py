@@ -0,0 +1,86 @@
+"""
+Parser for produce listings typed in one message, e.g.
+
+    Tomato 20kg ₹30, Onion 50kg ₹22
+    aloo 2 quintal @ 1800/qtl; bhindi 15 kg
+    टमाटर 20 किलो ₹30 और प्याज 50 किलो
+
+Each item needs a name and a quantity; the price is optional and read as per kg
+unless it says per quintal or per ton. Quantities in quintals or tons are given
+in kg.
+"""
+import re
+from typing import List, NamedTuple, Optional
+
+# kg per unit
+UNITS = {
+    'kg': 1, 'kgs': 1, 'kilo': 1, 'kilos': 1, 'kilogram': 1, 'kilograms': 1, 'किलो': 1, 'किग्रा': 1,
+    'q': 100, 'qtl': 100, 'qtls': 100, 'quintal': 100, 'quintals': 100, 'क्विंटल': 100, 'कुंतल': 100,
+    't': 1000, 'ton': 1000, 'tons': 1000, 'tonne': 1000, 'tonnes': 1000, 'टन': 1000,
+}
+_UNIT = "|".join(sorted(map(re.escape, UNITS), key=len, reverse=True))
+_NUMBER = r"(\d+(?:\.\d+)?)"
+# A unit must not run into a following letter ("2 kgx"), Devanagari included
+_END = r"(?![\wऀ-ॿ])"
+
+_QUANTITY = re.compile(rf"{_NUMBER}\s*({_UNIT}){_END}", re.IGNORECASE)
+_PRICE = re.compile(
+    rf"(?:(?:₹|rs\.?|inr|@)\s*{_NUMBER}|{_NUMBER}\s*(?:₹|rs\.?|rupees?|रुपये|रु\.?)(?![\wऀ-ॿ]))"
+    rf"(?:\s*(?:/|per|प्रति)\s*({_UNIT}){_END})?", re.IGNORECASE)
+_PRICE_PER_UNIT = re.compile(rf"{_NUMBER}\s*(?:/|per|प्रति)\s*({_UNIT}){_END}", re.IGNORECASE)
+_SEPARATORS = re.compile(r"[,;\n]+|\s+(?:and|&|और|तथा)\s+", re.IGNORECASE)
+_FILLER = re.compile(r"(?<![\wऀ-ॿ])(?:at|for|of|price|rate|qty|quantity|भाव|दाम)(?![\wऀ-ॿ])|[@:=\-–—()]",
+                     re.IGNORECASE)
+_DEVANAGARI_DIGITS = str.maketrans("०१२३४५६७८९", "0123456789")
+# Numbers or units left in a name mean the text was not "name quantity price" ("I have 20 kg tomatoes at 30")
+_STRAY = re.compile(rf"\d|(?<![\wऀ-ॿ])(?:{_UNIT})(?![\wऀ-ॿ])", re.IGNORECASE)
+
+
+class ListingItem(NamedTuple):
+    name: str
+    quantity_kg: float
+    price_per_kg: Optional[float]
+
+
+def _number(value):
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def parse_item(segment):
+    """One "name quantity [price]" item, or None if it has no name or no quantity."""
+    price = None
+    match = _PRICE.search(segment) or _PRICE_PER_UNIT.search(segment)
+    if match:
+        groups = [g for g in match.groups() if g is not None]
+        amount = float(groups[0])
+        unit = groups[1].lower() if len(groups) > 1 else 'kg'
+        price = _number(round(amount / UNITS[unit], 2))
+        segment = segment[:match.start()] + " " + segment[match.end():]
+
+    quantity = _QUANTITY.search(segment)
+    if quantity is None:
+        return None
+    quantity_kg = _number(float(quantity.group(1)) * UNITS[quantity.group(2).lower()])
+    name = segment[:quantity.start()] + " " + segment[quantity.end():]
+    name = " ".join(_FILLER.sub(" ", name).split()).strip(" .")
+    if not name or not quantity_kg or _STRAY.search(name):
+        return None
+    return ListingItem(name, quantity_kg, price)
+
+
+def parse_listing(text) -> Optional[List[ListingItem]]:
+    """
+    Every item in the message, or None unless the whole message reads as a listing
+    (each part has a name and a quantity), so "1" or a bare crop name still fall
+    through to the step-by-step flow.
+    """
+    text = (text or "").translate(_DEVANAGARI_DIGITS)
+    text = re.sub(r"(?<=\d),(?=\d{3}(?!\d))", "", text)   # 1,000 kg
+    segments = [s.strip() for s in _SEPARATORS.split(text) if s and s.strip()]
+    if not segments:
+        return None
+    items = [parse_item(s) for s in segments]
+    if any(item is None for item in items):
+        return None
+    return items
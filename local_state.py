@@ -0,0 +1,99 @@
+"""
+Building blocks shared by the caches and stores that keep state on the host:
+a SQLite connection per process, and single-flight calls.
+"""
+import os
+import sqlite3
+import threading
+
+
+class SqliteConnection:
+    """
+    Lazily opened SQLite connection to `path`, in WAL mode with `schema` (CREATE
+    statements) applied. Call it to get the connection.
+
+    sqlite connections must not cross a fork, so each process opens its own: a
+    call from a new pid reopens the file. With `autocommit` every statement
+    commits on its own (and synchronous=NORMAL, which is safe under WAL); with
+    `private` the file is made readable by its owner only.
+    """
+
+    def __init__(self, path, schema=(), autocommit=False, private=False, timeout=10):
+        self.path = path
+        self.schema = schema
+        self.autocommit = autocommit
+        self.private = private
+        self.timeout = timeout
+        self._db = None
+        self._pid = None
+
+    def __call__(self):
+        if self._db is None or self._pid != os.getpid():
+            self._db = self._open()
+            self._pid = os.getpid()
+        return self._db
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        kwargs = {"isolation_level": None} if self.autocommit else {}
+        db = sqlite3.connect(self.path, check_same_thread=False, timeout=self.timeout, **kwargs)
+        db.execute("PRAGMA journal_mode=WAL")
+        if self.autocommit:
+            db.execute("PRAGMA synchronous=NORMAL")
+        for statement in self.schema:
+            db.execute(statement)
+        db.commit()
+        if self.private:
+            try:
+                os.chmod(self.path, 0o600)
+            except OSError:
+                pass
+        return db
+
+
+class SingleFlight:
+    """
+    At most one call per key at a time: callers that arrive while it runs wait
+    for it and share its result instead of repeating the work.
+    """
+
+    class _Flight:
+        def __init__(self):
+            self.done = threading.Event()
+            self.value = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}   # key -> _Flight
+
+    def do(self, key, func):
+        """
+        Return (value, shared): func()'s result, and whether it came from a call
+        already running for the key. If func raises, the caller that ran it gets
+        the exception and the callers waiting on it get None.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = self._Flight()
+        if not leader:
+            flight.done.wait()
+            return flight.value, True
+        try:
+            flight.value = func()
+            return flight.value, False
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._flights
+
+    def __len__(self):
+        with self._lock:
+            return len(self._flights)
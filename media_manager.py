@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+import requests
+
+# WhatsApp keeps uploaded media for 30 days; re-upload a couple of days before that.
+MEDIA_TTL = 30 * 24 * 3600
+REFRESH_MARGIN = 2 * 24 * 3600
+
+
+class MediaManager:
+    """
+    Uploads the bundled audio prompts to the Graph /media endpoint and hands out
+    their media ids, so WhatsApp no longer fetches every prompt from GitHub.
+
+    Clips are matched by file name: a prompt URL ending in welcome.mp3 is sent as
+    the id of Audio_files/welcome.mp3. Ids are cached in a JSON file shared by the
+    workers, along with the upload time and a hash of the file. A clip is
+    re-uploaded when its id is close to expiry, when the file changes, or after
+    Graph rejects the id.
+    """
+
+    def __init__(self, client, phone_number_id, access_token, audio_dir, cache_path,
+                 ttl=MEDIA_TTL, refresh_margin=REFRESH_MARGIN):
+        self.client = client
+        self.phone_number_id = phone_number_id
+        self.access_token = access_token
+        self.audio_dir = audio_dir
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+
+        self._lock = threading.Lock()
+        self._upload_locks = {}
+        self._entries = self._load()   # file name -> {"id", "uploaded_at", "sha1"}
+        self._counters = {"hits": 0, "uploads": 0, "upload_errors": 0, "invalidated": 0, "not_local": 0}
+        self._refresher = None
+
+    @property
+    def enabled(self):
+        return bool(self.phone_number_id and self.access_token)
+
+    # --- cache file ---
+    def _load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read media cache {self.cache_path}: {e}")
+            return {}
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        directory = os.path.dirname(self.cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, indent=1)
+        os.replace(tmp, self.cache_path)
+
+    # --- helpers ---
+    def local_path(self, url_or_name):
+        """Path of the bundled clip a prompt URL refers to, or None if it isn't shipped."""
+        name = os.path.basename(url_or_name.split("?", 1)[0])
+        path = os.path.join(self.audio_dir, name)
+        return path if name and os.path.isfile(path) else None
+
+    def _fresh(self, entry, sha1=None):
+        if entry is None:
+            return False
+        if sha1 is not None and entry.get("sha1") != sha1:
+            return False
+        return time.time() - entry["uploaded_at"] < self.ttl - self.refresh_margin
+
+    def _upload(self, name, path):
+        with open(path, "rb") as f:
+            content = f.read()   # read up front so a retried POST re-sends the whole body
+        sha1 = hashlib.sha1(content).hexdigest()
+        resp = self.client.post(
+            f"/{self.phone_number_id}/media",
+            headers={"Authorization": f"Bearer {self.access_token}"},
+            data={"messaging_product": "whatsapp", "type": "audio/mpeg"},
+            files={"file": (name, content, "audio/mpeg")},
+            endpoint="media_upload")
+        resp.raise_for_status()
+        return {"id": resp.json()["id"], "uploaded_at": time.time(), "sha1": sha1}
+
+    # --- public API ---
+    def media_id(self, url_or_name):
+        """Media id for a bundled clip, uploading it if needed; None means send by link instead."""
+        if not self.enabled:
+            return None
+        path = self.local_path(url_or_name)
+        if path is None:
+            self._count("not_local")
+            return None
+        name = os.path.basename(path)
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if self._fresh(entry):
+                self._counters["hits"] += 1
+                return entry["id"]
+            upload_lock = self._upload_locks.setdefault(name, threading.Lock())
+
+        # One upload per clip at a time; whoever waited reuses the result
+        with upload_lock:
+            with self._lock:
+                # Another worker may have uploaded it since we started
+                self._entries.update({k: v for k, v in self._load().items()
+                                      if v.get("uploaded_at", 0) > self._entries.get(k, {}).get("uploaded_at", 0)})
+                entry = self._entries.get(name)
+                if self._fresh(entry):
+                    self._counters["hits"] += 1
+                    return entry["id"]
+            try:
+                entry = self._upload(name, path)
+            except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+                print(f"❌ Could not upload {name} to WhatsApp: {e}")
+                self._count("upload_errors")
+                return None
+            with self._lock:
+                self._entries[name] = entry
+                self._counters["uploads"] += 1
+                self._save()
+            print(f"📤 Uploaded {name} as media {entry['id']}")
+            return entry["id"]
+
+    def invalidate(self, url_or_name):
+        """Forget a clip's id (Graph rejected it); the next send re-uploads."""
+        name = os.path.basename(url_or_name.split("?", 1)[0])
+        with self._lock:
+            if self._entries.pop(name, None) is not None:
+                self._counters["invalidated"] += 1
+                self._save()
+
+    def refresh(self, names=None):
+        """Upload every clip (or `names`) that is missing, changed or near expiry; returns how many."""
+        if not self.enabled:
+            return 0
+        if names is None:
+            names = sorted(n for n in os.listdir(self.audio_dir) if n.endswith(".mp3"))
+        uploaded = 0
+        for name in names:
+            path = os.path.join(self.audio_dir, name)
+            with open(path, "rb") as f:
+                sha1 = hashlib.sha1(f.read()).hexdigest()
+            with self._lock:
+                stale = not self._fresh(self._entries.get(name), sha1)
+                if stale:
+                    self._entries.pop(name, None)
+            if stale and self.media_id(name):
+                uploaded += 1
+        return uploaded
+
+    def start_refresher(self, interval=6 * 3600):
+        """Daemon thread that keeps every clip uploaded and ahead of expiry."""
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+
+        def loop():
+            while True:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"❌ Media refresh failed: {e}")
+                time.sleep(interval)
+
+        self._refresher = threading.Thread(target=loop, name="media-refresher", daemon=True)
+        self._refresher.start()
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            stats = dict(self._counters)
+            stats["cached"] = len(self._entries)
+            ages = [now - e["uploaded_at"] for e in self._entries.values()]
+        stats["oldest_upload_days"] = round(max(ages) / 86400, 1) if ages else None
+        stats["enabled"] = self.enabled
+        return stats
@@ -0,0 +1,401 @@
+"""
+Instrumentation: Prometheus text-format metrics, timing helpers, JSON log lines
+tagged with a per-message trace id, and an opt-in sampling profiler.
+
+    @timed("backend.add_produce")
+    def add_produce_api(...): ...
+
+    with timed("scrape.agmarknet"):
+        ...
+
+    with trace(message_id):        # every print() in here carries trace_id
+        ...
+
+REGISTRY.render() is what /metrics serves. Besides the metrics created here, it
+calls collectors, i.e. functions that turn existing stats() dicts into samples,
+so components keep their own counters and are not instrumented twice.
+"""
+import io
+import os
+import sys
+import json
+import time
+import bisect
+import threading
+import contextvars
+from collections import Counter as _Tally
+from functools import wraps
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        out = []
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                out.append((f"{self.name}_bucket", key + (("le", _number(bound)),), cumulative))
+            out.append((f"{self.name}_count", key, cumulative))
+            out.append((f"{self.name}_sum", key, round(values[-1], 6)))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, labelnames, buckets)
+
+    def collector(self, func):
+        """
+        Register func() -> iterable of (name, kind, help, samples), where a sample is
+        (labels dict, value) or, for histograms, (sample name, labels dict, value).
+        A collector that raises is skipped for that scrape. Usable as a decorator.
+        """
+        with self._lock:
+            self._collectors.append(func)
+        return func
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for metric in metrics:
+            samples = metric.samples()
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(f"{name}{format_labels(labels)} {_number(value)}" for name, labels, value in samples)
+        seen = set()
+        for collect in collectors:
+            try:
+                families = list(collect())
+            except Exception as e:
+                print(f"⚠️ Metrics collector {getattr(collect, '__name__', collect)} failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                if name not in seen:
+                    seen.add(name)
+                    lines.extend([f"# HELP {name} {help}", f"# TYPE {name} {kind}"])
+                for sample in samples:
+                    sample_name, labels, value = sample if len(sample) == 3 else (name,) + tuple(sample)
+                    if isinstance(value, (int, float)):
+                        lines.append(f"{sample_name}{format_labels(sorted(labels.items()))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+OPERATION_SECONDS = REGISTRY.histogram(
+    "agrikart_operation_seconds", "Time spent in instrumented operations.", ("operation", "outcome"))
+
+
+class timed:
+    """
+    Decorator or context manager that observes the elapsed time into
+    agrikart_operation_seconds{operation=name, outcome="ok"|"error"}.
+    """
+
+    def __init__(self, name, histogram=None):
+        self.name = name
+        self.histogram = histogram or OPERATION_SECONDS
+        self._started = threading.local()
+
+    def __enter__(self):
+        stack = getattr(self._started, "stack", None)
+        if stack is None:
+            stack = self._started.stack = []
+        stack.append(time.perf_counter())
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._started.stack.pop()
+        self.histogram.observe(elapsed, operation=self.name, outcome="error" if exc_type else "ok")
+        return False
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def stats_samples(component, stats):
+    """
+    Numeric leaves of a stats() dict as (labels, value) samples for the
+    agrikart_component_stat gauge, with nested keys joined by dots:
+    {"queue": {"depth": 3}} -> {component="qa_pipeline", stat="queue.depth"} 3.
+    """
+    samples = []
+
+    def walk(node, path):
+        for key, value in node.items():
+            if isinstance(value, dict):
+                walk(value, f"{path}{key}.")
+            elif isinstance(value, (int, float)):
+                samples.append(({"component": component, "stat": f"{path}{key}"}, int(value) if isinstance(value, bool) else value))
+
+    walk(stats, "")
+    return samples
+
+
+def process_memory():
+    """Resident memory of this process in MB, now and at its peak (VmRSS/VmHWM, or ru_maxrss without /proc)."""
+    fields = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("VmRSS", "VmHWM"):
+                    fields[name] = int(value.split()[0]) / 1024
+    except (OSError, ValueError):
+        pass
+    if "VmHWM" not in fields:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss   # bytes on macOS, kB on Linux
+        fields["VmHWM"] = peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return {"rss_mb": round(fields.get("VmRSS", fields["VmHWM"]), 1), "peak_rss_mb": round(fields["VmHWM"], 1)}
+
+
+# --- trace ids ---
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+_profile_requested = contextvars.ContextVar("profile_requested", default=False)
+
+
+def current_trace():
+    return _trace_id.get()
+
+
+class trace:
+    """Context manager setting the trace id for this thread's (and its queued jobs') log lines."""
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or os.urandom(8).hex()
+
+    def __enter__(self):
+        self._token = _trace_id.set(self.trace_id)
+        return self.trace_id
+
+    def __exit__(self, *exc):
+        _trace_id.reset(self._token)
+        return False
+
+
+# --- JSON log lines ---
+_LEVELS = (("❌", "error"), ("⚠️", "warning"), ("ERROR", "error"), ("Error", "error"))
+
+
+class JsonLogStream(io.TextIOBase):
+    """
+    Stand-in for sys.stdout that turns every printed line into one JSON object:
+    {"ts", "level", "msg", "trace_id", "pid", "thread"}. The level is taken from
+    the emoji/"Error" prefix the existing print() calls use. Partial lines are
+    buffered per thread, so lines from concurrent threads are not interleaved.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", "") + text
+        *lines, self._local.buffer = buffer.split("\n")
+        for line in lines:
+            if line.strip():
+                self._emit(line)
+        return len(text)
+
+    def _emit(self, line):
+        level = next((lvl for prefix, lvl in _LEVELS if line.lstrip().startswith(prefix)), "info")
+        record = {
+            "ts": round(time.time(), 3), "level": level, "msg": line, "trace_id": _trace_id.get(),
+            "pid": os.getpid(), "thread": threading.current_thread().name,
+        }
+        with self._lock:
+            self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.stream.flush()
+
+    def flush(self):
+        self.stream.flush()
+
+
+def install_json_logs():
+    """Route print() output through JsonLogStream (LOG_FORMAT=json)."""
+    if not isinstance(sys.stdout, JsonLogStream):
+        sys.stdout = JsonLogStream(sys.stdout)
+
+
+# --- sampling profiler ---
+class SamplingProfiler:
+    """
+    Samples one thread's stack every `interval` seconds from a helper thread and
+    counts the collapsed stacks ("module:func;module:func;... count"), the input
+    format of flamegraph.pl and speedscope. Cheap enough to switch on for one
+    request in production; nothing runs while it is off.
+    """
+
+    def __init__(self, thread_id=None, interval=0.005, max_depth=64):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = _Tally()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def save(self, directory, name):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}.collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.collapsed())
+        return path
+
+
+def request_profiling(enabled=True):
+    """Mark the current context (and jobs queued from it) for profiling; returns a reset token."""
+    return _profile_requested.set(enabled)
+
+
+def profiling_requested():
+    return _profile_requested.get()
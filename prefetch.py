@@ -0,0 +1,226 @@
+"""
+Bulk prefetch of Agmarknet prices for every state x catalog commodity.
+
+Run it off-peak from cron:
+
+    python prefetch.py --workers 2 --rate 20
+
+or let the app run it daily by setting PREFETCH_HOUR (see app.py). Results are
+written into the shared price cache, so live lookups are served from disk/memory.
+"""
+import os
+import sys
+import time
+import fcntl
+import argparse
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RateLimiter:
+    """Spaces calls at least 60/per_minute seconds apart across all threads."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def catalog_pairs(states, products_by_category, only_states=None, only_commodities=None, resolve=None):
+    """
+    Every (state, commodity) pair from the catalog tables, optionally filtered.
+
+    With `resolve`, catalog names are mapped to their Agmarknet commodity first:
+    names that share one ("Tomato" and "Tomatoes") become one pair, and names
+    that don't resolve are dropped, since the scrape would find nothing for them.
+    """
+    commodities, dropped = [], []
+    for products in products_by_category.values():
+        for name in products:
+            commodity = resolve(name) if resolve else name
+            if commodity is None:
+                dropped.append(name)
+            elif commodity not in commodities:
+                commodities.append(commodity)
+    if dropped:
+        print(f"⚠️ Not prefetching {len(dropped)} catalog items with no Agmarknet commodity: {', '.join(dropped)}")
+    if only_states:
+        states = [s for s in states if s in only_states]
+    if only_commodities:
+        if resolve:
+            only_commodities = {resolve(c) or c for c in only_commodities}
+        commodities = [c for c in commodities if c in only_commodities]
+    return [(state, commodity) for state in states for commodity in commodities]
+
+
+def prefetch_prices(pairs, fetch, cache, window_days, workers=2, per_minute=20, skip_younger_than=None,
+                    summarize_batch=None, batch_size=50):
+    """
+    Fetch every pair with at most `workers` in flight and `per_minute` starts per minute,
+    storing results with cache.put(). Pairs cached more recently than `skip_younger_than`
+    seconds are skipped. Returns a summary dict.
+
+    With `summarize_batch`, fetch() returns raw rows instead. The rows are buffered and
+    summarized `batch_size` pairs at a time: summarize_batch({(state, commodity): rows})
+    returns {(state, commodity): value}, and only those values are cached.
+    """
+    limiter = RateLimiter(per_minute)
+    summary = {"pairs": len(pairs), "fetched": 0, "empty": 0, "skipped": 0, "errors": 0}
+    lock = threading.Lock()
+    pending = {}
+
+    def flush():
+        with lock:
+            batch = dict(pending)
+            pending.clear()
+        if not batch:
+            return
+        for (state, commodity), value in summarize_batch(batch).items():
+            if value is None:
+                outcome = "empty"
+            else:
+                cache.put(state, commodity, window_days, value)
+                outcome = "fetched"
+            with lock:
+                summary[outcome] += 1
+
+    def run_one(pair):
+        state, commodity = pair
+        if skip_younger_than is not None:
+            cached = cache.peek(state, commodity, window_days)
+            if cached is not None and cached[1] < skip_younger_than:
+                with lock:
+                    summary["skipped"] += 1
+                return
+        limiter.wait()
+        try:
+            value = fetch(state, commodity, window_days)
+        except Exception as e:
+            print(f"❌ Prefetch failed for {commodity}/{state}: {e}")
+            with lock:
+                summary["errors"] += 1
+            return
+        if summarize_batch is not None and value:
+            with lock:
+                pending[pair] = value
+                full = len(pending) >= batch_size
+            if full:
+                flush()
+            return
+        if value is None or summarize_batch is not None:
+            outcome = "empty"
+        else:
+            cache.put(state, commodity, window_days, value)
+            outcome = "fetched"
+        with lock:
+            summary[outcome] += 1
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch") as pool:
+        list(pool.map(run_one, pairs))
+    if summarize_batch is not None:
+        flush()
+    summary["seconds"] = round(time.monotonic() - started, 1)
+    print(f"📦 Prefetch finished: {summary}")
+    return summary
+
+
+class _HostLock:
+    """Non-blocking flock so only one process per host runs a prefetch pass."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fh = None
+
+    def __enter__(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fh = open(self.path, "w")
+        try:
+            fcntl.flock(self._fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._fh.close()
+            self._fh = None
+        return self._fh is not None
+
+    def __exit__(self, *exc):
+        if self._fh is not None:
+            fcntl.flock(self._fh, fcntl.LOCK_UN)
+            self._fh.close()
+
+
+class PrefetchScheduler:
+    """Daemon thread that runs `job()` once a day at `hour` local time."""
+
+    def __init__(self, job, hour, lock_path):
+        self.job = job
+        self.hour = hour
+        self.lock_path = lock_path
+        self._thread = None
+
+    def seconds_until_next_run(self, now=None):
+        now = now or datetime.now()
+        next_run = now.replace(hour=self.hour, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return (next_run - now).total_seconds()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, name="prefetch-scheduler", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.seconds_until_next_run())
+            with _HostLock(self.lock_path) as acquired:
+                if not acquired:
+                    print("⏭️ Another process is already prefetching prices")
+                    continue
+                try:
+                    self.job()
+                except Exception as e:
+                    print(f"❌ Scheduled prefetch failed: {e}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prefetch Agmarknet prices into the local price cache.")
+    parser.add_argument("--states", nargs="*", help="Only these states (default: all of AGMARKNET_STATES)")
+    parser.add_argument("--commodities", nargs="*", help="Only these commodities (default: whole catalog)")
+    parser.add_argument("--workers", type=int, default=2, help="Parallel scrapes")
+    parser.add_argument("--rate", type=float, default=20, help="Max scrapes started per minute")
+    parser.add_argument("--skip-younger-than", type=int, default=None,
+                        help="Skip pairs cached less than this many seconds ago")
+    args = parser.parse_args(argv)
+
+    import app  # deferred: importing app builds the driver pool and price cache
+
+    pairs = catalog_pairs(list(app.AGMARKNET_STATES), app.PRODUCTS_BY_CATEGORY,
+                          args.states, args.commodities, resolve=app.sanitize_commodity_name)
+    with _HostLock(app.PREFETCH_LOCK_PATH) as acquired:
+        if not acquired:
+            print("⏭️ Another process is already prefetching prices")
+            return 1
+        try:
+            prefetch_prices(pairs, app.scrape_price_rows, app.price_cache, app.PRICE_WINDOW_DAYS,
+                            workers=args.workers, per_minute=args.rate,
+                            skip_younger_than=args.skip_younger_than,
+                            summarize_batch=lambda rows_by_pair: app.batch_statistics(rows_by_pair, app.PRICE_WINDOW_DAYS))
+        finally:
+            app.driver_pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
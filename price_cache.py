@@ -0,0 +1,164 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from local_state import SingleFlight, SqliteConnection
+
+
+def normalize_commodity(commodity):
+    return " ".join(commodity.lower().split())
+
+
+class PriceCache:
+    """
+    Mandi price cache keyed by (state, commodity, window_days).
+
+    Entries live in an in-memory LRU backed by a SQLite file, so they survive
+    restarts and are shared by every worker on the host. An entry younger than
+    `ttl` is served as is. Up to `stale_ttl` seconds after that it is still
+    served, while a single background refresh replaces it. Concurrent misses
+    for the same key wait on one fetch instead of each scraping Agmarknet.
+
+    With `resolve` (e.g. CommodityResolver.resolve), the commodity in the key is
+    its Agmarknet name, so "tomatoes" and "Tomato" share an entry; a name that
+    does not resolve has no key and is never fetched.
+    """
+
+    def __init__(self, path, ttl=6 * 3600, stale_ttl=18 * 3600, max_entries=5000, table='prices', resolve=None):
+        self.path = path
+        self.table = table
+        self.resolve = resolve
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()   # key -> (value, fetched_at)
+        self._flights = SingleFlight()
+        self._conn = SqliteConnection(path, [
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " state TEXT NOT NULL, commodity TEXT NOT NULL, window_days INTEGER NOT NULL,"
+            " value TEXT NOT NULL, fetched_at REAL NOT NULL,"
+            " PRIMARY KEY (state, commodity, window_days))"])
+        self._counters = {
+            "hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0,
+            "refreshes": 0, "fetch_errors": 0, "disk_loads": 0, "unresolved": 0,
+        }
+
+    # --- SQLite layer ---
+    def _load(self, key):
+        row = self._conn().execute(
+            f"SELECT value, fetched_at FROM {self.table} WHERE state = ? AND commodity = ? AND window_days = ?",
+            key).fetchone()
+        if row is None:
+            return None
+        self._counters["disk_loads"] += 1
+        return json.loads(row[0]), row[1]
+
+    def _store(self, key, value, fetched_at):
+        db = self._conn()
+        db.execute(
+            f"INSERT OR REPLACE INTO {self.table} (state, commodity, window_days, value, fetched_at)"
+            " VALUES (?, ?, ?, ?, ?)", key + (json.dumps(value), fetched_at))
+        db.commit()
+
+    def _remember(self, key, value, fetched_at):
+        self._memory[key] = (value, fetched_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # --- Public API ---
+    def key(self, state, commodity, window_days):
+        """(state, commodity, window_days) as stored, or None if the commodity does not resolve."""
+        if self.resolve is not None:
+            commodity = self.resolve(commodity)
+            if commodity is None:
+                return None
+        return (state, normalize_commodity(commodity), int(window_days))
+
+    def peek(self, state, commodity, window_days):
+        """Return (value, age_seconds) without fetching, or None if nothing is cached."""
+        key = self.key(state, commodity, window_days)
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._memory.get(key)
+            # An expired entry may have been refreshed on disk by prefetch or another worker
+            if entry is None or time.time() - entry[1] >= self.ttl:
+                stored = self._load(key)
+                if stored is not None and (entry is None or stored[1] > entry[1]):
+                    entry = stored
+                    self._remember(key, *entry)
+        if entry is None:
+            return None
+        return entry[0], time.time() - entry[1]
+
+    def put(self, state, commodity, window_days, value, fetched_at=None):
+        key = self.key(state, commodity, window_days)
+        if key is None:
+            return
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        with self._lock:
+            self._remember(key, value, fetched_at)
+            self._store(key, value, fetched_at)
+
+    def get(self, state, commodity, window_days, fetch):
+        """
+        Return the cached value for the key, calling fetch() on a miss. Failed fetches (None) are
+        not cached, and a commodity that does not resolve returns None without fetching.
+        """
+        key = self.key(state, commodity, window_days)
+        if key is None:
+            self._count("unresolved")
+            return None
+        cached = self.peek(*key)
+        if cached is not None:
+            value, age = cached
+            if age < self.ttl:
+                self._count("hits")
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self._count("stale_hits")
+                self._refresh_in_background(key, fetch)
+                return value
+        self._count("misses")
+        return self._fetch_once(key, fetch)
+
+    def _fetch_once(self, key, fetch):
+        value, shared = self._flights.do(key, lambda: self._fetch(key, fetch))
+        if shared:
+            self._count("coalesced")
+        return value
+
+    def _fetch(self, key, fetch):
+        try:
+            value = fetch()
+        except Exception as e:
+            print(f"❌ Price fetch failed for {key}: {e}")
+            value = None
+        if value is None:
+            self._count("fetch_errors")
+        else:
+            self.put(*key, value)
+        return value
+
+    def _refresh_in_background(self, key, fetch):
+        if key in self._flights:
+            return
+        self._count("refreshes")
+        threading.Thread(target=self._fetch_once, args=(key, fetch), daemon=True).start()
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries_in_memory"] = len(self._memory)
+            stats["in_flight"] = len(self._flights)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
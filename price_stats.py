@@ -0,0 +1,129 @@
+from datetime import date, timedelta
+
+QUINTAL_KG = 100
+
+# numpy is imported inside the functions: it is most of this module's import cost,
+# and a worker that never looks up a price should not pay it at startup.
+
+
+def _grouped_quantile(prices, starts, counts, q):
+    """q-quantile (linear interpolation, like np.percentile) of each sorted group."""
+    import numpy as np
+    pos = starts + q * (counts - 1)
+    last = len(prices) - 1   # empty groups point past the end; their values are discarded
+    lo = np.minimum(np.floor(pos).astype(np.int64), last)
+    hi = np.minimum(np.ceil(pos).astype(np.int64), last)
+    return prices[lo] + (prices[hi] - prices[lo]) * (pos - lo)
+
+
+def batch_statistics(rows_by_key, window_days=None, today=None):
+    """
+    Price statistics for many (state, commodity) keys in one vectorized pass.
+
+    rows_by_key maps any hashable key to a list of grid_parser.PriceRow. Rows older
+    than window_days (relative to today) are dropped. Modal prices outside 1.5 x IQR
+    are dropped per key. For the rest, the result has the median, a market-weighted
+    modal (each market counts once however many quotes it has), the linear trend in
+    Rs./quintal per day, and the coefficient of variation. Keys with no usable rows
+    map to None.
+    """
+    import numpy as np
+
+    today = today or date.today()
+    cutoff = (today - timedelta(days=window_days)).toordinal() if window_days else None
+
+    keys = list(rows_by_key)
+    group, price, day, market = [], [], [], []
+    for g, key in enumerate(keys):
+        for row in rows_by_key[key] or ():
+            ordinal = row.arrival_date.toordinal() if row.arrival_date else today.toordinal()
+            if cutoff is not None and ordinal < cutoff:
+                continue
+            group.append(g)
+            price.append(row.modal_price)
+            day.append(ordinal)
+            market.append(f"{row.district}|{row.market}")
+
+    results = {key: None for key in keys}
+    if not price:
+        return results
+
+    n_groups = len(keys)
+    group = np.asarray(group, dtype=np.int64)
+    price = np.asarray(price, dtype=np.float64)
+    day = np.asarray(day, dtype=np.int64)
+    _, market = np.unique(np.asarray(market), return_inverse=True)
+
+    # Sort by (group, price) once; every per-group quantile is then index arithmetic
+    order = np.lexsort((price, group))
+    group, price, day, market = group[order], price[order], day[order], market[order]
+    counts = np.bincount(group, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    present = counts > 0
+    safe_counts = np.maximum(counts, 1)
+
+    q1 = _grouped_quantile(price, starts, safe_counts, 0.25)
+    q3 = _grouped_quantile(price, starts, safe_counts, 0.75)
+    iqr = q3 - q1
+    keep = (price >= (q1 - 1.5 * iqr)[group]) & (price <= (q3 + 1.5 * iqr)[group])
+
+    # Filtering preserves the sort order, so the filtered groups stay contiguous
+    f_group, f_price, f_day, f_market = group[keep], price[keep], day[keep], market[keep]
+    f_counts = np.bincount(f_group, minlength=n_groups)
+    f_starts = np.concatenate(([0], np.cumsum(f_counts)[:-1]))
+    f_safe = np.maximum(f_counts, 1)
+    median = _grouped_quantile(f_price, f_starts, f_safe, 0.5)
+
+    # Market weighting: each quote weighs 1 / (quotes from that market in the group)
+    pair = f_group * (int(market.max()) + 1) + f_market
+    _, pair_index, pair_counts = np.unique(pair, return_inverse=True, return_counts=True)
+    weight = 1.0 / pair_counts[pair_index]
+    weighted_modal = np.bincount(f_group, weight * f_price, n_groups) / np.maximum(np.bincount(f_group, weight, n_groups), 1e-12)
+    markets = np.bincount(f_group[np.unique(pair, return_index=True)[1]], minlength=n_groups)
+
+    total = np.bincount(f_group, f_price, n_groups)
+    mean = total / f_safe
+    variance = np.maximum(np.bincount(f_group, f_price ** 2, n_groups) / f_safe - mean ** 2, 0.0)
+    volatility = np.sqrt(variance) / np.maximum(mean, 1e-12)
+
+    # Least-squares slope of price over days, from per-group sums
+    x = (f_day - f_day.min()).astype(np.float64)
+    sx = np.bincount(f_group, x, n_groups)
+    sxx = np.bincount(f_group, x * x, n_groups)
+    sxy = np.bincount(f_group, x * f_price, n_groups)
+    denom = f_counts * sxx - sx ** 2
+    trend = np.where(denom > 0, (f_counts * sxy - sx * total) / np.where(denom > 0, denom, 1), 0.0)
+
+    latest = np.zeros(n_groups, dtype=np.int64)
+    np.maximum.at(latest, f_group, f_day)
+    lowest = np.full(n_groups, np.inf)
+    np.minimum.at(lowest, group, price)
+    highest = np.full(n_groups, -np.inf)
+    np.maximum.at(highest, group, price)
+
+    for g, key in enumerate(keys):
+        if not present[g]:
+            continue
+        results[key] = {
+            "window_days": window_days,
+            "count": int(counts[g]),
+            "used": int(f_counts[g]),
+            "markets": int(markets[g]),
+            "median": int(median[g]),
+            "weighted_modal": int(round(weighted_modal[g])),
+            "mean": round(float(mean[g]), 1),
+            "q1": round(float(q1[g]), 1),
+            "q3": round(float(q3[g]), 1),
+            "min": int(lowest[g]),
+            "max": int(highest[g]),
+            "trend_per_day": round(float(trend[g]), 1),
+            "volatility": round(float(volatility[g]), 4),
+            "per_kg": round(float(median[g]) / QUINTAL_KG, 2),
+            "latest_date": date.fromordinal(int(latest[g])).isoformat(),
+        }
+    return results
+
+
+def price_statistics(rows, window_days=None, today=None):
+    """batch_statistics for a single list of rows."""
+    return batch_statistics({None: rows}, window_days, today)[None]
@@ -0,0 +1,79 @@
+import threading
+
+from job_queue import KeyedJobQueue
+
+ACCEPTED = "accepted"
+USER_BUSY = "user_busy"
+FULL = "full"
+
+
+class QAPipeline:
+    """
+    Answers voice doubts off the conversation thread.
+
+    `concurrency` worker threads bound the calls in flight to the QA backend, and
+    each farmer may have at most `per_user` questions queued or running. A job
+    calls answer(phone, *args), which returns the replies to send, and then
+    deliver(replies). If answer() raises, the farmer gets `failure_replies(phone, error)`
+    instead. Queue wait and service time come from the underlying KeyedJobQueue.
+    """
+
+    def __init__(self, answer, deliver, failure_replies, concurrency=4, per_user=1, max_pending=200):
+        self.answer = answer
+        self.deliver = deliver
+        self.failure_replies = failure_replies
+        self.per_user = per_user
+        self.queue = KeyedJobQueue(workers=concurrency, max_pending=max_pending, name="qa")
+        self._lock = threading.Lock()
+        self._in_flight = {}   # phone -> questions queued or running
+        self._counters = {ACCEPTED: 0, USER_BUSY: 0, FULL: 0, "answered": 0, "failed": 0}
+
+    def submit(self, phone, *args):
+        """Queue a question; returns ACCEPTED, USER_BUSY or FULL."""
+        with self._lock:
+            if self._in_flight.get(phone, 0) >= self.per_user:
+                self._counters[USER_BUSY] += 1
+                return USER_BUSY
+            self._in_flight[phone] = self._in_flight.get(phone, 0) + 1
+        if not self.queue.submit(phone, self._run, phone, args):
+            self._done(phone)
+            with self._lock:
+                self._counters[FULL] += 1
+            return FULL
+        with self._lock:
+            self._counters[ACCEPTED] += 1
+        return ACCEPTED
+
+    def _run(self, phone, args):
+        try:
+            try:
+                replies = self.answer(phone, *args)
+                outcome = "answered"
+            except Exception as e:
+                print(f"❌ QA failed for {phone}: {e}")
+                replies = self.failure_replies(phone, e)
+                outcome = "failed"
+            with self._lock:
+                self._counters[outcome] += 1
+            self.deliver(replies)
+        finally:
+            self._done(phone)
+
+    def _done(self, phone):
+        with self._lock:
+            left = self._in_flight.get(phone, 0) - 1
+            if left > 0:
+                self._in_flight[phone] = left
+            else:
+                self._in_flight.pop(phone, None)
+
+    def join(self, timeout=None):
+        return self.queue.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["users_waiting"] = len(self._in_flight)
+        stats["per_user"] = self.per_user
+        stats["queue"] = self.queue.stats()
+        return stats
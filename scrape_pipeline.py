@@ -0,0 +1,139 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from job_queue import summarize_latencies
+
+
+class ScrapeCancelled(Exception):
+    """The scrape's deadline passed or it was cancelled from another thread."""
+
+
+class Deadline:
+    """
+    Time budget shared by every phase of one scrape.
+
+    Waits ask it how long they may block, and cancel() wakes them up right away.
+    Resources that can hang (a browser, an HTTP session) register a cleanup with
+    on_cancel() so a timed-out scrape releases them instead of leaking.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def remaining(self):
+        if self._cancelled.is_set():
+            return 0.0
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, phase=""):
+        if self.expired():
+            raise ScrapeCancelled(f"Deadline of {self.seconds}s reached{' during ' + phase if phase else ''}")
+
+    def sleep(self, seconds):
+        """Sleep up to `seconds`, returning early (and raising) if cancelled."""
+        self._cancelled.wait(min(seconds, self.remaining()))
+        self.check()
+
+    def on_cancel(self, callback):
+        with self._lock:
+            self._callbacks.append(callback)
+
+    def off_cancel(self, callback):
+        """
+        Unregister a callback once its resource is handed back. False if cancel() has
+        already taken it, in which case the resource has been (or is being) cleaned up.
+        """
+        with self._lock:
+            try:
+                self._callbacks.remove(callback)
+            except ValueError:
+                return False
+            return True
+
+    def cancel(self):
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️ Cancel cleanup failed: {e}")
+
+
+def wait_until(condition, deadline, phase="", initial=0.05, factor=1.5, max_interval=1.0, ignored=()):
+    """
+    Poll condition() until it returns something truthy and return that value.
+
+    The poll interval starts at `initial` and grows by `factor` up to `max_interval`,
+    so fast pages are picked up in tens of milliseconds without spinning on slow
+    ones. Exceptions listed in `ignored` (e.g. stale elements mid-postback) count
+    as "not ready yet". Raises ScrapeCancelled when the deadline runs out.
+    """
+    interval = initial
+    while True:
+        deadline.check(phase)
+        try:
+            result = condition()
+        except ignored:
+            result = None
+        if result:
+            return result
+        deadline.sleep(interval)
+        interval = min(interval * factor, max_interval)
+
+
+class PhaseTimer:
+    """Wall-clock time of each named phase of one scrape."""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def phase(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.monotonic() - started
+
+    def summary(self):
+        return ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.timings.items())
+
+
+class PhaseStats:
+    """Rolling per-phase latency samples across scrapes, for /stats."""
+
+    def __init__(self, sample_size=500):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._outcomes = {}
+        self.sample_size = sample_size
+
+    def record(self, timer, outcome):
+        with self._lock:
+            for name, seconds in timer.timings.items():
+                self._samples.setdefault(name, deque(maxlen=self.sample_size)).append(seconds)
+            self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "outcomes": dict(self._outcomes),
+                "phases": {name: summarize_latencies(list(samples)) for name, samples in self._samples.items()},
+            }
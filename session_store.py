@@ -0,0 +1,353 @@
+"""
+Conversation state per phone number, shared by every gunicorn worker.
+
+    with session_store.transaction(phone) as session:
+        session['state'] = 'awaiting_name'
+
+A transaction holds a per-user lock (across threads, processes and, with Redis,
+hosts) for its whole body, so two messages from the same farmer can never
+interleave their read-modify-write. Sessions idle for longer than `ttl` are evicted.
+
+Backends: "memory" (single process, LRU + TTL), "sqlite" (one host, WAL file),
+"redis" (any number of hosts; "fake://" uses stubs.fake_redis in-process).
+"""
+import json
+import time
+import uuid
+import copy
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from local_state import SqliteConnection
+
+
+class SessionLockTimeout(Exception):
+    """Another worker kept the user's session locked for longer than lock_timeout."""
+
+
+def new_session():
+    return {"data": {}}
+
+
+class SessionStore:
+    """
+    Base class: subclasses implement _read/_write/_delete and _acquire/_release.
+
+    `lease` bounds how long a crashed holder can keep a user locked; it must be
+    longer than the slowest conversation step (a price scrape).
+    """
+
+    def __init__(self, ttl=3 * 24 * 3600, lock_timeout=30, lease=120):
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.lease = lease
+        self._counter_lock = threading.Lock()
+        self._counters = {"reads": 0, "writes": 0, "lock_waits": 0, "lock_timeouts": 0, "evicted": 0}
+
+    def _count(self, name, n=1):
+        with self._counter_lock:
+            self._counters[name] += n
+
+    @contextmanager
+    def transaction(self, key):
+        """
+        Yield the user's session dict (a fresh one for new users) with their lock held,
+        and save it on exit. Like the plain dict it replaces, changes made before an
+        exception are kept.
+        """
+        token = self._acquire(key)
+        try:
+            session = self._read(key)
+            self._count("reads")
+            if session is None:
+                session = new_session()
+            try:
+                yield session
+            finally:
+                self._write(key, session)
+                self._count("writes")
+        finally:
+            self._release(key, token)
+
+    def get(self, key):
+        """Read-only snapshot of the session, or None."""
+        self._count("reads")
+        return self._read(key)
+
+    def delete(self, key):
+        self._delete(key)
+
+    def _wait_for_lock(self, try_acquire, key):
+        deadline = time.monotonic() + self.lock_timeout
+        interval = 0.01
+        waited = False
+        while True:
+            token = try_acquire()
+            if token is not None:
+                return token
+            if not waited:
+                self._count("lock_waits")
+                waited = True
+            if time.monotonic() >= deadline:
+                self._count("lock_timeouts")
+                raise SessionLockTimeout(f"session {key} is still locked after {self.lock_timeout}s")
+            time.sleep(interval)
+            interval = min(interval * 2, 0.25)
+
+    def evict_idle(self):
+        """Drop sessions idle for longer than ttl; returns how many were removed."""
+        return 0
+
+    def state_counts(self):
+        """{conversation state: live sessions in it}, or None where counting would mean a full scan."""
+        return None
+
+    def stats(self):
+        with self._counter_lock:
+            stats = dict(self._counters)
+        stats["backend"] = self.backend
+        return stats
+
+
+class MemorySessionStore(SessionStore):
+    """In-process LRU with idle TTL. Only correct with a single worker process."""
+
+    backend = "memory"
+
+    def __init__(self, max_sessions=10000, stripes=64, **kwargs):
+        super().__init__(**kwargs)
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()   # key -> (session, touched_at)
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+
+    def _stripe(self, key):
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def _acquire(self, key):
+        lock = self._stripe(key)
+        if lock.acquire(blocking=False):
+            return lock
+        self._count("lock_waits")
+        if not lock.acquire(timeout=self.lock_timeout):
+            self._count("lock_timeouts")
+            raise SessionLockTimeout(f"session {key} is still locked after {self.lock_timeout}s")
+        return lock
+
+    def _release(self, key, lock):
+        lock.release()
+
+    def _read(self, key):
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                return None
+            session, touched_at = entry
+            expired = time.time() - touched_at > self.ttl
+            if expired:
+                del self._sessions[key]
+            else:
+                session = copy.deepcopy(session)
+        if expired:
+            self._count("evicted")
+            return None
+        return session
+
+    def _write(self, key, session):
+        with self._lock:
+            self._sessions[key] = (copy.deepcopy(session), time.time())
+            self._sessions.move_to_end(key)
+            evicted = 0
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self._count("evicted", evicted)
+
+    def _delete(self, key):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def evict_idle(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            idle = [key for key, (_, touched_at) in self._sessions.items() if touched_at < cutoff]
+            for key in idle:
+                del self._sessions[key]
+        self._count("evicted", len(idle))
+        return len(idle)
+
+    def state_counts(self):
+        with self._lock:
+            sessions = [session for session, _ in self._sessions.values()]
+        counts = {}
+        for session in sessions:
+            state = session.get("state") or "none"
+            counts[state] = counts.get(state, 0) + 1
+        return counts
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats["sessions"] = len(self._sessions)
+        return stats
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions in a SQLite file in WAL mode, shared by every process on the host.
+    Per-user locks are lease rows, so a worker that dies mid-step only blocks that
+    user until the lease expires. Idle sessions are swept every `sweep_every` writes.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path, sweep_every=500, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.sweep_every = sweep_every
+        self._lock = threading.Lock()
+        self._conn = SqliteConnection(path, [
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)",
+            "CREATE TABLE IF NOT EXISTS session_locks ("
+            " key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)",
+        ], autocommit=True)
+        self._writes_since_sweep = 0
+
+    def _acquire(self, key):
+        token = uuid.uuid4().hex
+
+        def try_acquire():
+            now = time.time()
+            with self._lock:
+                # Take the row if it is free or its lease ran out; rowcount says whether we won
+                cur = self._conn().execute(
+                    "INSERT INTO session_locks (key, owner, expires_at) VALUES (?, ?, ?)"
+                    " ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at"
+                    " WHERE session_locks.expires_at < ?",
+                    (key, token, now + self.lease, now))
+            return token if cur.rowcount == 1 else None
+
+        return self._wait_for_lock(try_acquire, key)
+
+    def _release(self, key, token):
+        with self._lock:
+            self._conn().execute("DELETE FROM session_locks WHERE key = ? AND owner = ?", (key, token))
+
+    def _read(self, key):
+        with self._lock:
+            row = self._conn().execute(
+                "SELECT value, updated_at FROM sessions WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def _write(self, key, session):
+        with self._lock:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO sessions (key, value, updated_at) VALUES (?, ?, ?)",
+                (key, json.dumps(session, ensure_ascii=False), time.time()))
+            self._writes_since_sweep += 1
+            sweep = self._writes_since_sweep >= self.sweep_every
+            if sweep:
+                self._writes_since_sweep = 0
+        if sweep:
+            self.evict_idle()
+
+    def _delete(self, key):
+        with self._lock:
+            self._conn().execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    def evict_idle(self):
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            removed = db.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl,)).rowcount
+            db.execute("DELETE FROM session_locks WHERE expires_at < ?", (now,))
+        self._count("evicted", removed)
+        return removed
+
+    def state_counts(self):
+        with self._lock:
+            rows = self._conn().execute(
+                "SELECT COALESCE(json_extract(value, '$.state'), 'none'), COUNT(*) FROM sessions"
+                " WHERE updated_at >= ? GROUP BY 1", (time.time() - self.ttl,)).fetchall()
+        return dict(rows)
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats["sessions"] = self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return stats
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Sessions as JSON strings in Redis (or anything speaking its GET/SET/DEL subset),
+    expiring natively after `ttl` idle seconds. Locks are SET NX PX leases.
+    """
+
+    backend = "redis"
+
+    def __init__(self, client, prefix="agrikart:session:", **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, key):
+        return f"{self.prefix}{key}"
+
+    def _lock_key(self, key):
+        return f"{self.prefix}lock:{key}"
+
+    def _acquire(self, key):
+        token = uuid.uuid4().hex
+
+        def try_acquire():
+            ok = self.client.set(self._lock_key(key), token, nx=True, px=int(self.lease * 1000))
+            return token if ok else None
+
+        return self._wait_for_lock(try_acquire, key)
+
+    def _release(self, key, token):
+        # Only drop the lock if it is still ours; an expired lease may have passed to another worker.
+        # GET+DEL is not atomic, but the window is a single round trip and the lease bounds any damage.
+        lock_key = self._lock_key(key)
+        current = self.client.get(lock_key)
+        if isinstance(current, bytes):
+            current = current.decode()
+        if current == token:
+            self.client.delete(lock_key)
+
+    def _read(self, key):
+        raw = self.client.get(self._key(key))
+        return json.loads(raw) if raw is not None else None
+
+    def _write(self, key, session):
+        self.client.set(self._key(key), json.dumps(session, ensure_ascii=False), ex=int(self.ttl))
+
+    def _delete(self, key):
+        self.client.delete(self._key(key))
+
+
+def create_session_store(kind, path=None, redis_url=None, ttl=3 * 24 * 3600, max_sessions=10000):
+    """Build the backend named by SESSION_STORE ("memory", "sqlite" or "redis")."""
+    if kind == "memory":
+        return MemorySessionStore(max_sessions=max_sessions, ttl=ttl)
+    if kind == "sqlite":
+        return SQLiteSessionStore(path, ttl=ttl)
+    if kind == "redis":
+        if not redis_url:
+            raise ValueError("SESSION_STORE=redis needs REDIS_URL (or REDIS_URL=fake:// for the in-process stub)")
+        if redis_url.startswith("fake://"):
+            from stubs.fake_redis import FakeRedis
+            return RedisSessionStore(FakeRedis(), ttl=ttl)
+        try:
+            import redis  # only needed for a real Redis deployment
+        except ImportError as e:
+            raise ImportError("SESSION_STORE=redis needs the redis package: pip install redis") from e
+        return RedisSessionStore(redis.Redis.from_url(redis_url), ttl=ttl)
+    raise ValueError(f"Unknown session store: {kind!r}")
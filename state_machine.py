@@ -0,0 +1,204 @@
+"""
+Table-driven conversation engine.
+
+Handlers are registered per state and declare which states they may move to:
+
+    conversation = StateMachine()
+
+    @conversation.state('awaiting_name', to={'awaiting_address'})
+    def on_name(turn):
+        turn.session['data']['name'] = turn.body
+        turn.play(AUDIO_CLIPS[turn.lang]['ask_address'])
+        return 'awaiting_address'
+
+A handler never sends anything itself: turn.say()/turn.play() queue Reply
+records, and dispatch() returns them in the Transition for the caller to
+deliver (or for a replay harness to record). A handler that is about to do
+slow work can turn.flush() what it has queued so far.
+
+Slow lookups that do not change the session can be registered as a prefetch
+for the state. fetch() runs it on a snapshot of the session before the caller
+locks it, and the handler then finds the result in turn.prefetched:
+
+    @conversation.prefetch('awaiting_crop_name')
+    def fetch_price(turn):
+        return get_price_statistics("Kerala", turn.body.strip())
+"""
+import time
+import threading
+from collections import deque
+from typing import Callable, FrozenSet, List, NamedTuple, Optional
+
+from job_queue import summarize_latencies
+
+
+class InvalidTransition(Exception):
+    """A handler moved to a state it did not declare."""
+
+
+class Reply(NamedTuple):
+    kind: str      # "text" or "audio"
+    to: str
+    body: str      # message text, or the audio URL
+
+
+class Transition(NamedTuple):
+    handler: str
+    from_state: Optional[str]
+    to_state: Optional[str]
+    replies: List[Reply]
+    seconds: float
+
+
+class Handler(NamedTuple):
+    name: str
+    func: Callable
+    targets: FrozenSet[str]
+
+
+class Prefetched(NamedTuple):
+    state: Optional[str]   # the state the value was fetched for
+    value: object
+
+
+class Turn:
+    """One inbound WhatsApp message, the sender's session, and the replies queued so far."""
+
+    def __init__(self, phone, body='', audio_url=None, session=None, deliver=None, message=None, prefetched=None):
+        self.phone = phone
+        self.body = body
+        self.command = body.strip().lower()
+        self.audio_url = audio_url
+        self.session = session if session is not None else {"data": {}}
+        self.message = message
+        self.prefetched = prefetched
+        self.replies = []
+        self._deliver = deliver
+
+    @classmethod
+    def from_message(cls, message, session=None, deliver=None, prefetched=None):
+        """Build a turn from one entry of a webhook's value.messages list."""
+        return cls(
+            phone=message['from'],
+            body=message['text']['body'] if 'text' in message else '',
+            audio_url=message['audio']['url'] if 'audio' in message else None,
+            session=session, deliver=deliver, message=message, prefetched=prefetched)
+
+    @property
+    def state(self):
+        return self.session.get('state')
+
+    @property
+    def lang(self):
+        return self.session.get('language', 'en')
+
+    def say(self, text):
+        self.replies.append(Reply('text', self.phone, text))
+
+    def play(self, url):
+        self.replies.append(Reply('audio', self.phone, url))
+
+    def flush(self):
+        """Deliver the replies queued so far right away (before slow work), if a deliverer is set."""
+        if self._deliver is None or not self.replies:
+            return
+        pending, self.replies = self.replies, []
+        self._deliver(pending)
+
+
+class StateMachine:
+    """
+    Registry of state -> handler plus command triggers that apply in any state
+    (e.g. the greeting that restarts the flow). Dispatch is a dict lookup, and
+    the time spent in each handler is recorded.
+    """
+
+    def __init__(self, sample_size=1000):
+        self._handlers = {}
+        self._triggers = {}
+        self._prefetches = {}
+        self._lock = threading.Lock()
+        self._sample_size = sample_size
+        self._latencies = {}
+        self._counters = {}
+
+    def state(self, name, to=()):
+        """Register the decorated function as the handler for `name`; `to` lists the states it may return."""
+        def register(func):
+            if name in self._handlers:
+                raise ValueError(f"State {name!r} already has a handler")
+            self._handlers[name] = Handler(name, func, frozenset(to))
+            return func
+        return register
+
+    def trigger(self, commands, name, to=()):
+        """Register a handler run for these commands whatever the current state."""
+        def register(func):
+            handler = Handler(name, func, frozenset(to))
+            for command in commands:
+                self._triggers[command] = handler
+            return func
+        return register
+
+    def prefetch(self, *names):
+        """Register the decorated function as the slow, read-only lookup for these states."""
+        def register(func):
+            for name in names:
+                self._prefetches[name] = func
+            return func
+        return register
+
+    def fetch(self, turn):
+        """
+        Run the prefetch for the turn's state, without holding the session lock.
+        Returns a Prefetched to hand to the locked turn, or None if there was nothing to
+        fetch (no prefetch for the state, or it returned None).
+        """
+        func = None if turn.command in self._triggers else self._prefetches.get(turn.state)
+        value = None if func is None else func(turn)
+        if value is None:
+            return None
+        return Prefetched(turn.state, value)
+
+    @property
+    def states(self):
+        return sorted(self._handlers)
+
+    def dispatch(self, turn):
+        """Run the handler for the turn and move the session to the state it returns (None = stay)."""
+        from_state = turn.state
+        if turn.prefetched is not None and turn.prefetched.state != from_state:
+            turn.prefetched = None   # fetched for a state the session has since left
+        handler = self._triggers.get(turn.command) or self._handlers.get(from_state)
+        if handler is None:
+            return Transition(None, from_state, from_state, turn.replies, 0.0)
+
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            to_state = handler.func(turn)
+            if to_state is not None:
+                if to_state not in handler.targets:
+                    raise InvalidTransition(f"{handler.name} -> {to_state!r} is not declared")
+                turn.session['state'] = to_state
+            outcome = "ok"
+        finally:
+            elapsed = time.perf_counter() - started
+            self._record(handler.name, elapsed, outcome)
+        return Transition(handler.name, from_state, turn.state, turn.replies, elapsed)
+
+    def _record(self, name, seconds, outcome):
+        with self._lock:
+            samples = self._latencies.get(name)
+            if samples is None:
+                samples = self._latencies[name] = deque(maxlen=self._sample_size)
+                self._counters[name] = {"ok": 0, "error": 0}
+            samples.append(seconds)
+            self._counters[name][outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {**self._counters[name], **summarize_latencies(list(samples))}
+                for name, samples in self._latencies.items()
+            }
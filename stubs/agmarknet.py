@@ -0,0 +1,114 @@
+"""
+Local stand-in for agmarknet.gov.in/SearchCmmMkt.aspx that serves the saved pages
+in fixtures/agmarknet. Point the app at it with
+
+    python -m stubs.agmarknet --port 8001
+    AGMARKNET_URL=http://127.0.0.1:8001/SearchCmmMkt.aspx
+
+GET returns the search form. A dropdown postback (__EVENTTARGET) returns the form
+with that option selected. Submitting btnGo returns results_<commodity>_<state>.html
+if it exists, otherwise the "No Data Found" page. A share of requests
+(`error_rate`) fail with a 503, like the real site under load.
+"""
+import os
+import re
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures', 'agmarknet')
+
+
+def _read(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def _slug(text):
+    return re.sub(r'[^a-z0-9]+', '_', text.lower()).strip('_')
+
+
+def _select(html, select_id, value):
+    """Mark `value` as the selected option of one dropdown in the search page."""
+    start = html.index(f'id="{select_id}"')
+    end = html.index('</select>', start)
+    block = html[start:end].replace(' selected="selected"', '')
+    block = block.replace(f'<option value="{value}">', f'<option selected="selected" value="{value}">')
+    return html[:start] + block + html[end:]
+
+
+class AgmarknetStubHandler(BaseHTTPRequestHandler):
+    server_version = "AgmarknetStub/1.0"
+    latency = 0.0          # seconds added to every response
+    error_rate = 0.0       # share of requests answered with a 503
+    requests_served = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        time.sleep(self.latency)
+        AgmarknetStubHandler.requests_served += 1
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _injected_error(self):
+        if self.error_rate and random.random() < self.error_rate:
+            self._send(503, 'Service Unavailable')
+            return True
+        return False
+
+    def do_GET(self):
+        if not self.path.startswith('/SearchCmmMkt.aspx'):
+            return self._send(404, 'Not Found')
+        if self._injected_error():
+            return
+        self._send(200, _read('search.html'))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode('utf-8'), keep_blank_values=True).items()}
+        if self._injected_error():
+            return
+        if not form.get('__VIEWSTATE') or not form.get('__EVENTVALIDATION'):
+            return self._send(500, 'Invalid postback or callback argument.')
+
+        page = _read('search.html')
+        for field in ('ddlCommodity', 'ddlState'):
+            if form.get(field, '0') != '0':
+                page = _select(page, field, form[field])
+        if form.get('__EVENTTARGET') or 'btnGo' not in form:
+            return self._send(200, page)
+
+        commodity = re.search(rf'<option value="{re.escape(form.get("ddlCommodity", ""))}">([^<]+)<', _read('search.html'))
+        name = f"results_{_slug(commodity.group(1)) if commodity else 'unknown'}_{form.get('ddlState', '')}.html"
+        if os.path.exists(os.path.join(FIXTURES_DIR, name)):
+            return self._send(200, _read(name))
+        self._send(200, _read('no_data.html'))
+
+
+def serve_in_thread(port=0, latency=0.0, error_rate=0.0):
+    """Start the stub on 127.0.0.1 in a daemon thread; returns (server, base_url)."""
+    handler = type('Handler', (AgmarknetStubHandler,), {'latency': latency, 'error_rate': error_rate})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/SearchCmmMkt.aspx"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests that fail (0-1)')
+    args = parser.parse_args()
+    AgmarknetStubHandler.latency = args.latency
+    AgmarknetStubHandler.error_rate = args.error_rate
+    print(f"🧪 Agmarknet stub on http://127.0.0.1:{args.port}/SearchCmmMkt.aspx")
+    ThreadingHTTPServer(('127.0.0.1', args.port), AgmarknetStubHandler).serve_forever()
@@ -0,0 +1,153 @@
+"""
+Local stand-in for the AgriKart backend API. Point the app at it with
+
+    python -m stubs.backend --port 8004 --latency 0.05
+    BACKEND_API_BASE_URL=http://127.0.0.1:8004
+
+Implements the calls the bot makes: GET /api/v1/farmer/check/<phone>/, POST
+/api/v1/auth/signup/farmer/, POST /api/v1/auth/token/ and .../token/refresh/
+(JWT-shaped tokens with a real `exp`, lifetimes set by --access-ttl) and POST
+/api/v1/produce/ (Bearer token required). Farmers are kept in memory, seeded
+with `farmers`. `latency` is added to every response and a share of requests
+(`error_rate`) fail with a 500.
+"""
+import json
+import time
+import uuid
+import base64
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_token(kind, phone, ttl):
+    def part(obj):
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).decode().rstrip("=")
+    claims = {"token_type": kind, "user": phone, "exp": int(time.time() + ttl), "jti": uuid.uuid4().hex}
+    return f"{part({'alg': 'none', 'typ': 'JWT'})}.{part(claims)}.stub"
+
+
+def token_claims(token):
+    try:
+        payload = token.split(".")[1]
+        return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except (IndexError, ValueError):
+        return None
+
+
+class BackendStubHandler(BaseHTTPRequestHandler):
+    server_version = "BackendStub/1.0"
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    error_rate = 0.0
+    access_ttl = 300
+    refresh_ttl = 24 * 3600
+
+    lock = threading.Lock()
+    farmers = {}        # phone -> password
+    produce = []
+    calls = {}          # endpoint -> count
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _begin(self, endpoint):
+        cls = type(self)
+        with cls.lock:
+            cls.calls[endpoint] = cls.calls.get(endpoint, 0) + 1
+        time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            self._send_json(500, {"detail": "Injected server error"})
+            return False
+        return True
+
+    def _json_body(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        try:
+            return json.loads(body or b'{}')
+        except ValueError:
+            return {}
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        if parts[:4] != ['api', 'v1', 'farmer', 'check'] or len(parts) != 5:
+            return self._send_json(404, {"detail": "Not found."})
+        if not self._begin('farmer_check'):
+            return
+        with self.lock:
+            exists = parts[4] in self.farmers
+        self._send_json(200, {"exists": exists})
+
+    def do_POST(self):
+        path = '/' + self.path.strip('/') + '/'
+        data = self._json_body()
+        cls = type(self)
+        if path == '/api/v1/auth/signup/farmer/':
+            if not self._begin('signup'):
+                return
+            with cls.lock:
+                if data.get('phone_number') in cls.farmers:
+                    return self._send_json(400, {"username": ["A user with that username already exists."]})
+                cls.farmers[data.get('phone_number')] = data.get('password')
+            return self._send_json(201, {"id": len(cls.farmers), "username": data.get('username')})
+        if path == '/api/v1/auth/token/':
+            if not self._begin('token'):
+                return
+            with cls.lock:
+                ok = data.get('username') in cls.farmers and cls.farmers[data['username']] == data.get('password')
+            if not ok:
+                return self._send_json(401, {"detail": "No active account found with the given credentials"})
+            return self._send_json(200, {"access": make_token("access", data['username'], self.access_ttl),
+                                         "refresh": make_token("refresh", data['username'], self.refresh_ttl)})
+        if path == '/api/v1/auth/token/refresh/':
+            if not self._begin('token_refresh'):
+                return
+            claims = token_claims(data.get('refresh', ''))
+            if not claims or claims.get('token_type') != 'refresh' or claims['exp'] < time.time():
+                return self._send_json(401, {"detail": "Token is invalid or expired", "code": "token_not_valid"})
+            return self._send_json(200, {"access": make_token("access", claims['user'], self.access_ttl)})
+        if path == '/api/v1/produce/':
+            if not self._begin('produce'):
+                return
+            claims = token_claims(self.headers.get('Authorization', '').replace('Bearer ', '', 1))
+            if not claims or claims.get('token_type') != 'access' or claims['exp'] < time.time():
+                return self._send_json(401, {"detail": "Given token not valid for any token type"})
+            with cls.lock:
+                cls.produce.append(dict(data, farmer=claims['user']))
+                produce_id = len(cls.produce)
+            return self._send_json(201, dict(data, id=produce_id))
+        self._send_json(404, {"detail": "Not found."})
+
+
+def serve_in_thread(port=0, latency=0.0, error_rate=0.0, farmers=None, access_ttl=300):
+    """Start the stub on 127.0.0.1 in a daemon thread; returns (server, base_url)."""
+    handler = type('Handler', (BackendStubHandler,), {
+        'latency': latency, 'error_rate': error_rate, 'access_ttl': access_ttl,
+        'lock': threading.Lock(), 'farmers': dict(farmers or {}), 'produce': [], 'calls': {},
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8004)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests that fail (0-1)')
+    parser.add_argument('--access-ttl', type=int, default=300, help='Access token lifetime in seconds')
+    args = parser.parse_args()
+    BackendStubHandler.latency = args.latency
+    BackendStubHandler.error_rate = args.error_rate
+    BackendStubHandler.access_ttl = args.access_ttl
+    print(f"🧪 Backend stub on http://127.0.0.1:{args.port}")
+    ThreadingHTTPServer(('127.0.0.1', args.port), BackendStubHandler).serve_forever()
@@ -0,0 +1,75 @@
+"""
+In-process stand-in for the slice of the redis-py client the app uses
+(GET / SET with EX, PX, NX / DEL / EXISTS / INCR / EXPIRE), with key expiry.
+Like redis-py without decode_responses, values come back as bytes.
+
+    RedisSessionStore(FakeRedis())      # or SESSION_STORE=redis REDIS_URL=fake://
+"""
+import time
+import threading
+
+
+class FakeRedis:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}   # key -> (bytes value, expires_at or None)
+
+    @staticmethod
+    def _encode(value):
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode('utf-8')
+
+    def _live(self, name):
+        entry = self._data.get(name)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[name]
+            return None
+        return entry
+
+    def get(self, name):
+        with self._lock:
+            entry = self._live(name)
+            return entry[0] if entry else None
+
+    def set(self, name, value, ex=None, px=None, nx=False, xx=False):
+        expires_at = None
+        if ex is not None:
+            expires_at = time.monotonic() + ex
+        elif px is not None:
+            expires_at = time.monotonic() + px / 1000.0
+        with self._lock:
+            exists = self._live(name) is not None
+            if (nx and exists) or (xx and not exists):
+                return None
+            self._data[name] = (self._encode(value), expires_at)
+            return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(1 for name in names if self._live(name) is not None and self._data.pop(name))
+
+    def exists(self, *names):
+        with self._lock:
+            return sum(1 for name in names if self._live(name) is not None)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            entry = self._live(name)
+            value = int(entry[0]) + amount if entry else amount
+            self._data[name] = (self._encode(value), entry[1] if entry else None)
+            return value
+
+    def expire(self, name, seconds):
+        with self._lock:
+            entry = self._live(name)
+            if entry is None:
+                return False
+            self._data[name] = (entry[0], time.monotonic() + seconds)
+            return True
+
+    def dbsize(self):
+        with self._lock:
+            return sum(1 for name in list(self._data) if self._live(name) is not None)
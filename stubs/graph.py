@@ -0,0 +1,137 @@
+"""
+Local stand-in for the WhatsApp Cloud (Graph) API. Point the app at it with
+
+    python -m stubs.graph --port 8003 --latency 0.15
+    GRAPH_API_URL=http://127.0.0.1:8003/v19.0
+
+POST /<version>/<phone_number_id>/messages records the message and answers with a
+wamid. POST .../media "uploads" a clip and returns a media id. GET /media/<name>
+serves fake voice-note bytes, so audio messages can carry a url pointing here.
+`latency` is added to every response. A share of requests (`error_rate`) fail with
+a 500, or with a 429 plus X-Business-Use-Case-Usage when `throttle` is set.
+
+Every accepted message is kept in `sent` as (monotonic time, to, type, body) and
+anyone can block on wait_for(to, count, timeout) for a farmer's next reply.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VOICE_NOTE = b"OggS" + bytes(range(256)) * 64   # ~16 KB of "audio"
+
+
+class GraphStubHandler(BaseHTTPRequestHandler):
+    server_version = "GraphStub/1.0"
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    error_rate = 0.0
+    throttle = False
+
+    cond = threading.Condition()
+    sent = []
+    by_phone = {}      # to -> indexes into sent
+    uploads = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _injected_error(self):
+        time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            if self.throttle:
+                usage = json.dumps({"0": [{"type": "whatsapp", "call_count": 100, "estimated_time_to_regain_access": 0}]})
+                self._send_json(429, {"error": {"message": "(#80007) Rate limit hit", "code": 80007}},
+                                {"X-Business-Use-Case-Usage": usage, "Retry-After": "1"})
+            else:
+                self._send_json(500, {"error": {"message": "An unexpected error has occurred.", "code": 2}})
+            return True
+        return False
+
+    def do_GET(self):
+        if not self.path.startswith('/media/'):
+            return self._send_json(404, {"error": {"message": "Unknown path"}})
+        if self._injected_error():
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/ogg')
+        self.send_header('Content-Length', str(len(VOICE_NOTE)))
+        self.end_headers()
+        self.wfile.write(VOICE_NOTE)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self._injected_error():
+            return
+        cls = type(self)
+        if self.path.rstrip('/').endswith('/media'):
+            with cls.cond:
+                cls.uploads += 1
+                media_id = f"media-{cls.uploads}"
+            return self._send_json(200, {"id": media_id})
+        if not self.path.rstrip('/').endswith('/messages'):
+            return self._send_json(404, {"error": {"message": "Unknown path"}})
+        payload = json.loads(body or b'{}')
+        kind = payload.get('type', 'text')
+        content = payload.get(kind, {})
+        text = content.get('body') if kind == 'text' else content.get('id') or content.get('link')
+        with cls.cond:
+            cls.by_phone.setdefault(payload.get('to'), []).append(len(cls.sent))
+            cls.sent.append((time.monotonic(), payload.get('to'), kind, text))
+            cls.cond.notify_all()
+        self._send_json(200, {"messaging_product": "whatsapp", "contacts": [{"wa_id": payload.get('to')}],
+                              "messages": [{"id": f"wamid.stub{len(cls.sent)}"}]})
+
+    @classmethod
+    def replies_to(cls, to):
+        with cls.cond:
+            return [cls.sent[i] for i in cls.by_phone.get(to, [])]
+
+    @classmethod
+    def wait_for(cls, to, count, timeout):
+        """Block until `to` has received more than `count` messages; returns them all, or None on timeout."""
+        deadline = time.monotonic() + timeout
+        with cls.cond:
+            while len(cls.by_phone.get(to, [])) <= count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                cls.cond.wait(remaining)
+            return [cls.sent[i] for i in cls.by_phone[to]]
+
+
+def serve_in_thread(port=0, latency=0.0, error_rate=0.0, throttle=False):
+    """Start the stub on 127.0.0.1 in a daemon thread; returns (server, api_url)."""
+    handler = type('Handler', (GraphStubHandler,), {
+        'latency': latency, 'error_rate': error_rate, 'throttle': throttle,
+        'cond': threading.Condition(), 'sent': [], 'by_phone': {}, 'uploads': 0,
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v19.0"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8003)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests that fail (0-1)')
+    parser.add_argument('--throttle', action='store_true', help='Fail with 429 rate-limit errors instead of 500s')
+    args = parser.parse_args()
+    GraphStubHandler.latency = args.latency
+    GraphStubHandler.error_rate = args.error_rate
+    GraphStubHandler.throttle = args.throttle
+    print(f"🧪 Graph stub on http://127.0.0.1:{args.port}/v19.0")
+    ThreadingHTTPServer(('127.0.0.1', args.port), GraphStubHandler).serve_forever()
@@ -0,0 +1,130 @@
+"""
+Local stand-in for the truefoundry ASR/LLM /chat service. Point the app at it with
+
+    python -m stubs.qa --port 8002 --latency 5
+    QA_CHAT_URL=http://127.0.0.1:8002/chat
+
+POST /chat takes multipart/form-data with `file` and `lang` (chunked or with a
+Content-Length), waits `latency` seconds to mimic ASR + LLM time, and answers
+with a canned transcription, response and audio_url. POST /transcribe takes the
+same form, waits `asr_latency` seconds and returns only the transcription (for
+QA_TRANSCRIBE_URL). A share of requests (`error_rate`) fail with a 502, as the
+gateway in front of the model does when it times out. It also reports how many requests were in flight at once,
+so concurrency caps can be checked.
+"""
+import io
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from werkzeug.formparser import parse_form_data
+
+ANSWERS = {
+    'en': "Spray neem oil (5 ml per litre) every 7 days and remove the affected leaves.",
+    'hi': "हर 7 दिन में नीम का तेल (5 मिली प्रति लीटर) छिड़कें और प्रभावित पत्तियाँ हटा दें।",
+}
+
+
+class QAStubHandler(BaseHTTPRequestHandler):
+    server_version = "QAStub/1.0"
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    asr_latency = 0.0
+    error_rate = 0.0
+    audio_url = None
+
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    requests_served = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return bytes(body)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        route = self.path.rstrip('/').rsplit('/', 1)[-1]
+        if route not in ('chat', 'transcribe'):
+            return self._send_json(404, {'detail': 'Not Found'})
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            body = self._read_body()
+            environ = {
+                'REQUEST_METHOD': 'POST', 'CONTENT_TYPE': self.headers.get('Content-Type', ''),
+                'CONTENT_LENGTH': str(len(body)), 'wsgi.input': io.BytesIO(body),
+            }
+            _, form, files = parse_form_data(environ)
+            if 'file' not in files or 'lang' not in form:
+                return self._send_json(422, {'detail': 'file and lang are required'})
+            size = len(files['file'].read())
+            if self.error_rate and random.random() < self.error_rate:
+                time.sleep(self.latency)
+                return self._send_json(502, {'detail': 'Bad Gateway'})
+            lang = form['lang'] if form['lang'] in ANSWERS else 'en'
+            transcription = f"(stub) {size} bytes of {files['file'].filename} in {lang}"
+            if route == 'transcribe':
+                time.sleep(self.asr_latency)
+                return self._send_json(200, {'transcription': transcription})
+            time.sleep(self.latency)
+            self._send_json(200, {
+                'transcription': transcription,
+                'response': ANSWERS[lang],
+                'audio_url': self.audio_url,
+            })
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+                cls.requests_served += 1
+
+
+def serve_in_thread(port=0, latency=0.0, audio_url=None, asr_latency=0.0, error_rate=0.0):
+    """Start the stub on 127.0.0.1 in a daemon thread; returns (server, chat_url)."""
+    handler = type('Handler', (QAStubHandler,), {
+        'latency': latency, 'asr_latency': asr_latency, 'error_rate': error_rate, 'audio_url': audio_url,
+        'lock': threading.Lock(),
+        'in_flight': 0, 'max_in_flight': 0, 'requests_served': 0,
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/chat"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8002)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds spent "thinking" per question')
+    parser.add_argument('--asr-latency', type=float, default=0.0, help='Seconds per /transcribe call')
+    parser.add_argument('--audio-url', default=None, help='audio_url to return with every answer')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests that fail (0-1)')
+    args = parser.parse_args()
+    QAStubHandler.error_rate = args.error_rate
+    QAStubHandler.latency = args.latency
+    QAStubHandler.asr_latency = args.asr_latency
+    QAStubHandler.audio_url = args.audio_url
+    print(f"🧪 QA stub on http://127.0.0.1:{args.port}/chat")
+    ThreadingHTTPServer(('127.0.0.1', args.port), QAStubHandler).serve_forever()
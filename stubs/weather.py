@@ -0,0 +1,111 @@
+"""
+Local stand-in for the Open-Meteo forecast API. Point the app at it with
+
+    python -m stubs.weather --port 8005 --latency 0.2
+    WEATHER_API_URL=http://127.0.0.1:8005
+
+GET /v1/forecast answers in Open-Meteo's shape (current and daily blocks for
+forecast_days days) with made-up but stable weather: the same coordinates
+always get the same forecast. Every request is counted per coordinate in
+`requests`, so a test can check that farmers in one grid cell caused a single
+upstream fetch. `latency` is added to every response and a share of requests
+(`error_rate`) fail with a 503.
+"""
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import date, timedelta
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CODES = [0, 1, 2, 3, 45, 51, 61, 63, 65, 80, 81, 95]
+
+
+def forecast_for(lat, lon, days):
+    """Deterministic Open-Meteo style forecast for the coordinates."""
+    seed = int(hashlib.md5(f"{lat:.4f},{lon:.4f}".encode()).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    base = 34 - (lat - 20) * 0.6          # cooler to the north
+    daily = {"time": [], "weather_code": [], "temperature_2m_max": [], "temperature_2m_min": [],
+             "precipitation_sum": [], "precipitation_probability_max": []}
+    for offset in range(days):
+        code = rng.choice(CODES)
+        chance = rng.randint(50, 95) if code >= 51 else rng.randint(0, 30)
+        high = round(base + rng.uniform(-3, 3), 1)
+        daily["time"].append((date.today() + timedelta(days=offset)).isoformat())
+        daily["weather_code"].append(code)
+        daily["temperature_2m_max"].append(high)
+        daily["temperature_2m_min"].append(round(high - rng.uniform(7, 12), 1))
+        daily["precipitation_sum"].append(round(rng.uniform(2, 30), 1) if code >= 51 else 0.0)
+        daily["precipitation_probability_max"].append(chance)
+    return {
+        "latitude": lat, "longitude": lon, "timezone": "Asia/Kolkata",
+        "current": {"temperature_2m": round(base + rng.uniform(-4, 2), 1),
+                    "relative_humidity_2m": rng.randint(30, 90), "wind_speed_10m": round(rng.uniform(2, 25), 1),
+                    "weather_code": daily["weather_code"][0]},
+        "daily": daily,
+    }
+
+
+class WeatherStubHandler(BaseHTTPRequestHandler):
+    server_version = "WeatherStub/1.0"
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    error_rate = 0.0
+
+    lock = threading.Lock()
+    requests = {}      # (lat, lon) -> count
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip('/') != '/v1/forecast':
+            return self._send_json(404, {"error": True, "reason": "Not found"})
+        query = parse_qs(url.query)
+        try:
+            lat, lon = float(query['latitude'][0]), float(query['longitude'][0])
+            days = int(query.get('forecast_days', ['7'])[0])
+        except (KeyError, ValueError):
+            return self._send_json(400, {"error": True, "reason": "latitude and longitude are required"})
+        cls = type(self)
+        with cls.lock:
+            cls.requests[(lat, lon)] = cls.requests.get((lat, lon), 0) + 1
+        time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            return self._send_json(503, {"error": True, "reason": "Injected upstream error"})
+        self._send_json(200, forecast_for(lat, lon, days))
+
+
+def serve_in_thread(port=0, latency=0.0, error_rate=0.0):
+    """Start the stub on 127.0.0.1 in a daemon thread; returns (server, base_url)."""
+    handler = type('Handler', (WeatherStubHandler,), {
+        'latency': latency, 'error_rate': error_rate, 'lock': threading.Lock(), 'requests': {},
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8005)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests that fail (0-1)')
+    args = parser.parse_args()
+    WeatherStubHandler.latency = args.latency
+    WeatherStubHandler.error_rate = args.error_rate
+    print(f"🧪 Weather stub on http://127.0.0.1:{args.port}")
+    ThreadingHTTPServer(('127.0.0.1', args.port), WeatherStubHandler).serve_forever()
@@ -0,0 +1,32 @@
+import os
+import sys
+import json
+import subprocess
+
+from conftest import ROOT
+
+# Resolved in a fresh interpreter per hash seed: set iteration order is fixed at startup
+RESOLVE = """
+import json, sys
+from commodity_resolver import CommodityResolver, catalog_aliases
+resolver = CommodityResolver(None, aliases=catalog_aliases({"Dairy": ["Ghee", "Paneer", "Milk"],
+                                                           "Vegetables": ["Lady Finger", "Tomato"]}))
+print(json.dumps({word: resolver.resolve(word) for word in sys.argv[1:]}))
+"""
+
+WORDS = ["Ghee", "Paneer", "Milk", "chai", "pea", "order", "Lady Finger", "tamatar", "onin", "Tomatos"]
+EXPECTED = {
+    "Ghee": None, "Paneer": None, "Milk": None, "chai": None, "pea": None, "order": None,
+    "Lady Finger": "Bhindi(Ladies Finger)", "tamatar": "Tomato", "onin": "Onion", "Tomatos": "Tomato",
+}
+
+
+def resolve_with_seed(seed):
+    env = dict(os.environ, PYTHONHASHSEED=str(seed))
+    out = subprocess.run([sys.executable, "-c", RESOLVE, *WORDS], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def test_resolution_does_not_depend_on_hash_seed():
+    assert resolve_with_seed(0) == resolve_with_seed(1) == EXPECTED
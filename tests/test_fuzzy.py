@@ -0,0 +1,44 @@
+import os
+import sys
+import json
+import subprocess
+
+from conftest import ROOT
+from fuzzy import shortlist, trigrams, votes
+
+LOOKUP = """
+import json, sys
+from gazetteer import Gazetteer
+gazetteer = Gazetteer("data/india_places.tsv")
+matches = {text: gazetteer.lookup(text) for text in sys.argv[1:]}
+print(json.dumps({text: match and [match.place.name, match.place.district, match.how]
+                  for text, match in matches.items()}))
+"""
+
+PLACES = ["Thrisur", "Kozhikod", "Palakad", "Patana", "Kanpr", "Aluva Ernakulam", "Munar"]
+
+
+def test_ties_go_to_the_name_then_the_position():
+    counts = {3: 2, 1: 2, 2: 2, 0: 1}
+    assert shortlist(counts, 2) == [1, 2]
+    names = {1: "pear", 2: "okra", 3: "apple"}
+    assert shortlist(counts, 2, name=names.get) == [3, 2]
+
+
+def test_votes_count_shared_trigrams():
+    index = {}
+    for position, name in enumerate(["onion", "tomato"]):
+        for gram in trigrams(name):
+            index.setdefault(gram, []).append(position)
+    assert votes(trigrams("onin"), index) == {0: 3}
+
+
+def lookup_with_seed(seed):
+    env = dict(os.environ, PYTHONHASHSEED=str(seed))
+    out = subprocess.run([sys.executable, "-c", LOOKUP, *PLACES], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def test_gazetteer_does_not_depend_on_the_hash_seed():
+    assert lookup_with_seed(0) == lookup_with_seed(1)
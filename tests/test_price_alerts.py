@@ -0,0 +1,34 @@
+import pytest
+
+from broadcast import parse_alerts
+
+
+@pytest.fixture
+def client():
+    import app
+    return app.app.test_client()
+
+
+def test_alert_that_is_not_an_object_is_a_400(client):
+    response = client.post('/price-alerts', json={"alerts": [1]})
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "alerts[0] must be an object"}
+
+
+def test_phone_numbers_as_a_string_is_a_400(client):
+    response = client.post('/price-alerts', json={"commodity": "Onion", "phone_numbers": "9198"})
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "phone_numbers must be a non-empty list"}
+
+
+def test_one_crop_for_many_farmers():
+    alerts = parse_alerts({"commodity": "Onion", "phone_numbers": ["9198", "9199"], "state": "Kerala"})
+    assert alerts == [{"phone_number": "9198", "commodity": "Onion", "state": "Kerala"},
+                      {"phone_number": "9199", "commodity": "Onion", "state": "Kerala"}]
+
+
+def test_bad_field_is_named():
+    with pytest.raises(ValueError, match=r"alerts\[1\]\.commodity is required"):
+        parse_alerts({"alerts": [{"phone_number": "9198", "commodity": "Onion"}, {"phone_number": "9199"}]})
+    with pytest.raises(ValueError, match=r"phone_numbers\[1\] must be a string"):
+        parse_alerts({"commodity": "Onion", "phone_numbers": ["9198", 9199]})
@@ -0,0 +1,27 @@
+import time
+
+from price_cache import PriceCache
+
+
+def test_expired_entry_picks_up_a_newer_row_from_another_instance(tmp_path):
+    path = str(tmp_path / "prices.db")
+    worker, prefetch = PriceCache(path, ttl=60), PriceCache(path, ttl=60)
+    worker.put("Kerala", "Tomato", 7, {"per_kg": 20}, fetched_at=time.time() - 120)
+    assert worker.peek("Kerala", "Tomato", 7)[0] == {"per_kg": 20}
+
+    prefetch.put("Kerala", "Tomato", 7, {"per_kg": 25})
+
+    def fetch():
+        raise AssertionError("the fresh row on disk should be served")
+
+    assert worker.get("Kerala", "Tomato", 7, fetch) == {"per_kg": 25}
+    assert worker.stats()["hits"] == 1
+
+
+def test_fresh_entry_is_served_from_memory(tmp_path):
+    path = str(tmp_path / "prices.db")
+    worker, prefetch = PriceCache(path, ttl=60), PriceCache(path, ttl=60)
+    worker.put("Kerala", "Tomato", 7, {"per_kg": 20})
+    prefetch.put("Kerala", "Tomato", 7, {"per_kg": 25})
+    assert worker.peek("Kerala", "Tomato", 7)[0] == {"per_kg": 20}
+    assert worker.stats()["disk_loads"] == 0
@@ -0,0 +1,12 @@
+import pytest
+
+from session_store import RedisSessionStore, create_session_store
+
+
+def test_redis_without_url_is_an_error():
+    with pytest.raises(ValueError, match="REDIS_URL"):
+        create_session_store("redis", redis_url=None)
+
+
+def test_fake_redis_only_when_asked_for():
+    assert isinstance(create_session_store("redis", redis_url="fake://"), RedisSessionStore)
@@ -0,0 +1,27 @@
+import time
+
+from metrics import REGISTRY
+from weather import ForecastCache
+
+
+def test_malformed_response_serves_the_stale_forecast(tmp_path):
+    cache = ForecastCache(str(tmp_path / "forecasts.db"), ttl=60, stale_ttl=3600)
+    stale = ({"days": [{"max": 31}]}, time.time() - 120)
+    cache._remember(cache.cell(10.0, 76.2), *stale)
+
+    def fetch(lat, lon):
+        raise ValueError("forecast response has no daily data")
+
+    assert cache.get(10.0, 76.2, fetch) == stale
+    stats = cache.stats()
+    assert (stats["bad_responses"], stats["fetch_errors"], stats["stale_served"]) == (1, 1, 1)
+    assert 'operation="weather.fetch",outcome="error"' in REGISTRY.render()
+
+
+def test_malformed_response_without_a_stale_forecast_is_none(tmp_path):
+    cache = ForecastCache(str(tmp_path / "forecasts.db"), ttl=60, stale_ttl=3600)
+
+    def fetch(lat, lon):
+        raise ValueError("forecast response has no daily data")
+
+    assert cache.get(10.0, 76.2, fetch) is None
@@ -0,0 +1,48 @@
+import pytest
+
+
+class GraphResponse:
+    def __init__(self, status_code, error=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self._body = {"error": error} if error else {"messages": [{"id": "wamid.1"}]}
+        self.text = str(self._body)
+
+    def json(self):
+        return self._body
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    import app
+    sent, invalidated, responses = [], [], []
+
+    def post(url, headers=None, json=None, endpoint=None):
+        sent.append(json["audio"])
+        return responses.pop(0)
+
+    monkeypatch.setattr(app.graph_client, "post", post)
+    monkeypatch.setattr(app.media_manager, "media_id", lambda url: "media-1")
+    monkeypatch.setattr(app.media_manager, "invalidate", invalidated.append)
+    return app, sent, invalidated, responses
+
+
+def test_expired_media_id_is_invalidated_and_sent_by_link(graph):
+    app, sent, invalidated, responses = graph
+    responses += [GraphResponse(400, {"code": 131053, "message": "Media upload error"}), GraphResponse(200)]
+    assert app.send_whatsapp_audio("9198", "https://host/audio/greeting.mp3")
+    assert sent == [{"id": "media-1"}, {"link": "https://host/audio/greeting.mp3"}]
+    assert invalidated == ["https://host/audio/greeting.mp3"]
+
+
+@pytest.mark.parametrize("status, error", [
+    (429, {"code": 131056, "message": "Pair rate limit hit"}),
+    (500, {"code": 131000, "message": "Something went wrong"}),
+    (400, {"code": 131026, "message": "Message undeliverable"}),
+])
+def test_other_failures_keep_the_media_id(graph, status, error):
+    app, sent, invalidated, responses = graph
+    responses.append(GraphResponse(status, error))
+    assert not app.send_whatsapp_audio("9198", "https://host/audio/greeting.mp3")
+    assert sent == [{"id": "media-1"}]
+    assert invalidated == []
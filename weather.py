@@ -0,0 +1,287 @@
+import json
+import math
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from local_state import SingleFlight, SqliteConnection
+from metrics import timed
+
+# WMO weather interpretation codes -> (emoji, English, Hindi)
+WEATHER_CODES = {
+    0: ("☀️", "Clear sky", "साफ़ आसमान"),
+    1: ("🌤️", "Mostly clear", "ज़्यादातर साफ़"),
+    2: ("⛅", "Partly cloudy", "आंशिक बादल"),
+    3: ("☁️", "Cloudy", "बादल"),
+    45: ("🌫️", "Fog", "कोहरा"),
+    48: ("🌫️", "Fog", "कोहरा"),
+    51: ("🌦️", "Light drizzle", "हल्की बूंदाबांदी"),
+    53: ("🌦️", "Drizzle", "बूंदाबांदी"),
+    55: ("🌦️", "Heavy drizzle", "तेज़ बूंदाबांदी"),
+    61: ("🌧️", "Light rain", "हल्की बारिश"),
+    63: ("🌧️", "Rain", "बारिश"),
+    65: ("🌧️", "Heavy rain", "तेज़ बारिश"),
+    71: ("🌨️", "Light snow", "हल्की बर्फ़बारी"),
+    73: ("🌨️", "Snow", "बर्फ़बारी"),
+    75: ("🌨️", "Heavy snow", "भारी बर्फ़बारी"),
+    80: ("🌦️", "Light showers", "हल्की बौछारें"),
+    81: ("🌧️", "Showers", "बौछारें"),
+    82: ("⛈️", "Violent showers", "तेज़ बौछारें"),
+    95: ("⛈️", "Thunderstorm", "आंधी-तूफ़ान"),
+    96: ("⛈️", "Thunderstorm with hail", "ओलों के साथ तूफ़ान"),
+    99: ("⛈️", "Thunderstorm with hail", "ओलों के साथ तूफ़ान"),
+}
+UNKNOWN_WEATHER = ("🌡️", "Weather", "मौसम")
+
+# Rain chance (%) above which the reply advises holding off spraying and harvest
+RAIN_ADVISORY_CHANCE = 60
+
+
+class OpenMeteoProvider:
+    """
+    Forecasts from an Open-Meteo compatible /v1/forecast endpoint (no API key).
+    fetch() returns the provider-neutral shape the cache stores:
+
+        {"current": {"temp_c", "humidity", "wind_kmh", "code"},
+         "days": [{"date", "code", "min_c", "max_c", "rain_mm", "rain_chance"}, ...]}
+    """
+
+    name = "open-meteo"
+
+    def __init__(self, client, path="/v1/forecast", days=3):
+        self.client = client
+        self.path = path
+        self.days = days
+
+    def fetch(self, lat, lon):
+        resp = self.client.get(self.path, endpoint="forecast", params={
+            "latitude": f"{lat:.4f}", "longitude": f"{lon:.4f}",
+            "current": "temperature_2m,relative_humidity_2m,wind_speed_10m,weather_code",
+            "daily": "weather_code,temperature_2m_max,temperature_2m_min,precipitation_sum,"
+                     "precipitation_probability_max",
+            "timezone": "Asia/Kolkata", "forecast_days": self.days,
+        })
+        resp.raise_for_status()
+        data = resp.json()
+        current = data.get("current") or {}
+        daily = data.get("daily") or {}
+
+        def column(name):
+            return daily.get(name) or [None] * len(daily.get("time", []))
+
+        days = [
+            {"date": date, "code": code, "max_c": max_c, "min_c": min_c, "rain_mm": rain_mm, "rain_chance": chance}
+            for date, code, max_c, min_c, rain_mm, chance in zip(
+                daily.get("time", []), column("weather_code"), column("temperature_2m_max"),
+                column("temperature_2m_min"), column("precipitation_sum"), column("precipitation_probability_max"))
+        ]
+        if not days:
+            raise ValueError("forecast response has no daily data")
+        return {
+            "current": {"temp_c": current.get("temperature_2m"), "humidity": current.get("relative_humidity_2m"),
+                        "wind_kmh": current.get("wind_speed_10m"), "code": current.get("weather_code")},
+            "days": days,
+        }
+
+
+PROVIDERS = {
+    OpenMeteoProvider.name: OpenMeteoProvider,
+}
+
+
+def create_provider(name, client, days=3):
+    """Build the forecast provider selected by WEATHER_PROVIDER."""
+    try:
+        provider = PROVIDERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown WEATHER_PROVIDER: {name!r}") from None
+    return provider(client, days=days)
+
+
+class ForecastCache:
+    """
+    Forecast cache keyed by grid cell rather than by place, so every farmer in
+    the same cell_deg x cell_deg square (0.25° is roughly 25 km, about a
+    district) shares one upstream fetch. The fetch is made for the centre of
+    the cell.
+
+    Entries live in an in-memory LRU backed by a SQLite file, like PriceCache.
+    They survive restarts and are shared by every worker on the host.
+    Concurrent misses for a cell wait on one fetch. An entry older than `ttl`
+    is refetched. If that fetch fails, the old forecast is still served for up
+    to `stale_ttl` more seconds rather than leaving the farmer with nothing.
+    """
+
+    def __init__(self, path, ttl=1800, stale_ttl=6 * 3600, cell_deg=0.25, max_entries=5000, table='forecasts'):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.cell_deg = cell_deg
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()   # cell -> (forecast, fetched_at)
+        self._flights = SingleFlight()
+        self._conn = SqliteConnection(path, [
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " cell_lat INTEGER NOT NULL, cell_lon INTEGER NOT NULL, cell_deg REAL NOT NULL,"
+            " value TEXT NOT NULL, fetched_at REAL NOT NULL,"
+            " PRIMARY KEY (cell_lat, cell_lon, cell_deg))"])
+        self._counters = {
+            "hits": 0, "misses": 0, "coalesced": 0, "fetches": 0, "fetch_errors": 0, "bad_responses": 0,
+            "stale_served": 0, "disk_loads": 0,
+        }
+
+    # --- SQLite layer ---
+    def _load(self, cell):
+        row = self._conn().execute(
+            f"SELECT value, fetched_at FROM {self.table} WHERE cell_lat = ? AND cell_lon = ? AND cell_deg = ?",
+            cell + (self.cell_deg,)).fetchone()
+        if row is None:
+            return None
+        self._counters["disk_loads"] += 1
+        return json.loads(row[0]), row[1]
+
+    def _store(self, cell, value, fetched_at):
+        db = self._conn()
+        db.execute(
+            f"INSERT OR REPLACE INTO {self.table} (cell_lat, cell_lon, cell_deg, value, fetched_at)"
+            " VALUES (?, ?, ?, ?, ?)", cell + (self.cell_deg, json.dumps(value), fetched_at))
+        db.commit()
+
+    def _remember(self, cell, value, fetched_at):
+        self._memory[cell] = (value, fetched_at)
+        self._memory.move_to_end(cell)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # --- Public API ---
+    def cell(self, lat, lon):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def centre(self, cell):
+        return ((cell[0] + 0.5) * self.cell_deg, (cell[1] + 0.5) * self.cell_deg)
+
+    def _cached(self, cell):
+        with self._lock:
+            entry = self._memory.get(cell)
+            if entry is None:
+                entry = self._load(cell)
+                if entry is not None:
+                    self._remember(cell, *entry)
+        return entry
+
+    def get(self, lat, lon, fetch):
+        """
+        Return (forecast, fetched_at) for the cell holding lat/lon, calling
+        fetch(cell_lat, cell_lon) on a miss; None if nothing usable is available.
+        """
+        cell = self.cell(lat, lon)
+        entry = self._cached(cell)
+        if entry is not None and time.time() - entry[1] < self.ttl:
+            self._count("hits")
+            return entry
+        self._count("misses")
+        fresh = self._fetch_once(cell, fetch)
+        if fresh is not None:
+            return fresh
+        if entry is not None and time.time() - entry[1] < self.ttl + self.stale_ttl:
+            self._count("stale_served")
+            return entry
+        return None
+
+    def _fetch_once(self, cell, fetch):
+        entry, shared = self._flights.do(cell, lambda: self._fetch(cell, fetch))
+        if shared:
+            self._count("coalesced")
+        return entry
+
+    def _fetch(self, cell, fetch):
+        """(forecast, fetched_at) from the provider, or None so get() falls back to the stale entry."""
+        self._count("fetches")
+        try:
+            with timed("weather.fetch"):
+                entry = (fetch(*self.centre(cell)), time.time())
+        except ValueError as e:   # the provider answered, but not with a forecast
+            print(f"❌ Forecast fetch for cell {cell} got a malformed response: {e}")
+            self._count("bad_responses")
+            self._count("fetch_errors")
+            return None
+        except Exception as e:
+            print(f"❌ Forecast fetch failed for cell {cell}: {e}")
+            self._count("fetch_errors")
+            return None
+        with self._lock:
+            self._remember(cell, *entry)
+            try:
+                self._store(cell, *entry)
+            except sqlite3.Error as e:   # still served from memory; refetched after a restart
+                print(f"⚠️ Could not store the forecast for cell {cell}: {e}")
+        return entry
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries_in_memory"] = len(self._memory)
+            stats["in_flight"] = len(self._flights)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+def _describe(code, lang):
+    emoji, english, hindi = WEATHER_CODES.get(code, UNKNOWN_WEATHER)
+    return emoji, hindi if lang == 'hi' else english
+
+
+def _number(value, fmt="{:.0f}"):
+    return "?" if value is None else fmt.format(value)
+
+
+def place_title(place):
+    """"Rampur (Meerut), Uttar Pradesh", or "Meerut, Uttar Pradesh" for the district town."""
+    if place.name == place.district:
+        return f"{place.name}, {place.state}"
+    return f"{place.name} ({place.district}), {place.state}"
+
+
+def format_forecast(match, forecast, fetched_at, lang='en'):
+    """WhatsApp text for a gazetteer Match and a cached forecast."""
+    hi = lang == 'hi'
+    lines = [f"🌦️ {'मौसम' if hi else 'Weather'}: {place_title(match.place)}"]
+    if match.how != "exact":
+        lines.append(f"📍 {'आपके बताए स्थान के सबसे नज़दीक' if hi else 'Closest place we know for'} "
+                     f"'{match.query.strip()}'")
+
+    current = forecast.get("current") or {}
+    if current.get("temp_c") is not None:
+        emoji, text = _describe(current.get("code"), lang)
+        lines.append(f"\n{emoji} {'अभी' if hi else 'Now'}: {_number(current['temp_c'])}°C, {text}")
+        lines.append(f"💧 {'नमी' if hi else 'Humidity'} {_number(current.get('humidity'))}%  "
+                     f"💨 {'हवा' if hi else 'Wind'} {_number(current.get('wind_kmh'))} km/h")
+
+    lines.append("")
+    rainy = []
+    for day in forecast.get("days", []):
+        emoji, text = _describe(day.get("code"), lang)
+        label = time.strftime("%a %d %b", time.strptime(day["date"], "%Y-%m-%d"))
+        lines.append(f"{emoji} {label}: {_number(day.get('min_c'))}–{_number(day.get('max_c'))}°C, {text}, "
+                     f"{'बारिश' if hi else 'rain'} {_number(day.get('rain_chance'))}% "
+                     f"({_number(day.get('rain_mm'), '{:.1f}')} mm)")
+        if (day.get("rain_chance") or 0) >= RAIN_ADVISORY_CHANCE:
+            rainy.append(label)
+    if rainy:
+        lines.append("\n☔ " + (f"{', '.join(rainy)} को बारिश की संभावना है। छिड़काव और कटाई टालें।" if hi else
+                               f"Rain likely on {', '.join(rainy)}. Hold off spraying and harvesting."))
+
+    age_minutes = int((time.time() - fetched_at) // 60)
+    if age_minutes >= 60:
+        lines.append(f"\n🕒 {'अपडेट' if hi else 'Updated'} {age_minutes // 60}h {age_minutes % 60}m "
+                     f"{'पहले' if hi else 'ago'}")
+    return "\n".join(lines)
@@ -0,0 +1,106 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+
+from local_state import SqliteConnection
+
+
+# The "messages" key inside value; every delivery also has "field": "messages", which is not followed by a colon
+_MESSAGES_KEY = re.compile(rb'"messages"\s*:')
+
+
+def has_messages(raw_body):
+    """
+    Cheap pre-check on the raw webhook body. Deliveries that only carry status
+    updates (sent/delivered/read) have no "messages" key, so they can be
+    acknowledged without parsing the JSON at all.
+    """
+    return _MESSAGES_KEY.search(raw_body) is not None
+
+
+def iter_messages(payload):
+    """Every inbound message in a delivery, across all entries and changes."""
+    for entry in payload.get("entry") or ():
+        for change in entry.get("changes") or ():
+            if change.get("field", "messages") != "messages":
+                continue
+            for message in (change.get("value") or {}).get("messages") or ():
+                yield message
+
+
+class MessageDedup:
+    """
+    Remembers WhatsApp message ids for `ttl` seconds so Meta's redeliveries are
+    dropped instead of re-running a conversation step.
+
+    Ids are kept in a bounded in-memory LRU. With a `path`, claims also go through
+    a shared SQLite table, so a retry that lands on another gunicorn worker is
+    caught too.
+    """
+
+    def __init__(self, ttl=24 * 3600, max_entries=100000, path=None, sweep_every=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.sweep_every = sweep_every
+
+        self._lock = threading.Lock()
+        self._seen = OrderedDict()   # message id -> claimed_at
+        self._conn = SqliteConnection(path, [
+            "CREATE TABLE IF NOT EXISTS seen_messages (id TEXT PRIMARY KEY, claimed_at REAL NOT NULL)",
+        ], autocommit=True) if path else None
+        self._claims_since_sweep = 0
+        self._counters = {"claimed": 0, "duplicates": 0, "released": 0}
+
+    # --- SQLite layer ---
+    def _claim_shared(self, message_id, now):
+        db = self._conn()
+        # An expired row counts as free: replace it only if it is older than the ttl
+        cur = db.execute(
+            "INSERT INTO seen_messages (id, claimed_at) VALUES (?, ?)"
+            " ON CONFLICT(id) DO UPDATE SET claimed_at = excluded.claimed_at"
+            " WHERE seen_messages.claimed_at < ?",
+            (message_id, now, now - self.ttl))
+        self._claims_since_sweep += 1
+        if self._claims_since_sweep >= self.sweep_every:
+            self._claims_since_sweep = 0
+            db.execute("DELETE FROM seen_messages WHERE claimed_at < ?", (now - self.ttl,))
+        return cur.rowcount == 1
+
+    # --- Public API ---
+    def claim(self, message_id):
+        """True the first time an id is seen within the ttl, False for a duplicate."""
+        now = time.time()
+        with self._lock:
+            claimed_at = self._seen.get(message_id)
+            if claimed_at is not None and now - claimed_at < self.ttl:
+                self._counters["duplicates"] += 1
+                return False
+            if self.path and not self._claim_shared(message_id, now):
+                self._counters["duplicates"] += 1
+                self._remember(message_id, now)
+                return False
+            self._remember(message_id, now)
+            self._counters["claimed"] += 1
+            return True
+
+    def release(self, message_id):
+        """Forget a claim (the message could not be queued, so Meta's retry must go through)."""
+        with self._lock:
+            self._seen.pop(message_id, None)
+            if self.path:
+                self._conn().execute("DELETE FROM seen_messages WHERE id = ?", (message_id,))
+            self._counters["released"] += 1
+
+    def _remember(self, message_id, now):
+        self._seen[message_id] = now
+        self._seen.move_to_end(message_id)
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["ids_in_memory"] = len(self._seen)
+        return stats